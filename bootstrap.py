@@ -1,11 +1,34 @@
 from jira_backend.read_env import read_env
 import MySQLdb
 import multiprocessing
-import subprocess
+import os
 import sys
+import time
+from contextlib import contextmanager
 
 env = read_env()
 
+# STARTUP_MODE=fast: 只在迁移/静态文件有变化时执行 migrate/collectstatic (jira.startup); full: 每次都执行
+STARTUP_MODE = env('STARTUP_MODE')
+
+timings = []
+started_at = time.perf_counter()
+
+
+@contextmanager
+def phase(name):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.append((name, (time.perf_counter() - start) * 1000))
+
+
+def report_timings():
+    parts = [f"{name}={ms:.0f}ms" for name, ms in timings]
+    parts.append(f"total={(time.perf_counter() - started_at) * 1000:.0f}ms")
+    print("startup timings:", ", ".join(parts), file=sys.stderr)
+
 
 def get_db_conn():
     db_config = env.db("DATABASE_URL")
@@ -31,29 +54,92 @@ def setup_mysql_db():
     conn.close()
 
 
+def setup_django():
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'jira_backend.settings')
+    import django
+    django.setup()
+
+
+def ensure_database():
+    """连接数据库; 数据库还不存在 (首次部署) 时先创建"""
+    from django.db import connection
+    from django.db.utils import OperationalError
+
+    try:
+        connection.ensure_connection()
+    except OperationalError:
+        if connection.vendor != 'mysql':
+            raise
+        print("database unavailable, creating databases", file=sys.stderr)
+        setup_mysql_db()
+        connection.ensure_connection()
+
+
 def setup_mysql_table():
-    cmd = f"python3 manage.py migrate --noinput"
-    print("call cmd:", cmd, file=sys.stderr)
-    subprocess.call(cmd, shell=True)
+    from jira.startup import migrate_if_needed
+
+    applied, fingerprint, pending = migrate_if_needed(force=STARTUP_MODE == 'full')
+    print(f"migrate: {'applied ' + str(pending) + ' migrations' if applied else 'skipped'} "
+          f"(graph {fingerprint[:12]})", file=sys.stderr)
 
 
 def run_collectstatic():
-    cmd = "python3 manage.py collectstatic --no-input"
-    print("call cmd:", cmd, file=sys.stderr)
-    subprocess.call(cmd, shell=True)
+    from jira.startup import collectstatic_if_needed
+
+    collected, fingerprint = collectstatic_if_needed(force=STARTUP_MODE == 'full', verbosity=0)
+    print(f"collectstatic: {'collected' if collected else 'skipped'} (static {fingerprint[:12]})", file=sys.stderr)
+
+
+def load_application():
+    """在 fork 之前加载应用 (配合 gunicorn --preload), 各个 worker 不再重复导入"""
+    from django.core.cache import caches
+    from django.db import connections
+    from jira.db.pool import close_idle_connections
+
+    if env('SERVER_MODE') == 'asgi':
+        import jira_backend.asgi  # noqa: F401
+    else:
+        import jira_backend.wsgi  # noqa: F401
+
+    # 子进程不能共用父进程中打开的连接
+    connections.close_all()
+    close_idle_connections()
+    for cache in caches.all():
+        cache.close()
 
 
 def run_server():
     worker_num = 2 * multiprocessing.cpu_count() + 1
-    cmd = f"gunicorn jira_backend.wsgi -w {worker_num} -b 0.0.0.0:8000 -k gthread --threads 8"
-    print("call cmd:", cmd, file=sys.stderr)
-    subprocess.call(cmd, shell=True)
+    if env('SERVER_MODE') == 'asgi':
+        # SSE 事件流需要以 ASGI 方式运行; 多个 worker 时 EVENTS_BROKER 需要设置为 jira.events.CacheBroker
+        args = ["jira_backend.asgi:application", "-k", "uvicorn.workers.UvicornWorker"]
+    else:
+        # 设置 DB_POOL_SIZE 开启连接池后, 每个进程的数据库连接数由它限制, 不随 --threads 增长
+        args = ["jira_backend.wsgi:application", "-k", "gthread", "--threads", "8"]
+    args = ["gunicorn", *args, "-w", str(worker_num), "-b", "0.0.0.0:8000", "--preload"]
+    print("call cmd:", " ".join(args), file=sys.stderr)
+
+    # 在当前进程中运行 gunicorn master: 已经加载的应用直接被 --preload 复用
+    from gunicorn.app.wsgiapp import run
+    sys.argv = args
+    run()
+
+
+with phase("django_setup"):
+    setup_django()
+
+with phase("database"):
+    ensure_database()
 
+with phase("migrate"):
+    setup_mysql_table()
 
-setup_mysql_db()
+with phase("collectstatic"):
+    run_collectstatic()
 
-setup_mysql_table()
+with phase("load_app"):
+    load_application()
 
-run_collectstatic()
+report_timings()
 
 run_server()
@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class JiraConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'jira'
+
+    def ready(self):
+        # 注册 token 认证缓存、条件 GET 的 change stamp、响应缓存版本号、变更事件、变更记录与搜索索引的信号
+        from . import authentication, changelog, conditional, events, response_cache, search  # noqa: F401
@@ -1,7 +1,159 @@
-from rest_framework.authentication import SessionAuthentication
+import copy
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from rest_framework.authentication import SessionAuthentication, TokenAuthentication
+from rest_framework.authtoken.models import Token
+
+GENERATION_KEY = 'jira:token:generation:{}'
 
 
 class MySessionAuthentication(SessionAuthentication):
 
     def enforce_csrf(self, request):
         return None
+
+
+class TokenCache:
+    """
+    进程内的 token -> (user, token) 缓存, 按 LRU 淘汰, 每条记录 ttl 秒后过期。
+    user_id -> token 的索引让按用户失效不需要扫描全部记录。
+    跨进程失效: 共享缓存 (django cache) 中保存每个用户的代数, 用户或 token 变化时更换;
+    记录带上写入时读到的代数, 命中时与共享缓存中的代数不同即视为失效。未配置共享缓存 (CACHE_URL) 时
+    代数只在本进程可见, 其他 worker 中的记录最迟在 ttl 后过期。
+    写入时的代数在查询数据库之后读取: 与另一个请求的修改交错时, 极少数情况下记录会保留到 ttl 过期。
+    """
+
+    def __init__(self, max_size, ttl):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._user_keys = {}
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.evictions = self.invalidations = 0
+
+    @staticmethod
+    def generation(user_id):
+        return cache.get(GENERATION_KEY.format(user_id))
+
+    @staticmethod
+    def bump_generation(user_id):
+        cache.set(GENERATION_KEY.format(user_id), uuid.uuid4().hex, None)
+
+    def get(self, key):
+        now = time.monotonic()
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None and item[0] > now:
+                self._data.move_to_end(key)
+            elif item is not None:
+                self._remove(key)
+                item = None
+        # 共享缓存的读取不占用锁
+        if item is not None and self.generation(item[1][0].pk) == item[2]:
+            with self._lock:
+                self.hits += 1
+            return item[1]
+        with self._lock:
+            if item is not None and self._data.get(key) is item:
+                self._remove(key)
+                self.invalidations += 1
+            self.misses += 1
+        return None
+
+    def set(self, key, value):
+        if self.max_size <= 0:
+            return
+        user_id = value[0].pk
+        generation = self.generation(user_id)
+        with self._lock:
+            if key in self._data:
+                self._remove(key)
+            self._data[key] = (time.monotonic() + self.ttl, value, generation)
+            self._user_keys.setdefault(user_id, set()).add(key)
+            while len(self._data) > self.max_size:
+                self._remove(next(iter(self._data)))
+                self.evictions += 1
+
+    def _remove(self, key):
+        # 调用方持有锁
+        _, (user, _), _ = self._data.pop(key)
+        keys = self._user_keys.get(user.pk)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._user_keys[user.pk]
+
+    def invalidate(self, key=None, user_id=None):
+        """只清除本进程的记录; 其他进程由 bump_generation 通知"""
+        with self._lock:
+            if key is not None and key in self._data:
+                self._remove(key)
+                self.invalidations += 1
+            if user_id is not None:
+                for cached_key in list(self._user_keys.get(user_id, ())):
+                    self._remove(cached_key)
+                    self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._user_keys.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'size': len(self._data),
+                'users': len(self._user_keys),
+                'max_size': self.max_size,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+            }
+
+
+token_cache = TokenCache(settings.TOKEN_CACHE_SIZE, settings.TOKEN_CACHE_TTL)
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """与 TokenAuthentication 相同, 但命中 token_cache 时不查询 Token/User; 认证失败的结果不缓存"""
+
+    def authenticate_credentials(self, key):
+        cached = token_cache.get(key)
+        if cached is None:
+            cached = super().authenticate_credentials(key)
+            token_cache.set(key, cached)
+        user, token = cached
+        # 每个请求拿到自己的副本, 请求内对 user 的修改不会影响缓存
+        return copy.copy(user), token
+
+
+def _bump_generation_twice(user_id):
+    """
+    立即更换一次, 其他进程不再使用已缓存的记录;
+    事务提交后再更换一次, 提交前其他进程按旧数据写入的记录也会失效。
+    """
+    token_cache.bump_generation(user_id)
+    transaction.on_commit(lambda: token_cache.bump_generation(user_id))
+
+
+@receiver((post_save, post_delete), sender=Token, dispatch_uid='token_cache_token_changed')
+def invalidate_token(sender, instance, **kwargs):
+    token_cache.invalidate(key=instance.key, user_id=instance.user_id)
+    _bump_generation_twice(instance.user_id)
+
+
+@receiver((post_save, post_delete), sender=settings.AUTH_USER_MODEL, dispatch_uid='token_cache_user_changed')
+def invalidate_user(sender, instance, **kwargs):
+    # 密码、is_active 等任何变化都需要重新读取
+    token_cache.invalidate(user_id=instance.pk)
+    _bump_generation_twice(instance.pk)
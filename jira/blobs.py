@@ -0,0 +1,127 @@
+"""
+按内容寻址的图片存储。
+
+上传的原图与生成的缩略图都以内容的 sha256 命名, 保存在 MEDIA_ROOT/blobs/ab/cd/<sha256>.<ext>:
+- 相同内容只保存一份, 重复上传同一张默认头像或截图时复用已有文件, 磁盘占用不随重复上传增长
+- 文件名随内容变化, 同一 URL 的内容永远不变, 可以返回 immutable 的长期缓存头, 浏览器不会再请求
+- 已有文件可能被多行 AppImage 引用, 删除 AppImage 时不删除文件
+
+原图的摘要由上传处理器在接收数据的同时计算 (FILE_UPLOAD_HANDLERS), 不需要再读一遍文件。
+serve_blob 返回 blobs 下的文件; 配置 BLOB_SENDFILE 后只返回 X-Accel-Redirect / X-Sendfile 头,
+由 nginx/Apache 发送文件内容, 不占用 worker。
+"""
+import hashlib
+import mimetypes
+import os
+import re
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadhandler import MemoryFileUploadHandler, TemporaryFileUploadHandler
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseNotModified
+from django.utils.http import quote_etag
+
+BLOB_DIR = 'blobs'
+BLOB_NAME_RE = re.compile(r'^blobs/[0-9a-f]{2}/[0-9a-f]{2}/(?P<digest>[0-9a-f]{64})\.[a-z0-9]+$')
+# 一年; 内容不会变化, 浏览器与代理在此期间不需要重新验证
+BLOB_MAX_AGE = 365 * 24 * 3600
+
+IMAGE_EXTENSIONS = {
+    'JPEG': 'jpg',
+    'PNG': 'png',
+    'GIF': 'gif',
+    'WEBP': 'webp',
+    'BMP': 'bmp',
+    'TIFF': 'tiff',
+}
+
+
+class HashingUploadMixin:
+    """接收上传数据的同时计算 sha256, 结果保存在生成的 UploadedFile.sha256 中"""
+
+    def new_file(self, *args, **kwargs):
+        self.sha256 = hashlib.sha256()
+        super().new_file(*args, **kwargs)
+
+    def receive_data_chunk(self, raw_data, start):
+        self.sha256.update(raw_data)
+        return super().receive_data_chunk(raw_data, start)
+
+    def file_complete(self, file_size):
+        file = super().file_complete(file_size)
+        if file is not None:
+            file.sha256 = self.sha256.hexdigest()
+        return file
+
+
+class HashingMemoryFileUploadHandler(HashingUploadMixin, MemoryFileUploadHandler):
+    pass
+
+
+class HashingTemporaryFileUploadHandler(HashingUploadMixin, TemporaryFileUploadHandler):
+    pass
+
+
+def file_sha256(file):
+    digest = getattr(file, 'sha256', None)
+    if digest:
+        return digest
+    sha256 = hashlib.sha256()
+    file.seek(0)
+    for chunk in file.chunks():
+        sha256.update(chunk)
+    file.seek(0)
+    return sha256.hexdigest()
+
+
+def blob_name(digest, ext):
+    return f'{BLOB_DIR}/{digest[:2]}/{digest[2:4]}/{digest}.{ext}'
+
+
+def save_blob(file, digest, ext, storage=default_storage):
+    """保存内容为 file 的 blob 并返回文件名; 内容相同的 blob 已存在时直接返回"""
+    name = blob_name(digest, ext)
+    if storage.exists(name):
+        return name
+    saved = storage.save(name, file)
+    if saved != name:
+        # 并发上传了相同内容, 对方先写入; 内容相同, 删掉自己这份
+        storage.delete(saved)
+    return name
+
+
+def save_blob_bytes(content, ext, storage=default_storage):
+    return save_blob(ContentFile(content), hashlib.sha256(content).hexdigest(), ext, storage)
+
+
+def _sendfile_response(name, content_type):
+    mode = settings.BLOB_SENDFILE
+    response = HttpResponse(content_type=content_type)
+    if mode == 'x-accel-redirect':
+        # nginx 中对应 internal 的 location, alias 到 MEDIA_ROOT
+        response['X-Accel-Redirect'] = settings.BLOB_ACCEL_PREFIX.rstrip('/') + '/' + name
+    else:
+        response['X-Sendfile'] = os.path.join(str(settings.MEDIA_ROOT), name)
+    return response
+
+
+def serve_blob(request, path):
+    match = BLOB_NAME_RE.match(path)
+    if match is None:
+        raise Http404
+    etag = quote_etag(match['digest'])
+
+    if etag in request.headers.get('If-None-Match', ''):
+        response = HttpResponseNotModified()
+    else:
+        if not default_storage.exists(path):
+            raise Http404
+        content_type = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+        if settings.BLOB_SENDFILE:
+            response = _sendfile_response(path, content_type)
+        else:
+            response = FileResponse(default_storage.open(path, 'rb'), content_type=content_type)
+    response['ETag'] = etag
+    response['Cache-Control'] = f'public, max-age={BLOB_MAX_AGE}, immutable'
+    return response
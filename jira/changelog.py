@@ -0,0 +1,206 @@
+"""
+增量同步用的变更记录 (ChangeLogEntry), 经 GET /changes?since=<cursor> 读取。
+
+项目、任务组、看板、任务保存或删除、批量排序 (bulk_changed) 以及收藏设置变更时各记一条, data 为变更后的完整字段,
+客户端按 id (即序号 seq) 顺序应用即可: create/update/reorder 按 objectId 覆盖 (upsert), delete 删除, reset 表示该项目有
+无法逐行记录的批量变更, 需要重新拉取该项目。删除看板/任务组时其任务的 kanbanId/epicId 由数据库置空, 不单独记录,
+客户端收到看板/任务组的 delete 时自行置空。
+
+移到其他项目的任务组、看板、任务, 在原项目下另记一条 delete, 按项目过滤的客户端也能知道它已移出。
+
+写入方式: 记录在信号处理中直接写入, 与产生它的修改在同一个事务中 (模型的 save 自带事务, 见 AtomicSaveModel;
+删除、批量写入方本身在事务中), 一起提交或回滚。
+
+游标为记录的序号 seq, 由 ChangeLogSequence 在写入的事务中分配: 计数器行的锁持有到事务提交,
+后一个事务要等前一个提交后才能分配, 序号顺序即提交顺序, 读方看到的序号总是连续的, 不会越过尚未提交的记录。
+代价是写入变更记录的事务从分配序号到提交之间互相串行。
+"""
+from django.db import IntegrityError, transaction
+from django.db.models import Exists, F, Max, OuterRef
+from django.db.models.signals import post_delete, post_save
+
+from .models import ChangeLogEntry, ChangeLogSequence, Project, ProjectUserSetting, Epic, Kanban, Task, previous_project_id
+from .signals import bulk_changed
+
+OBJECT_TYPES = {
+    Project: ChangeLogEntry.OBJECT_TYPE_PROJECT,
+    Epic: ChangeLogEntry.OBJECT_TYPE_EPIC,
+    Kanban: ChangeLogEntry.OBJECT_TYPE_KANBAN,
+    Task: ChangeLogEntry.OBJECT_TYPE_TASK,
+    ProjectUserSetting: ChangeLogEntry.OBJECT_TYPE_PROJECT_USER_SETTING,
+}
+OBJECT_TYPE_NAMES = {
+    ChangeLogEntry.OBJECT_TYPE_PROJECT: 'project',
+    ChangeLogEntry.OBJECT_TYPE_EPIC: 'epic',
+    ChangeLogEntry.OBJECT_TYPE_KANBAN: 'kanban',
+    ChangeLogEntry.OBJECT_TYPE_TASK: 'task',
+    ChangeLogEntry.OBJECT_TYPE_PROJECT_USER_SETTING: 'projectUserSetting',
+}
+ACTION_NAMES = {
+    ChangeLogEntry.ACTION_CREATE: 'create',
+    ChangeLogEntry.ACTION_UPDATE: 'update',
+    ChangeLogEntry.ACTION_DELETE: 'delete',
+    ChangeLogEntry.ACTION_REORDER: 'reorder',
+    ChangeLogEntry.ACTION_RESET: 'reset',
+}
+
+def _allocate(count):
+    """在当前事务中分配 count 个连续序号, 返回第一个; 计数器行的锁持有到事务提交"""
+    sequence = ChangeLogSequence.objects.filter(pk=1)
+    if not sequence.update(value=F('value') + count):
+        # 计数器行不存在 (如测试中清空了表): 从已有记录的最大序号开始
+        try:
+            with transaction.atomic():
+                ChangeLogSequence.objects.create(pk=1, value=ChangeLogEntry.objects.aggregate(Max('seq'))['seq__max'] or 0)
+        except IntegrityError:
+            pass
+        sequence.update(value=F('value') + count)
+    return sequence.values_list('value', flat=True).get() - count + 1
+
+
+def record(entries):
+    """把 entries (未保存的 ChangeLogEntry 列表) 写入当前事务, 不在事务中时单独一个事务"""
+    if not entries:
+        return
+    with transaction.atomic(savepoint=False):
+        first = _allocate(len(entries))
+        for i, entry in enumerate(entries):
+            entry.seq = first + i
+        ChangeLogEntry.objects.bulk_create(entries)
+
+
+def snapshot(instance):
+    """全部字段, 外键为 xxx_id"""
+    return {field.attname: field.value_from_object(instance) for field in instance._meta.concrete_fields}
+
+
+def _project_id(instance):
+    return instance.pk if isinstance(instance, Project) else instance.project_id
+
+
+def on_saved(sender, instance, created=False, raw=False, **kwargs):
+    if raw:
+        return
+    if sender is ProjectUserSetting:
+        record_pin(instance.project_id, instance.user_id, instance.is_pinned)
+        return
+    entries = []
+    previous = None if sender is Project else previous_project_id(instance)
+    if not created and previous is not None and previous != instance.project_id:
+        entries.append(_moved_out(OBJECT_TYPES[sender], instance.pk, previous))
+    entries.append(ChangeLogEntry(
+        object_type=OBJECT_TYPES[sender],
+        object_id=instance.pk,
+        project_id=_project_id(instance),
+        action=ChangeLogEntry.ACTION_CREATE if created else ChangeLogEntry.ACTION_UPDATE,
+        data=snapshot(instance),
+    ))
+    record(entries)
+
+
+def _moved_out(object_type, object_id, project_id):
+    """对象移到其他项目: 对原项目而言相当于删除"""
+    return ChangeLogEntry(object_type=object_type, object_id=object_id, project_id=project_id, action=ChangeLogEntry.ACTION_DELETE)
+
+
+def on_deleted(sender, instance, **kwargs):
+    if sender is ProjectUserSetting:
+        record_pin(instance.project_id, instance.user_id, False)
+        return
+    record([ChangeLogEntry(
+        object_type=OBJECT_TYPES[sender],
+        object_id=instance.pk,
+        project_id=_project_id(instance),
+        action=ChangeLogEntry.ACTION_DELETE,
+    )])
+
+
+def record_pin(project_id, user_id, is_pinned):
+    """收藏设置对所属用户而言以项目标识, objectId 为项目ID; upsert_project_pin 的 UPDATE 不触发信号, 由它直接调用"""
+    record([ChangeLogEntry(
+        object_type=ChangeLogEntry.OBJECT_TYPE_PROJECT_USER_SETTING,
+        object_id=project_id,
+        project_id=project_id,
+        user_id=user_id,
+        action=ChangeLogEntry.ACTION_UPDATE,
+        data={'project_id': project_id, 'is_pinned': is_pinned},
+    )])
+
+
+BULK_ACTIONS = {
+    'create': ChangeLogEntry.ACTION_CREATE,
+    'update': ChangeLogEntry.ACTION_UPDATE,
+    None: ChangeLogEntry.ACTION_REORDER,
+}
+
+
+def on_bulk_changed(sender, pks=None, project_ids=None, action=None, moved=None, **kwargs):
+    object_type = OBJECT_TYPES.get(sender)
+    if object_type is None or (pks is None and project_ids is None):
+        return
+    if pks is None:
+        record([
+            ChangeLogEntry(object_type=object_type, object_id=0, project_id=project_id, action=ChangeLogEntry.ACTION_RESET)
+            for project_id in set(project_ids)
+        ])
+        return
+    entries = [_moved_out(object_type, pk, project_id) for pk, project_id in sorted((moved or {}).items())]
+    entries.extend(
+        ChangeLogEntry(
+            object_type=object_type,
+            object_id=instance.pk,
+            project_id=_project_id(instance),
+            action=BULK_ACTIONS[action],
+            data=snapshot(instance),
+        )
+        for instance in sender.objects.filter(pk__in=pks).order_by('pk')
+    )
+    record(entries)
+
+
+def head():
+    """当前最新的游标; 客户端先取游标再拉取列表, 之后从该游标开始同步"""
+    return ChangeLogSequence.objects.filter(pk=1).values_list('value', flat=True).first() or 0
+
+
+def feed(since, user_id, project_id=None, limit=500):
+    """since 之后的记录, 返回 (记录列表, 新游标, 是否还有更多)"""
+    queryset = ChangeLogEntry.objects.filter(seq__gt=since, user_id__in=(0, user_id))
+    if project_id is not None:
+        queryset = queryset.filter(project_id=project_id)
+    rows = list(queryset.order_by('seq').values(
+        'seq', 'object_type', 'object_id', 'project_id', 'action', 'data', 'create_at',
+    )[:limit + 1])
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    results = [
+        {
+            'id': row['seq'],
+            'type': OBJECT_TYPE_NAMES[row['object_type']],
+            'action': ACTION_NAMES[row['action']],
+            'object_id': row['object_id'],
+            'project_id': row['project_id'],
+            'data': row['data'],
+            'create_at': row['create_at'],
+        }
+        for row in rows
+    ]
+    return results, rows[-1]['seq'] if rows else since, has_more
+
+
+def superseded_entries(before):
+    """before 之前、同一对象之后还有记录的条目; 客户端只需要最后一条即可得到相同的结果"""
+    later = ChangeLogEntry.objects.filter(
+        object_type=OuterRef('object_type'),
+        object_id=OuterRef('object_id'),
+        project_id=OuterRef('project_id'),
+        user_id=OuterRef('user_id'),
+        seq__gt=OuterRef('seq'),
+    )
+    return ChangeLogEntry.objects.filter(create_at__lt=before).filter(Exists(later))
+
+
+for _model in OBJECT_TYPES:
+    post_save.connect(on_saved, sender=_model, dispatch_uid=f'changelog_saved_{_model.__name__}')
+    post_delete.connect(on_deleted, sender=_model, dispatch_uid=f'changelog_deleted_{_model.__name__}')
+bulk_changed.connect(on_bulk_changed, dispatch_uid='changelog_bulk_changed')
@@ -0,0 +1,198 @@
+"""
+list/retrieve 的快速只读序列化。
+
+DRF 的 Serializer.to_representation 对每一行都要遍历字段对象、调用 get_attribute 再分派到
+to_representation, 大列表的 CPU 大多耗在这里。这里对一个已经绑定好的序列化器 (字段已按
+?fields=/?expand= 裁剪) 预先生成一个函数: 用 queryset.values() 取出需要的列, 直接拼装成与原
+序列化器相同结构、相同键顺序的 dict。写操作仍然使用原序列化器。
+"""
+from django.conf import settings
+from django.core.exceptions import FieldDoesNotExist
+from django.db import models
+from django.http import Http404
+from django.utils import timezone
+from rest_framework import ISO_8601, serializers
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+
+
+class NotCompilable(Exception):
+    """序列化器中存在无法从 values() 行直接得到的字段, 调用方应退回普通序列化器"""
+
+
+# 这些 (序列化器字段, 模型字段) 组合下数据库驱动返回的值已经与 to_representation 的结果相同
+IDENTITY_FIELDS = {
+    serializers.IntegerField: (models.IntegerField, models.BigIntegerField, models.AutoField, models.BigAutoField),
+    serializers.FloatField: (models.FloatField,),
+    serializers.BooleanField: (models.BooleanField,),
+    serializers.CharField: (models.CharField, models.TextField),
+    serializers.EmailField: (models.EmailField,),
+}
+
+
+def _target_field(model_field):
+    """外键的值为关联模型的主键"""
+    while model_field.is_relation:
+        model_field = model_field.target_field
+    return model_field
+
+
+def _file_url_converter(model_field, request):
+    """与 rest_framework.fields.FileField.to_representation 相同, 输入为 values() 取出的文件名"""
+    storage = model_field.storage
+
+    def convert(name):
+        if not name:
+            return None
+        url = storage.url(name)
+        if request is not None:
+            return request.build_absolute_uri(url)
+        return url
+
+    return convert
+
+
+def _datetime_converter(field):
+    """
+    与 DateTimeField.to_representation 相同, 但时区只解析一次, 并按值缓存结果:
+    同一请求中嵌套对象 (项目、看板、任务组) 的时间戳大量重复。
+    """
+    output_format = getattr(field, 'format', api_settings.DATETIME_FORMAT)
+    field_timezone = getattr(field, 'timezone', field.default_timezone())
+    if output_format is None or output_format.lower() != ISO_8601 or field_timezone is None:
+        return field.to_representation
+
+    cache = {}
+
+    def convert(value):
+        ret = cache.get(value)
+        if ret is not None:
+            return ret
+        if not timezone.is_aware(value):
+            ret = field.to_representation(value)
+        else:
+            ret = value.astimezone(field_timezone).isoformat()
+            if ret.endswith('+00:00'):
+                ret = ret[:-6] + 'Z'
+        cache[value] = ret
+        return ret
+
+    return convert
+
+
+def _converter(field, model_field, request):
+    if isinstance(field, serializers.DateTimeField):
+        return _datetime_converter(field)
+    if isinstance(field, serializers.FileField):
+        if not getattr(field, 'use_url', api_settings.UPLOADED_FILES_USE_URL):
+            raise NotCompilable(field.field_name)
+        return _file_url_converter(model_field, request)
+    identity_types = IDENTITY_FIELDS.get(type(field), ())
+    if isinstance(_target_field(model_field), identity_types):
+        return None
+    return field.to_representation
+
+
+def _compile(serializer, prefix, columns, annotations, nullable):
+    model = serializer.Meta.model
+    request = serializer.context.get('request')
+    method_annotations = getattr(serializer, 'compiled_method_fields', {})
+
+    pk_column = prefix + model._meta.pk.name
+    columns.setdefault(pk_column, None)
+
+    steps = []
+    for name, field in serializer.fields.items():
+        if field.write_only:
+            continue
+        if isinstance(field, serializers.ListSerializer) or '.' in (field.source or ''):
+            raise NotCompilable(name)
+
+        if isinstance(field, serializers.BaseSerializer):
+            nested = _compile(field, f'{prefix}{field.source}__', columns, annotations, nullable=True)
+            steps.append((name, None, None, nested))
+        elif isinstance(field, serializers.SerializerMethodField):
+            # 方法字段需要由视图预先标注, 如 ProjectSerializer.pin <- annotate_pin
+            annotation = method_annotations.get(name)
+            column = prefix.replace('__', '_') + annotation if annotation else None
+            if column is None or column not in annotations:
+                raise NotCompilable(name)
+            columns.setdefault(column, None)
+            steps.append((name, column, None, None))
+        else:
+            try:
+                model_field = model._meta.get_field(field.source)
+            except FieldDoesNotExist:
+                raise NotCompilable(name)
+            column = prefix + field.source
+            columns.setdefault(column, None)
+            steps.append((name, column, _converter(field, model_field, request), None))
+
+    steps = tuple(steps)
+
+    def build(row):
+        if nullable and row[pk_column] is None:
+            return None
+        ret = {}
+        for key, column, convert, nested_build in steps:
+            if nested_build is not None:
+                ret[key] = nested_build(row)
+                continue
+            value = row[column]
+            ret[key] = value if value is None or convert is None else convert(value)
+        return ret
+
+    return build
+
+
+def compile_serializer(serializer, queryset):
+    """
+    返回 (values() 需要的列, 把一行转换为输出 dict 的函数)。
+    serializer 为已绑定 context 的单个对象序列化器 (ListSerializer 请传入 .child)。
+    """
+    columns = {}
+    build = _compile(serializer, '', columns, set(queryset.query.annotations), nullable=False)
+    return list(columns), build
+
+
+class CompiledReadMixin:
+    """
+    list/retrieve 走 compile_serializer 生成的快速路径; 序列化器无法编译或关闭 FAST_READ_PATH 时
+    退回 DRF 的默认实现。
+    """
+
+    def get_compiled(self, queryset):
+        if not settings.FAST_READ_PATH:
+            return None
+        serializer = self.get_serializer()
+        try:
+            return compile_serializer(serializer, queryset)
+        except NotCompilable:
+            return None
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        compiled = self.get_compiled(queryset)
+        if compiled is None:
+            return super().list(request, *args, **kwargs)
+
+        columns, build = compiled
+        rows = queryset.values(*columns)
+        page = self.paginate_queryset(rows)
+        if page is not None:
+            return self.get_paginated_response([build(row) for row in page])
+        return Response([build(row) for row in rows.iterator(chunk_size=2000)])
+
+    def retrieve(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        compiled = self.get_compiled(queryset)
+        if compiled is None:
+            return super().retrieve(request, *args, **kwargs)
+
+        columns, build = compiled
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        row = queryset.filter(**{self.lookup_field: self.kwargs[lookup_url_kwarg]}).values(*columns).first()
+        if row is None:
+            raise Http404
+        self.check_object_permissions(request, row)
+        return Response(build(row))
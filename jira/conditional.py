@@ -0,0 +1,156 @@
+"""
+条件 GET (ETag / Last-Modified) 相关的工具函数。
+
+所有模型都有 update_at, 一个 queryset 的 (行数, 最大 update_at) 就能廉价地判断数据是否有变化:
+新增、修改会推高 update_at, 删除会改变行数。
+以下变化不会体现在 update_at 上, 由缓存中的 change stamp 补充:
+- 删除任务组/看板时任务的外键被置空 (SET_NULL 直接 UPDATE, 不更新 update_at)
+- User/AppImage 没有 update_at, 但会嵌套出现在其他接口的输出里
+"""
+import hashlib
+import uuid
+from datetime import datetime, timezone as dt_timezone
+
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.db.models import Count, Max
+from django.db.models.signals import post_delete, post_save
+from django.http import Http404
+from django.utils import timezone
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+
+from .models import AppImage, User, Project, ProjectUserSetting, Epic, Kanban, Task
+
+CHANGE_STAMP_KEY = 'jira:conditional:change_stamp'
+
+
+def queryset_validator(queryset):
+    """返回 (行数, 最大 update_at), 只需一次聚合查询"""
+    ret = queryset.order_by().aggregate(count=Count('pk'), last_modified=Max('update_at'))
+    return ret['count'], ret['last_modified']
+
+
+def make_etag(*parts):
+    digest = hashlib.md5(repr(parts).encode('utf-8')).hexdigest()
+    return quote_etag(digest)
+
+
+def set_validators(response, etag=None, last_modified=None):
+    if etag is not None:
+        response['ETag'] = etag
+    if last_modified is not None:
+        response['Last-Modified'] = http_date(last_modified.timestamp())
+    return response
+
+
+def not_modified_response(request, etag=None, last_modified=None):
+    """
+    客户端缓存仍然有效时返回 304 (或 412) 响应, 否则返回 None。
+    last_modified 为 datetime。
+    """
+    timestamp = int(last_modified.timestamp()) if last_modified is not None else None
+    response = get_conditional_response(request, etag=etag, last_modified=timestamp)
+    if response is not None:
+        set_validators(response, etag, last_modified)
+    return response
+
+
+def pin_validator(user):
+    """当前用户的项目收藏设置, 影响各接口输出中的 pin"""
+    if user is None or user.is_anonymous:
+        return ()
+    return queryset_validator(ProjectUserSetting.objects.filter(user=user))
+
+
+def change_stamp():
+    """
+    返回 (stamp, 时间)。stamp 为随机串而不是计数器, 缓存被清空后重新生成的值不会与旧值相同;
+    时间用于 Last-Modified, 缓存被清空时取当前时间。
+    """
+    value = cache.get(CHANGE_STAMP_KEY)
+    if value is None:
+        cache.add(CHANGE_STAMP_KEY, (uuid.uuid4().hex, timezone.now().timestamp()), None)
+        value = cache.get(CHANGE_STAMP_KEY)
+    stamp, timestamp = value
+    return stamp, datetime.fromtimestamp(timestamp, tz=dt_timezone.utc)
+
+
+def bump_change_stamp(**kwargs):
+    cache.set(CHANGE_STAMP_KEY, (uuid.uuid4().hex, timezone.now().timestamp()), None)
+
+
+def on_unversioned_saved(sender, update_fields=None, **kwargs):
+    # 登录时只更新 last_login, 不影响任何接口的输出
+    if update_fields is not None and set(update_fields) <= {'last_login'}:
+        return
+    bump_change_stamp()
+
+
+for _model in (User, AppImage):
+    post_save.connect(on_unversioned_saved, sender=_model, dispatch_uid=f'change_stamp_saved_{_model.__name__}')
+# 级联删除的子表会随父表一起触发父表的信号, 不需要单独注册
+for _model in (User, AppImage, Project, Epic, Kanban, Task):
+    post_delete.connect(bump_change_stamp, sender=_model, dispatch_uid=f'change_stamp_deleted_{_model.__name__}')
+
+
+class ConditionalGetMixin:
+    """
+    list/retrieve 在序列化之前先用一次聚合查询计算 ETag 与 Last-Modified, 客户端缓存有效时直接返回 304。
+    需要与 DynamicFieldsViewMixin 一起使用。
+
+    validator 包含过滤后 queryset 的 (行数, 最大 update_at)、conditional_related 中各关联对象的最大 update_at、
+    change stamp, 以及请求路径 (含 fields/expand/分页参数) 与当前用户。cursor 分页的请求不做条件 GET。
+    """
+    conditional_related = ()
+
+    def get_conditional_extra(self):
+        """子类可追加与当前用户相关的部分, 如项目收藏状态"""
+        return ()
+
+    def get_conditional_validators(self, queryset):
+        aggregates = {'count': Count('pk'), 'last_modified': Max('update_at')}
+        for name in self.conditional_related:
+            # 被 ?fields=/?expand= 去掉的关联对象不影响输出
+            if not self.field_requested(name):
+                continue
+            aggregates[f'{name}_last_modified'] = Max(f'{name}__update_at')
+        ret = queryset.order_by().aggregate(**aggregates)
+
+        stamp, stamp_time = change_stamp()
+        extra = self.get_conditional_extra()
+        last_modified = max(
+            [value for key, value in ret.items() if key != 'count' and value is not None] + [stamp_time]
+        )
+        etag = make_etag(self.request.get_full_path(), self.request.user.pk, sorted(ret.items()), stamp, extra)
+        return ret['count'], etag, last_modified
+
+    def conditional(self, queryset, handler, request, *args, **kwargs):
+        count, etag, last_modified = self.get_conditional_validators(queryset)
+        if count == 0 and self.action == 'retrieve':
+            raise Http404
+        response = not_modified_response(request, etag, last_modified)
+        if response is not None:
+            return response
+        response = handler(request, *args, **kwargs)
+        if response.status_code == 200:
+            set_validators(response, etag, last_modified)
+        return response
+
+    def list(self, request, *args, **kwargs):
+        paginator = self.paginator
+        if paginator is not None and getattr(paginator, 'use_cursor', None) and paginator.use_cursor(request, self):
+            # keyset 分页的意义就在于不对整个结果集做 COUNT/聚合
+            return super().list(request, *args, **kwargs)
+        queryset = self.filter_queryset(self.get_queryset())
+        return self.conditional(queryset, super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        try:
+            queryset = self.filter_queryset(self.get_queryset()).filter(
+                **{self.lookup_field: self.kwargs[lookup_url_kwarg]}
+            )
+        except (TypeError, ValueError, ValidationError):
+            raise Http404
+        return self.conditional(queryset, super().retrieve, request, *args, **kwargs)
@@ -0,0 +1,9 @@
+from django.db.backends.mysql import base
+
+from jira.db.pool import PooledDatabaseWrapperMixin
+
+
+class DatabaseWrapper(PooledDatabaseWrapperMixin, base.DatabaseWrapper):
+    def pool_ping(self, connection):
+        # mysqlclient 的 ping 不需要执行语句, 连接断开时抛出 OperationalError
+        connection.ping()
@@ -0,0 +1,9 @@
+from django.db.backends.sqlite3 import base
+
+from jira.db.pool import PooledDatabaseWrapperMixin
+
+
+class DatabaseWrapper(PooledDatabaseWrapperMixin, base.DatabaseWrapper):
+    def pool_enabled(self):
+        # 内存数据库的连接从不关闭 (关闭即丢失数据), 不经过连接池
+        return not self.is_in_memory_db()
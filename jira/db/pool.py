@@ -0,0 +1,310 @@
+"""
+每个进程共享的数据库连接池。
+
+Django 默认每个线程持有自己的连接, CONN_MAX_AGE 内不释放: gunicorn gthread 下连接数 = 进程数 x 线程数。
+使用 jira.db.backends.* 时, 线程在需要时从池中借出连接, 请求结束 (close_old_connections) 时归还,
+连接数上限由 DB_POOL_SIZE 决定, 与线程数无关:
+- 池满时最多等待 DB_POOL_TIMEOUT 秒, 超时抛出 PoolTimeout (OperationalError)
+- 借出时做健康检查 (MySQL 为 ping), 失效的连接关闭后重新建立; 超过 DB_POOL_RECYCLE 秒的连接也会重建
+- 归还时回滚未结束的事务, 回滚失败的连接直接关闭
+- 空闲连接后进先出, 负载下降后多余的连接自然闲置
+- try_reserve 不等待地一次预留多个连接 (jira.fanout 的 worker 线程), 预留的连接经 use_reserved 交给
+  目标线程的下一次借出, 没有用到时归还
+"""
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+from django.db.utils import OperationalError
+
+
+class PoolTimeout(OperationalError):
+    pass
+
+
+_NOT_RESERVED = object()
+
+
+class PoolEntry:
+    __slots__ = ('connection', 'created_at', 'fresh')
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.created_at = time.monotonic()
+        # 新建的连接需要执行 init_connection_state, 复用的不需要
+        self.fresh = True
+
+
+class ConnectionPool:
+    def __init__(self, max_size, timeout, recycle=None):
+        self.max_size = max_size
+        self.timeout = timeout
+        self.recycle = recycle
+        self._idle = deque()
+        self._size = 0
+        self._waiting = 0
+        self._cond = threading.Condition()
+        self._stats = {
+            'checkouts': 0,
+            'created': 0,
+            'closed': 0,
+            'waits': 0,
+            'timeouts': 0,
+            'reserve_failures': 0,
+            'health_check_failures': 0,
+            'wait_ms_total': 0.0,
+            'wait_ms_max': 0.0,
+        }
+
+    def _reserve(self):
+        """返回空闲连接, 或者占一个名额 (返回 None) 由调用方新建连接"""
+        start = time.monotonic()
+        deadline = start + self.timeout
+        with self._cond:
+            waited = False
+            try:
+                while True:
+                    if self._idle:
+                        return self._idle.pop()
+                    if self._size < self.max_size:
+                        self._size += 1
+                        return None
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._stats['timeouts'] += 1
+                        raise PoolTimeout(
+                            f'no database connection available within {self.timeout}s (pool size {self.max_size})'
+                        )
+                    if not waited:
+                        waited = True
+                        self._stats['waits'] += 1
+                    self._waiting += 1
+                    try:
+                        self._cond.wait(remaining)
+                    finally:
+                        self._waiting -= 1
+            finally:
+                if waited:
+                    wait_ms = (time.monotonic() - start) * 1000
+                    self._stats['wait_ms_total'] += wait_ms
+                    self._stats['wait_ms_max'] = max(self._stats['wait_ms_max'], wait_ms)
+
+    def checkout(self, create, ping, reserved=_NOT_RESERVED):
+        """
+        create() 新建一个原始连接, ping(connection) 在连接失效时返回 False 或抛出异常。
+        reserved 为 try_reserve 预留的一项, 传入时不再从池中获取。
+        """
+        entry = self._reserve() if reserved is _NOT_RESERVED else reserved
+        if entry is not None:
+            expired = self.recycle is not None and time.monotonic() - entry.created_at > self.recycle
+            try:
+                healthy = not expired and ping(entry.connection) is not False
+            except Exception:
+                healthy = False
+            if healthy:
+                entry.fresh = False
+                with self._cond:
+                    self._stats['checkouts'] += 1
+                return entry
+            if not expired:
+                with self._cond:
+                    self._stats['health_check_failures'] += 1
+            # 关闭失效的连接, 名额留给新建的连接
+            self._close_entry(entry)
+
+        try:
+            entry = PoolEntry(create())
+        except BaseException:
+            self._release_slot()
+            raise
+        with self._cond:
+            self._stats['created'] += 1
+            self._stats['checkouts'] += 1
+        return entry
+
+    def try_reserve(self, count):
+        """
+        不等待地预留 count 项 (空闲连接, 或新建连接的名额 None), 不够时不预留并返回 None。
+        预留的每一项交给 checkout(reserved=...) 或 release 归还。
+        """
+        with self._cond:
+            if len(self._idle) + self.max_size - self._size < count:
+                self._stats['reserve_failures'] += 1
+                return None
+            reserved = []
+            for _ in range(count):
+                if self._idle:
+                    reserved.append(self._idle.pop())
+                else:
+                    self._size += 1
+                    reserved.append(None)
+            return reserved
+
+    def release(self, reserved):
+        """归还 try_reserve 预留而没有用到的一项"""
+        if reserved is None:
+            self._release_slot()
+        else:
+            self.checkin(reserved)
+
+    def checkin(self, entry):
+        with self._cond:
+            self._idle.append(entry)
+            self._cond.notify()
+
+    def _close_entry(self, entry):
+        try:
+            entry.connection.close()
+        except Exception:
+            pass
+        with self._cond:
+            self._stats['closed'] += 1
+
+    def discard(self, entry):
+        self._close_entry(entry)
+        self._release_slot()
+
+    def _release_slot(self):
+        with self._cond:
+            self._size -= 1
+            self._cond.notify()
+
+    def close_idle(self):
+        """关闭全部空闲连接, 如 fork 之前"""
+        with self._cond:
+            idle, self._idle = list(self._idle), deque()
+        for entry in idle:
+            self.discard(entry)
+
+    def available(self):
+        """不需要等待即可借出的连接数"""
+        with self._cond:
+            return len(self._idle) + self.max_size - self._size
+
+    def stats(self):
+        with self._cond:
+            return dict(
+                self._stats,
+                max_size=self.max_size,
+                size=self._size,
+                idle=len(self._idle),
+                in_use=self._size - len(self._idle),
+                waiting=self._waiting,
+                wait_ms_total=round(self._stats['wait_ms_total'], 2),
+                wait_ms_max=round(self._stats['wait_ms_max'], 2),
+            )
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+_local = threading.local()
+
+
+def get_pool(alias, settings_dict):
+    pool = _pools.get(alias)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.get(alias)
+            if pool is None:
+                options = settings_dict.get('POOL') or {}
+                pool = _pools[alias] = ConnectionPool(
+                    max_size=options.get('MAX_SIZE', 10),
+                    timeout=options.get('TIMEOUT', 10),
+                    recycle=options.get('RECYCLE'),
+                )
+    return pool
+
+
+def reserve_connections(alias, count):
+    """
+    不等待地为其他线程预留 alias 的 count 个连接, 返回预留项的列表, 池中不够时返回 None;
+    未使用连接池 (或连接池尚未创建) 时不需要预留, 返回 [None] * count。
+    """
+    pool = _pools.get(alias)
+    if pool is None:
+        return [None] * count
+    return pool.try_reserve(count)
+
+
+@contextmanager
+def use_reserved(alias, reserved):
+    """在当前线程中, alias 下一次建立连接时使用 reserve_connections 预留的一项; 没有用到时归还"""
+    pool = _pools.get(alias)
+    if pool is None:
+        yield
+        return
+    pending = _local.__dict__.setdefault('reserved', {})
+    pending[alias] = reserved
+    try:
+        yield
+    finally:
+        if alias in pending:
+            pool.release(pending.pop(alias))
+
+
+def close_idle_connections():
+    """关闭当前进程所有连接池中的空闲连接; gunicorn --preload 在 fork 之前调用, 子进程不能共用父进程的连接"""
+    for pool in list(_pools.values()):
+        pool.close_idle()
+
+
+def pool_stats():
+    """{alias: stats}, 只包含当前进程中已经创建的连接池"""
+    return {alias: pool.stats() for alias, pool in _pools.items()}
+
+
+class PooledDatabaseWrapperMixin:
+    """
+    与某个后端的 DatabaseWrapper 组合使用。配置在 DATABASES[alias]['POOL'] 中:
+    {'MAX_SIZE': 10, 'TIMEOUT': 10, 'RECYCLE': 3600}。
+    连接在请求结束时归还, CONN_MAX_AGE 固定为 0。
+    """
+
+    def __init__(self, settings_dict, *args, **kwargs):
+        settings_dict = dict(settings_dict, CONN_MAX_AGE=0)
+        super().__init__(settings_dict, *args, **kwargs)
+        self._pool_entry = None
+
+    def pool_enabled(self):
+        return True
+
+    def pool_ping(self, connection):
+        cursor = connection.cursor()
+        try:
+            cursor.execute('SELECT 1')
+        finally:
+            cursor.close()
+
+    def get_new_connection(self, conn_params):
+        if not self.pool_enabled():
+            return super().get_new_connection(conn_params)
+        pool = get_pool(self.alias, self.settings_dict)
+        reserved = getattr(_local, 'reserved', {}).pop(self.alias, _NOT_RESERVED)
+        self._pool_entry = pool.checkout(
+            lambda: super(PooledDatabaseWrapperMixin, self).get_new_connection(conn_params), self.pool_ping,
+            reserved,
+        )
+        return self._pool_entry.connection
+
+    def init_connection_state(self):
+        if self._pool_entry is None or self._pool_entry.fresh:
+            super().init_connection_state()
+
+    def _close(self):
+        entry, self._pool_entry = self._pool_entry, None
+        if entry is None:
+            return super()._close()
+        pool = get_pool(self.alias, self.settings_dict)
+        # 事务中被关闭时 Django 仍保留 self.connection 直到事务结束, 不能交给其他线程
+        if self.in_atomic_block or (self.errors_occurred and not self.is_usable()):
+            pool.discard(entry)
+            return
+        try:
+            # 未结束的事务不能留给下一个使用者; autocommit 由下一次 connect() 重新设置
+            if not self.get_autocommit():
+                entry.connection.rollback()
+        except Exception:
+            pool.discard(entry)
+            return
+        pool.checkin(entry)
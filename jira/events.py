@@ -0,0 +1,265 @@
+"""
+看板变更事件, 供 jira.sse 推送给客户端。
+
+任务、看板、任务组、项目保存或删除时 (以及批量排序等 bulk_changed) 在事务提交后向 "project:{id}" 频道发布事件:
+    {'event': 'task.saved', 'data': {'id': 1, 'projectId': 1, 'kanbanId': 2, 'rank': 101.0, ...}}
+只包含客户端更新看板需要的字段, 键名与接口一致为 camelCase。
+移到其他项目的对象, 在原项目的频道另发一条 deleted。
+
+发布/订阅经由 settings.EVENTS_BROKER 指定的 broker:
+- LocalBroker (默认): 进程内分发, 写入与 SSE 连接需要在同一个进程 (单 worker 的 ASGI 部署)
+- CacheBroker: 经共享缓存跨进程分发, 每个进程对有订阅者的频道各运行一个轮询任务, 多 worker 部署时使用
+订阅者的队列满时丢弃积压的事件, 改为发送一条 resync, 由客户端重新拉取看板。
+"""
+import asyncio
+import json
+import logging
+import threading
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.utils.module_loading import import_string
+
+from .models import Project, Epic, Kanban, Task, previous_project_id
+from .renderers import camelize
+from .signals import bulk_changed
+
+logger = logging.getLogger(__name__)
+
+# 模型 -> (事件名前缀, 事件中包含的字段)
+EVENT_FIELDS = {
+    Task: ('task', ('id', 'project_id', 'kanban_id', 'epic_id', 'rank', 'name', 'type_id', 'processor_id', 'reporter_id')),
+    Kanban: ('kanban', ('id', 'project_id', 'rank', 'name')),
+    Epic: ('epic', ('id', 'project_id', 'name', 'start', 'end')),
+    Project: ('project', ('id', 'name', 'organization', 'person_id')),
+}
+# 一次批量变更超过该行数时不逐行发送, 改为 resync
+MAX_BULK_EVENTS = 500
+
+RESYNC = {'event': 'resync', 'data': '{}'}
+
+
+def channel_name(project_id):
+    return f'project:{project_id}'
+
+
+def make_message(event, data):
+    # 发布时就序列化为字符串, 跨进程与多个订阅者之间不需要再复制
+    return {'event': event, 'data': json.dumps(camelize(data), cls=DjangoJSONEncoder, separators=(',', ':'))}
+
+
+class Subscription:
+    """一个 SSE 连接的订阅, 只能在创建它的事件循环中使用"""
+
+    def __init__(self, broker, channel, maxsize):
+        self.broker = broker
+        self.channel = channel
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize)
+
+    def deliver(self, message):
+        try:
+            self.queue.put_nowait(message)
+        except asyncio.QueueFull:
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(RESYNC)
+
+    async def get(self):
+        return await self.queue.get()
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+
+class LocalBroker:
+    def __init__(self):
+        self._subscribers = defaultdict(set)
+        self._lock = threading.Lock()
+
+    def subscribe(self, channel):
+        subscription = Subscription(self, channel, settings.EVENTS_QUEUE_SIZE)
+        with self._lock:
+            self._subscribers[channel].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.channel)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[subscription.channel]
+
+    def subscriber_count(self, channel=None):
+        with self._lock:
+            if channel is not None:
+                return len(self._subscribers.get(channel, ()))
+            return sum(len(subscribers) for subscribers in self._subscribers.values())
+
+    def has_subscribers(self):
+        """本进程没有任何连接时发布方可以跳过事件的构建"""
+        return bool(self._subscribers)
+
+    def deliver(self, channel, message):
+        """交给本进程的订阅者, 可以在任意线程中调用"""
+        with self._lock:
+            subscribers = list(self._subscribers.get(channel, ()))
+        for subscription in subscribers:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription.deliver, message)
+            except RuntimeError:
+                # 事件循环已关闭, 连接随之结束
+                self.unsubscribe(subscription)
+
+    def publish(self, channel, message):
+        self.deliver(channel, message)
+
+
+class CacheBroker(LocalBroker):
+    """
+    发布时以递增序号写入共享缓存 (保留 retention 秒), 订阅方进程按 poll_interval 轮询新序号。
+    轮询按频道进行, 与连接数无关; 取不到的序号 (已过期或并发写入冲突) 以 resync 代替。
+    序号用 cache.incr 分配, redis/memcached 上是原子的, 文件缓存在极端并发下可能冲突, 冲突时重新分配。
+    """
+    poll_interval = 0.5
+    retention = 60
+
+    def __init__(self):
+        super().__init__()
+        self._pollers = {}
+
+    @staticmethod
+    def has_subscribers():
+        # 订阅者可能在其他进程
+        return True
+
+    @staticmethod
+    def _seq_key(channel):
+        return f'jira:events:{channel}:seq'
+
+    @staticmethod
+    def _message_key(channel, seq):
+        return f'jira:events:{channel}:{seq}'
+
+    def _next_seq(self, channel):
+        key = self._seq_key(channel)
+        cache.add(key, 0, None)
+        try:
+            return cache.incr(key)
+        except ValueError:
+            # 序号在 add 与 incr 之间被淘汰
+            cache.set(key, 1, None)
+            return 1
+
+    def publish(self, channel, message):
+        for _ in range(3):
+            if cache.add(self._message_key(channel, self._next_seq(channel)), message, self.retention):
+                return
+        logger.warning('failed to allocate event sequence for %s', channel)
+
+    def subscribe(self, channel):
+        subscription = super().subscribe(channel)
+        with self._lock:
+            poller = self._pollers.get(channel)
+            if poller is None or poller.done():
+                self._pollers[channel] = asyncio.ensure_future(self._poll(channel))
+        return subscription
+
+    async def _poll(self, channel):
+        loop = asyncio.get_running_loop()
+        last = await loop.run_in_executor(None, cache.get, self._seq_key(channel), 0)
+        try:
+            while self.subscriber_count(channel):
+                await asyncio.sleep(self.poll_interval)
+                current = await loop.run_in_executor(None, cache.get, self._seq_key(channel), 0)
+                if current < last:
+                    # 序号被清空后重新开始
+                    last = 0
+                if current == last:
+                    continue
+                keys = [self._message_key(channel, seq) for seq in range(last + 1, current + 1)]
+                messages = await loop.run_in_executor(None, cache.get_many, keys)
+                for key in keys:
+                    self.deliver(channel, messages.get(key, RESYNC))
+                last = current
+        finally:
+            with self._lock:
+                if self._pollers.get(channel) is asyncio.current_task():
+                    del self._pollers[channel]
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_broker():
+    global _broker
+    if _broker is None:
+        with _broker_lock:
+            if _broker is None:
+                _broker = import_string(settings.EVENTS_BROKER)()
+    return _broker
+
+
+def publish(project_id, event, data):
+    """事务提交后发布; 不在事务中时立即发布"""
+    channel = channel_name(project_id)
+    message = RESYNC if event == 'resync' else make_message(event, data)
+    transaction.on_commit(lambda: get_broker().publish(channel, message))
+
+
+def instance_data(instance):
+    prefix, fields = EVENT_FIELDS[type(instance)]
+    return {field: getattr(instance, field) for field in fields}
+
+
+def on_saved(sender, instance, raw=False, **kwargs):
+    if raw or not get_broker().has_subscribers():
+        return
+    prefix, fields = EVENT_FIELDS[sender]
+    project_id = instance.pk if sender is Project else instance.project_id
+    previous = None if sender is Project else previous_project_id(instance)
+    if previous is not None and previous != project_id:
+        # 移到其他项目: 原项目的订阅者按删除处理
+        publish(previous, f'{prefix}.deleted', {'id': instance.pk, 'project_id': previous})
+    publish(project_id, f'{prefix}.saved', instance_data(instance))
+
+
+def on_deleted(sender, instance, **kwargs):
+    if not get_broker().has_subscribers():
+        return
+    prefix, fields = EVENT_FIELDS[sender]
+    project_id = instance.pk if sender is Project else instance.project_id
+    publish(project_id, f'{prefix}.deleted', {'id': instance.pk, 'project_id': project_id})
+
+
+def on_bulk_changed(sender, pks=None, project_ids=None, moved=None, **kwargs):
+    if sender not in EVENT_FIELDS or not get_broker().has_subscribers():
+        return
+    if pks is None and project_ids is None:
+        return
+    if pks is None or len(pks) > MAX_BULK_EVENTS:
+        if project_ids is None:
+            project_ids = sender.objects.filter(pk__in=pks).values_list(
+                'id' if sender is Project else 'project_id', flat=True
+            ).distinct()
+        for project_id in set(project_ids):
+            publish(project_id, 'resync', None)
+        return
+    prefix, fields = EVENT_FIELDS[sender]
+    for pk, previous in (moved or {}).items():
+        publish(previous, f'{prefix}.deleted', {'id': pk, 'project_id': previous})
+    # 批量排序只改了 rank/kanban, 仍然发送完整的事件, 客户端按 saved 处理即可
+    for row in sender.objects.filter(pk__in=pks).values(*fields):
+        publish(row['id'] if sender is Project else row['project_id'], f'{prefix}.saved', row)
+
+
+for _model in EVENT_FIELDS:
+    post_save.connect(on_saved, sender=_model, dispatch_uid=f'events_saved_{_model.__name__}')
+    post_delete.connect(on_deleted, sender=_model, dispatch_uid=f'events_deleted_{_model.__name__}')
+bulk_changed.connect(on_bulk_changed, dispatch_uid='events_bulk_changed')
@@ -0,0 +1,88 @@
+"""
+组合接口 (如项目看板) 中互不依赖的查询并发执行。
+
+run(*fns) 把各个函数交给进程内共享的线程池, 按传入顺序返回结果。每个线程使用自己的数据库连接,
+线程池大小 QUERY_FANOUT_WORKERS 即每个进程因并发查询额外占用的连接数上限
+(总连接数约为 进程数 x (请求线程数 + QUERY_FANOUT_WORKERS))。
+worker 线程中的连接按 CONN_MAX_AGE 复用或关闭, 与请求线程一致。
+
+以下情况在当前线程中依次执行:
+- QUERY_FANOUT_WORKERS 为 0 或只有一个函数
+- 当前连接处于事务中: 其他连接读不到未提交的数据, 也无法保证一致的快照
+- 已经在线程池中 (避免线程池被嵌套任务占满而死锁)
+- 使用连接池 (jira.db.pool) 且无法立即为 worker 预留足够的连接: 请求线程持有连接等待 worker,
+  worker 又在等连接时会互相阻塞。预留不等待且一次完成 (reserve_connections), 并发的请求不会都以为连接够用,
+  预留的连接由各 worker 的第一次查询使用, 没有用到时归还
+
+调用方连接上的 execute_wrapper (如 QueryBudgetMiddleware 的统计) 会带到 worker 线程的连接上。
+"""
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import close_old_connections, connection, connections
+
+from .db.pool import reserve_connections, use_reserved
+
+# 线程池大小 -> 线程池; 正常运行时只有一个, 测试或压测中修改了配置时按新的大小另建
+_executors = {}
+_executors_lock = threading.Lock()
+_local = threading.local()
+
+
+def get_executor():
+    size = settings.QUERY_FANOUT_WORKERS
+    executor = _executors.get(size)
+    if executor is None:
+        with _executors_lock:
+            executor = _executors.get(size)
+            if executor is None:
+                executor = _executors[size] = ThreadPoolExecutor(max_workers=size, thread_name_prefix='query-fanout')
+    return executor
+
+
+def _call_in_worker(fn, wrappers, alias, reserved):
+    _local.in_worker = True
+    close_old_connections()
+    try:
+        with ExitStack() as stack:
+            stack.enter_context(use_reserved(alias, reserved))
+            for wrapper_alias, alias_wrappers in wrappers.items():
+                for wrapper in alias_wrappers:
+                    stack.enter_context(connections[wrapper_alias].execute_wrapper(wrapper))
+            return fn()
+    finally:
+        close_old_connections()
+        _local.in_worker = False
+
+
+def can_fanout(count):
+    return not (
+        count <= 1
+        or settings.QUERY_FANOUT_WORKERS <= 0
+        or connection.in_atomic_block
+        or getattr(_local, 'in_worker', False)
+    )
+
+
+def run(*fns):
+    """
+    并发执行 fns, 返回结果列表; 任一函数抛出异常时在当前线程中重新抛出。
+    第一个函数在当前线程中执行, 其余交给线程池, 少占用一个连接。
+    """
+    reserved = reserve_connections(connection.alias, len(fns) - 1) if can_fanout(len(fns)) else None
+    if reserved is None:
+        return [fn() for fn in fns]
+    wrappers = {alias: list(connections[alias].execute_wrappers) for alias in settings.DATABASES}
+    executor = get_executor()
+    futures = [
+        executor.submit(_call_in_worker, fn, wrappers, connection.alias, item)
+        for fn, item in zip(fns[1:], reserved)
+    ]
+    try:
+        first = fns[0]()
+    finally:
+        # 当前线程出错时也等其余任务结束再返回
+        wait(futures)
+    return [first] + [future.result() for future in futures]
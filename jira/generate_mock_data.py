@@ -1,11 +1,19 @@
+import multiprocessing
 import os
-from random import choice
+import time
+from concurrent.futures import ProcessPoolExecutor
+from random import choice, Random
 
+from django.contrib.auth.hashers import make_password
+from django.db import connections, transaction
+from django.db.models import Max
 from django.utils import timezone
 from datetime import datetime, time as dt_time, timedelta
 from dateutil import tz
 
-from .models import User, Project, Kanban, Epic, Task
+from .models import User, Project, ProjectUserSetting, Kanban, Epic, Task, RANK_STEP
+from .search import MODEL_DOC_TYPES, index_documents
+from .signals import bulk_changed
 
 tz_shanghai = tz.gettz('Asia/Shanghai')
 
@@ -90,3 +98,166 @@ def generate_mock_data():
         'epics': epics,
         'tasks': tasks,
     }
+
+
+def _max_id(model):
+    return model.objects.aggregate(Max('id'))['id__max'] or 0
+
+
+def _bulk_insert(model, rows, chunk_size):
+    """分段写入; 参与搜索的模型在同一事务中写入索引 (bulk_create 不触发信号)"""
+    for i in range(0, len(rows), chunk_size):
+        with transaction.atomic():
+            model.objects.bulk_create(rows[i:i + chunk_size], batch_size=chunk_size)
+            if model in MODEL_DOC_TYPES:
+                index_documents(rows[i:i + chunk_size])
+
+
+def _project_tasks(plan, project_index):
+    """按项目序号生成任务; 随机数由 (seed, 项目序号) 决定, 结果与进程数无关"""
+    rng = Random(f'{plan["seed"]}:{project_index}')
+    kanban_num, epic_num, task_num = plan['kanbans_per_project'], plan['epics_per_project'], plan['tasks_per_project']
+    project_id = plan['project_base'] + project_index
+    kanban_base = plan['kanban_base'] + project_index * kanban_num
+    epic_base = plan['epic_base'] + project_index * epic_num
+    task_base = plan['task_base'] + project_index * task_num
+    user_ids = plan['user_ids']
+
+    # 与 Task.save 的分配方式一致: 同一看板内从 1.0 开始, 每次加 RANK_STEP
+    next_ranks = [1.0] * kanban_num
+    tasks = []
+    for i in range(task_num):
+        kanban_index = rng.randrange(kanban_num) if kanban_num else None
+        if kanban_index is None:
+            rank = 1.0 + i * RANK_STEP
+        else:
+            rank = next_ranks[kanban_index]
+            next_ranks[kanban_index] += RANK_STEP
+        tasks.append(Task(
+            id=task_base + i,
+            name=f'任务{project_index}-{i}',
+            note='',
+            type_id=rng.choice((1, 2)),
+            project_id=project_id,
+            reporter_id=rng.choice(user_ids),
+            processor_id=rng.choice(user_ids) if rng.random() < 0.8 else None,
+            epic_id=epic_base + rng.randrange(epic_num) if epic_num and rng.random() < 0.7 else None,
+            kanban_id=None if kanban_index is None else kanban_base + kanban_index,
+            rank=rank,
+        ))
+    return tasks
+
+
+def _insert_project_tasks(plan, project_indexes):
+    tasks = []
+    for project_index in project_indexes:
+        tasks.extend(_project_tasks(plan, project_index))
+        if len(tasks) >= plan['chunk_size']:
+            _bulk_insert(Task, tasks, plan['chunk_size'])
+            tasks = []
+    _bulk_insert(Task, tasks, plan['chunk_size'])
+    return len(project_indexes) * plan['tasks_per_project']
+
+
+def _insert_project_tasks_in_worker(plan, project_indexes):
+    # fork 出的子进程不能复用父进程的数据库连接
+    connections.close_all()
+    try:
+        return _insert_project_tasks(plan, project_indexes)
+    finally:
+        connections.close_all()
+
+
+def generate_scaled_data(users=10, projects=10, kanbans_per_project=3, epics_per_project=2, tasks_per_project=100,
+                         pins=0, seed=0, chunk_size=5000, workers=1, log=None):
+    """
+    按规模批量生成数据, 用于在本地复现大数据量下的表现。
+
+    - 主键在内存中预先分配 (当前最大 id 之后的连续区间), 外键直接按 id 关联, 不需要 bulk_create 回填主键
+    - rank 按 Task.save/Kanban.save 的规则在内存中计算, 不逐行执行 MAX(rank)
+    - 密码只哈希一次, 所有用户共用 (密码为 MOCK_USER_PASS, 用户名 mock_user{序号})
+    - 项目、任务组、看板、任务随每段写入建立搜索索引 (jira.search)
+    - workers > 1 时任务按项目分给多个进程写入 (需要支持 fork 的平台; SQLite 同一时间只允许一个写入者, 收益有限)
+    """
+    log = log or (lambda message: None)
+    rng = Random(seed)
+    start = time.perf_counter()
+
+    def phase(name, count):
+        log(f'{name}: {count} rows, {time.perf_counter() - start:.1f}s')
+
+    user_base = _max_id(User) + 1
+    password = make_password(MOCK_USER_PASS)
+    user_objs = [
+        User(id=user_base + i, username=f'mock_user{user_base + i}', first_name=f'mock_user{user_base + i}',
+             phone_number=f'mock{user_base + i}', email='', password=password)
+        for i in range(users)
+    ]
+    _bulk_insert(User, user_objs, chunk_size)
+    user_ids = [user.id for user in user_objs] or list(User.objects.values_list('id', flat=True))
+    if not user_ids:
+        raise ValueError('at least one user is required')
+    phase('users', len(user_objs))
+
+    project_base = _max_id(Project) + 1
+    _bulk_insert(Project, [
+        Project(id=project_base + i, name=f'项目{i}', organization=f'部门{i % 10}', person_id=rng.choice(user_ids))
+        for i in range(projects)
+    ], chunk_size)
+    phase('projects', projects)
+
+    kanban_base = _max_id(Kanban) + 1
+    _bulk_insert(Kanban, [
+        Kanban(id=kanban_base + p * kanbans_per_project + j, name=f'看板{j}', project_id=project_base + p,
+               rank=1.0 + j * RANK_STEP)
+        for p in range(projects) for j in range(kanbans_per_project)
+    ], chunk_size)
+    phase('kanbans', projects * kanbans_per_project)
+
+    epic_base = _max_id(Epic) + 1
+    dt_lo = timezone.datetime.combine(datetime.now().date(), dt_time(0, 0), tzinfo=tz_shanghai)
+    _bulk_insert(Epic, [
+        Epic(id=epic_base + p * epics_per_project + j, name=f'任务组{j}', project_id=project_base + p,
+             start=dt_lo, end=dt_lo + timedelta(days=21))
+        for p in range(projects) for j in range(epics_per_project)
+    ], chunk_size)
+    phase('epics', projects * epics_per_project)
+
+    plan = {
+        'seed': seed, 'chunk_size': chunk_size, 'user_ids': user_ids,
+        'kanbans_per_project': kanbans_per_project, 'epics_per_project': epics_per_project,
+        'tasks_per_project': tasks_per_project,
+        'project_base': project_base, 'kanban_base': kanban_base, 'epic_base': epic_base,
+        'task_base': _max_id(Task) + 1,
+    }
+    if workers > 1 and projects > 1 and 'fork' in multiprocessing.get_all_start_methods():
+        slices = [range(projects)[i::workers] for i in range(workers)]
+        connections.close_all()
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('fork')) as executor:
+            task_count = sum(executor.map(_insert_project_tasks_in_worker, [plan] * workers, slices))
+    else:
+        task_count = _insert_project_tasks(plan, range(projects))
+    phase('tasks', task_count)
+
+    pairs = set()
+    pins = min(pins, len(user_ids) * projects)
+    while len(pairs) < pins:
+        pairs.add((rng.choice(user_ids), project_base + rng.randrange(projects)))
+    _bulk_insert(ProjectUserSetting, [
+        ProjectUserSetting(user_id=user_id, project_id=project_id, is_pinned=rng.random() < 0.5)
+        for user_id, project_id in sorted(pairs)
+    ], chunk_size)
+    phase('pins', len(pairs))
+
+    project_ids = [project_base + i for i in range(projects)]
+    for model in (Project, Kanban, Epic, Task):
+        bulk_changed.send(sender=model, pks=None, project_ids=project_ids)
+
+    return {
+        'users': len(user_objs),
+        'projects': projects,
+        'kanbans': projects * kanbans_per_project,
+        'epics': projects * epics_per_project,
+        'tasks': task_count,
+        'pins': len(pairs),
+    }
@@ -0,0 +1,142 @@
+"""
+AppImage 上传后的后台处理。
+
+上传请求只读取文件头 (得到格式与尺寸, 不解码像素) 并保存原图, 事务提交后把图片交给进程内的线程池:
+解码 -> 按 EXIF 方向旋转 -> 按 VARIANT_SIZES 缩小 -> 保存 JPEG 与 WebP (Pillow 支持时) 缩略图 (jira.blobs),
+最后写回 width/height/variants/status。内容相同的图片已处理过时直接复用其结果。
+Pillow 的解码与缩放大部分时间释放 GIL, 线程池即可并行。
+IMAGE_WORKERS 为 0 时在提交事务的线程中直接处理。
+
+进程退出或处理出错时图片停留在 STATUS_PENDING/STATUS_FAILED, 可以用 process_images 命令补做。
+"""
+import io
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import close_old_connections, transaction
+from PIL import Image, ImageOps, features
+
+from .blobs import save_blob_bytes
+from .models import AppImage
+
+logger = logging.getLogger(__name__)
+
+# 缩略图的最长边, 原图不大于该尺寸时不生成
+VARIANT_SIZES = (64, 256, 1024)
+JPEG_QUALITY = 85
+WEBP_QUALITY = 80
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def variant_formats():
+    """[(格式, 扩展名, 保存参数)]"""
+    formats = [('jpeg', 'jpg', {'quality': JPEG_QUALITY, 'optimize': True, 'progressive': True})]
+    if features.check('webp'):
+        formats.append(('webp', 'webp', {'quality': WEBP_QUALITY, 'method': 4}))
+    return formats
+
+
+def read_header(file):
+    """只解析文件头, 返回 (格式, 宽, 高); 不是图片时抛出 PIL.UnidentifiedImageError"""
+    position = file.tell()
+    try:
+        with Image.open(file) as img:
+            return img.format, img.width, img.height
+    finally:
+        file.seek(position)
+
+
+def _to_rgb(img):
+    """JPEG 不支持透明通道, 透明部分铺白色"""
+    if img.mode in ('RGBA', 'LA') or (img.mode == 'P' and 'transparency' in img.info):
+        img = img.convert('RGBA')
+        background = Image.new('RGB', img.size, (255, 255, 255))
+        background.paste(img, mask=img.getchannel('A'))
+        return background
+    return img.convert('RGB')
+
+
+def render_variants(img, storage=default_storage):
+    """img 已按 EXIF 方向旋转; 返回 variants 字段的值"""
+    variants = {}
+    formats = variant_formats()
+    for size in VARIANT_SIZES:
+        if max(img.size) <= size:
+            break
+        thumbnail = img.copy()
+        thumbnail.thumbnail((size, size), Image.LANCZOS)
+        variants[str(size)] = {}
+        for format_name, ext, options in formats:
+            out = thumbnail if format_name != 'jpeg' else _to_rgb(thumbnail)
+            if format_name == 'webp' and out.mode not in ('RGB', 'RGBA'):
+                out = out.convert('RGBA' if 'A' in out.getbands() else 'RGB')
+            buf = io.BytesIO()
+            out.save(buf, format=format_name.upper(), **options)
+            variants[str(size)][format_name] = save_blob_bytes(buf.getvalue(), ext, storage)
+    return variants
+
+
+def ready_duplicate(image):
+    """内容相同且已处理完成的另一张图片, 它的尺寸与缩略图可以直接复用"""
+    if not image.sha256:
+        return None
+    return AppImage.objects.filter(sha256=image.sha256, status=AppImage.STATUS_READY).exclude(pk=image.pk).first()
+
+
+def process_image(image_id):
+    """处理一张图片, 返回处理后的 AppImage; 图片已被删除时返回 None"""
+    image = AppImage.objects.filter(pk=image_id).first()
+    if image is None:
+        return None
+    done = ready_duplicate(image)
+    if done is not None:
+        image.width, image.height, image.variants = done.width, done.height, done.variants
+        image.status = AppImage.STATUS_READY
+        image.save(update_fields=('width', 'height', 'variants', 'status'))
+        return image
+    try:
+        with image.img.open('rb') as file, Image.open(file) as img:
+            img = ImageOps.exif_transpose(img)
+            img.load()
+            image.width, image.height = img.size
+            image.variants = render_variants(img, image.img.storage)
+        image.status = AppImage.STATUS_READY
+    except Exception:
+        logger.exception('process image failed, id=%s', image_id)
+        image.status = AppImage.STATUS_FAILED
+    # 经由 save 触发 post_save, 嵌套输出头像的接口的条件 GET/响应缓存随之失效
+    image.save(update_fields=('width', 'height', 'variants', 'status'))
+    return image
+
+
+def _process_in_worker(image_id):
+    close_old_connections()
+    try:
+        process_image(image_id)
+    finally:
+        close_old_connections()
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=settings.IMAGE_WORKERS, thread_name_prefix='image-worker')
+    return _executor
+
+
+def schedule(image_id):
+    """在当前事务提交后处理"""
+    def submit():
+        if settings.IMAGE_WORKERS > 0:
+            get_executor().submit(_process_in_worker, image_id)
+        else:
+            process_image(image_id)
+
+    transaction.on_commit(submit)
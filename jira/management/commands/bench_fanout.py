@@ -0,0 +1,65 @@
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count
+from django.test import Client, override_settings
+from django.urls import reverse
+
+from jira.models import Project
+
+
+class Command(BaseCommand):
+    help = '对比项目看板接口依次查询与并发查询 (QUERY_FANOUT_WORKERS) 的耗时, 每条 SQL 可附加固定延迟模拟网络往返'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--project-id', type=int, help='默认取任务最多的项目')
+        parser.add_argument('--latency', type=float, default=5, help='每条 SQL 附加的延迟 (毫秒)')
+        parser.add_argument('--requests', type=int, default=20)
+        parser.add_argument('--workers', type=int, nargs='+', default=[0, 2, 4])
+
+    def handle(self, *args, **options):
+        if options['project_id'] is not None:
+            project_id = options['project_id']
+        else:
+            project_id = Project.objects.annotate(task_num=Count('tasks')).order_by('-task_num').values_list('id', flat=True).first()
+        if project_id is None:
+            raise CommandError('no project found, run generate_mock_data first')
+
+        url = reverse('project-board', args=(project_id,))
+        latency = options['latency'] / 1000
+
+        def add_latency(execute, sql, params, many, context):
+            time.sleep(latency)
+            return execute(sql, params, many, context)
+
+        self.stdout.write(f'project {project_id}, {options["latency"]}ms per query')
+        self.stdout.write(f'{"workers":<10}{"mean ms":>12}{"p95 ms":>12}')
+        expected = None
+        # 延迟由 jira.fanout 带到线程池的连接上
+        with connection.execute_wrapper(add_latency):
+            for workers in options['workers']:
+                with override_settings(QUERY_FANOUT_WORKERS=workers):
+                    samples, data = self.run(url, options['requests'])
+                if expected is None:
+                    expected = data
+                elif data != expected:
+                    raise CommandError(f'response differs with {workers} workers')
+                samples.sort()
+                p95 = samples[int(len(samples) * 0.95) - 1]
+                self.stdout.write(f'{workers:<10}{statistics.mean(samples) * 1000:12.1f}{p95 * 1000:12.1f}')
+
+    @staticmethod
+    def run(url, request_num):
+        client = Client()
+        # 预热
+        resp = client.get(url)
+        if resp.status_code != 200:
+            raise CommandError(f'GET {url} returned {resp.status_code}')
+        samples = []
+        for _ in range(request_num):
+            start = time.perf_counter()
+            resp = client.get(url)
+            samples.append(time.perf_counter() - start)
+        return samples, resp.content
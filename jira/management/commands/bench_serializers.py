@@ -0,0 +1,94 @@
+import time
+
+from django.db import transaction
+from django.utils import timezone
+from django.core.management.base import BaseCommand
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from jira.compiled import compile_serializer
+from jira.models import User, Project, Kanban, Epic, Task, annotate_pin
+from jira.serializers import TaskSerializer
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = '对比 TaskSerializer 与 jira.compiled 快速路径的输出与吞吐, 数据在事务中生成并回滚'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tasks', type=int, default=10000)
+        parser.add_argument('--rounds', type=int, default=3)
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                self.run(options['tasks'], options['rounds'])
+                raise Rollback
+        except Rollback:
+            pass
+
+    def create_project(self, task_num):
+        user = User.objects.create(username='bench_serializers', phone_number='bench_serializers')
+        project = Project.objects.create(name='bench', organization='bench', person=user)
+        kanbans = [Kanban.objects.create(name=f'kanban{i}', project=project) for i in range(5)]
+        now = timezone.now()
+        epics = [Epic.objects.create(name=f'epic{i}', project=project, start=now, end=now) for i in range(5)]
+        Task.objects.bulk_create(
+            [
+                Task(
+                    name=f'task{i}', note='bench', type_id=1, project=project, reporter=user, processor=user,
+                    kanban=kanbans[i % len(kanbans)], epic=epics[i % len(epics)], rank=float(i),
+                )
+                for i in range(task_num)
+            ],
+            batch_size=1000,
+        )
+        return user, project
+
+    def run(self, task_num, rounds):
+        user, project = self.create_project(task_num)
+
+        request = Request(APIRequestFactory().get('/api/v1/tasks/'))
+        request.user = user
+        context = {'request': request, 'epic_no_project': True, 'project_no_person': True}
+
+        queryset = Task.objects.filter(project=project).select_related(
+            'reporter', 'reporter__avatar', 'processor', 'processor__avatar', 'project', 'epic', 'kanban',
+        )
+        queryset = annotate_pin(queryset, user, field_name='project_pin', project_field='project')
+
+        def run_serializer():
+            return TaskSerializer(queryset, many=True, context=context).data
+
+        def run_compiled():
+            columns, build = compile_serializer(TaskSerializer(context=context), queryset)
+            return [build(row) for row in queryset.values(*columns).iterator(chunk_size=2000)]
+
+        def run_fetch_only():
+            columns, _ = compile_serializer(TaskSerializer(context=context), queryset)
+            return list(queryset.values(*columns))
+
+        renderer = JSONRenderer()
+        results = {}
+        for name, fn in (('fetch', run_fetch_only), ('serializer', run_serializer), ('compiled', run_compiled)):
+            best = None
+            for _ in range(rounds):
+                start = time.perf_counter()
+                data = fn()
+                elapsed = time.perf_counter() - start
+                best = elapsed if best is None else min(best, elapsed)
+            results[name] = (best, renderer.render(data))
+            self.stdout.write(f'{name:<10} {best * 1000:8.1f} ms  {task_num / best:10.0f} rows/s')
+        self.stdout.write('(fetch: values() only, the database share of both paths)')
+
+        fetch, serializer, compiled = results['fetch'][0], results['serializer'][0], results['compiled'][0]
+        same = results['serializer'][1] == results['compiled'][1]
+        self.stdout.write(
+            f'speedup: {serializer / compiled:.1f}x end-to-end, '
+            f'{(serializer - fetch) / max(compiled - fetch, 1e-9):.1f}x excluding the database, '
+            f'identical output: {same}'
+        )
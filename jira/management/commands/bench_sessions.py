@@ -0,0 +1,77 @@
+import statistics
+import time
+from importlib import import_module
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.test import Client, override_settings
+from django.urls import reverse
+
+from jira.models import User
+from jira.sessions import write_behind_queue
+
+BENCH_USERNAME = 'bench_sessions'
+BENCH_PASSWORD = 'bench_sessions'
+
+
+class Command(BaseCommand):
+    help = '对比各 SESSION_MODE 下携带会话 cookie 的请求耗时 (GET /users/about-me/) 与修改会话的耗时'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=500)
+        parser.add_argument('--modes', nargs='+', default=list(settings.SESSION_ENGINES), choices=list(settings.SESSION_ENGINES))
+
+    def handle(self, *args, **options):
+        user, _ = User.objects.get_or_create(username=BENCH_USERNAME, defaults={'phone_number': BENCH_USERNAME})
+        user.set_password(BENCH_PASSWORD)
+        user.save()
+
+        try:
+            self.stdout.write(f'{"mode":<16}{"read mean":>12}{"read p95":>12}{"write mean":>12}{"write p95":>12}')
+            for mode in options['modes']:
+                with override_settings(SESSION_ENGINE=settings.SESSION_ENGINES[mode]):
+                    read, write = self.run(options['requests'])
+                    write_behind_queue.flush(timeout=30)
+                self.stdout.write(f'{mode:<16}{self.fmt(read)}{self.fmt(write)}')
+            self.stdout.write('(read: ms per request through the full middleware stack via the test client; write: ms per session load + save)')
+        finally:
+            user.delete()
+
+    @staticmethod
+    def fmt(samples):
+        samples = sorted(samples)
+        p95 = samples[int(len(samples) * 0.95) - 1]
+        return f'{statistics.mean(samples) * 1000:12.3f}{p95 * 1000:12.3f}'
+
+    def run(self, request_num):
+        client = Client()
+        if not client.login(username=BENCH_USERNAME, password=BENCH_PASSWORD):
+            raise RuntimeError('login failed')
+        url = reverse('user-about-me')
+
+        def timed(fn):
+            samples = []
+            for i in range(request_num):
+                start = time.perf_counter()
+                fn(i)
+                samples.append(time.perf_counter() - start)
+            return samples
+
+        def read(i):
+            resp = client.get(url)
+            assert resp.status_code == 200, resp.status_code
+
+        engine = import_module(settings.SESSION_ENGINE)
+        session_key = client.cookies[settings.SESSION_COOKIE_NAME].value
+
+        def write(i):
+            # 视图修改会话后 SessionMiddleware 执行的操作: 加载并保存
+            session = engine.SessionStore(session_key)
+            session['bench_counter'] = i
+            session.save()
+
+        timed(read)  # 预热
+        read_samples = timed(read)
+        write_samples = timed(write)
+        client.logout()
+        return read_samples, write_samples
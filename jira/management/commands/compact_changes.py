@@ -0,0 +1,26 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from jira.changelog import superseded_entries
+from jira.models import ChangeLogEntry
+
+
+class Command(BaseCommand):
+    help = '合并变更记录: 删除同一对象之后还有新记录的旧条目, 客户端从任意游标同步的结果不变'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hours', type=float, default=24, help='只合并早于该时长的记录')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        before = timezone.now() - timedelta(hours=options['hours'])
+        deleted = 0
+        while True:
+            # MySQL 不能在 DELETE 的子查询中引用同一张表, 先取出主键
+            ids = list(superseded_entries(before).order_by('seq').values_list('id', flat=True)[:options['batch_size']])
+            if not ids:
+                break
+            deleted += ChangeLogEntry.objects.filter(id__in=ids).delete()[0]
+        self.stdout.write(self.style.SUCCESS(f'deleted={deleted}, remaining={ChangeLogEntry.objects.count()}'))
@@ -1,8 +1,41 @@
 from django.core.management.base import BaseCommand
-from jira.generate_mock_data import generate_mock_data, clear_data
+from jira.generate_mock_data import generate_mock_data, generate_scaled_data, clear_data
 
 
 class Command(BaseCommand):
+    help = '生成测试数据; 不带规模参数时清空后生成一个示例项目, 否则按参数批量生成'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, help='新建用户数')
+        parser.add_argument('--projects', type=int, help='新建项目数')
+        parser.add_argument('--kanbans-per-project', type=int, default=3)
+        parser.add_argument('--epics-per-project', type=int, default=2)
+        parser.add_argument('--tasks-per-project', type=int, default=100)
+        parser.add_argument('--pins', type=int, default=0, help='随机生成的项目收藏设置条数')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--chunk-size', type=int, default=5000, help='每个事务写入的行数')
+        parser.add_argument('--workers', type=int, default=1, help='写入任务的进程数')
+        parser.add_argument('--clear', action='store_true', help='批量生成前清空已有数据')
+
     def handle(self, *args, **options):
-        clear_data()
-        generate_mock_data()
+        if options['users'] is None and options['projects'] is None:
+            clear_data()
+            generate_mock_data()
+            return
+
+        if options['clear']:
+            clear_data()
+
+        counts = generate_scaled_data(
+            users=options['users'] or 0,
+            projects=options['projects'] or 0,
+            kanbans_per_project=options['kanbans_per_project'],
+            epics_per_project=options['epics_per_project'],
+            tasks_per_project=options['tasks_per_project'],
+            pins=options['pins'],
+            seed=options['seed'],
+            chunk_size=options['chunk_size'],
+            workers=options['workers'],
+            log=self.stdout.write,
+        )
+        self.stdout.write(self.style.SUCCESS(', '.join(f'{name}={count}' for name, count in counts.items())))
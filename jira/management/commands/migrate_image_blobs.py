@@ -0,0 +1,38 @@
+import os
+
+from django.core.management.base import BaseCommand
+from PIL import UnidentifiedImageError
+
+from jira import blobs
+from jira.images import read_header
+from jira.models import AppImage
+
+
+class Command(BaseCommand):
+    help = '把按内容寻址存储之前上传的图片移到 blobs/ 下, 内容相同的图片共用一个文件'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--delete-originals', action='store_true', help='迁移后删除原来的文件')
+
+    def handle(self, *args, **options):
+        migrated, missing = 0, 0
+        for image in AppImage.objects.filter(sha256='').order_by('create_at').iterator():
+            storage = image.img.storage
+            old_name = image.img.name
+            if not old_name or not storage.exists(old_name):
+                missing += 1
+                continue
+            with storage.open(old_name, 'rb') as file:
+                try:
+                    ext = blobs.IMAGE_EXTENSIONS.get(read_header(file)[0])
+                except (UnidentifiedImageError, OSError):
+                    ext = None
+                ext = ext or os.path.splitext(old_name)[1].lstrip('.').lower() or 'bin'
+                digest = blobs.file_sha256(file)
+                image.img.name = blobs.save_blob(file, digest, ext, storage)
+            image.sha256 = digest
+            image.save(update_fields=('img', 'sha256'))
+            if options['delete_originals'] and old_name != image.img.name:
+                storage.delete(old_name)
+            migrated += 1
+        self.stdout.write(self.style.SUCCESS(f'migrated={migrated}, missing={missing}'))
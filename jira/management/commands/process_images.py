@@ -0,0 +1,42 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from jira.images import process_image
+from jira.models import AppImage
+
+
+def _process(image_id):
+    close_old_connections()
+    try:
+        image = process_image(image_id)
+        return image.status if image is not None else None
+    finally:
+        close_old_connections()
+
+
+class Command(BaseCommand):
+    help = '处理停留在处理中的图片 (如进程重启时未处理完的上传), 可选重试失败的图片或重新生成全部缩略图'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--failed', action='store_true', help='同时重试处理失败的图片')
+        parser.add_argument('--all', action='store_true', help='重新处理全部图片, 用于补齐上线前上传的图片的缩略图')
+        parser.add_argument('--workers', type=int, default=4)
+
+    def handle(self, *args, **options):
+        queryset = AppImage.objects.all()
+        if not options['all']:
+            statuses = [AppImage.STATUS_PENDING]
+            if options['failed']:
+                statuses.append(AppImage.STATUS_FAILED)
+            queryset = queryset.filter(status__in=statuses)
+        image_ids = list(queryset.order_by('create_at').values_list('id', flat=True))
+
+        with ThreadPoolExecutor(max_workers=max(options['workers'], 1)) as executor:
+            statuses = list(executor.map(_process, image_ids))
+
+        self.stdout.write(self.style.SUCCESS(
+            f'processed={len(image_ids)}, ready={statuses.count(AppImage.STATUS_READY)}, '
+            f'failed={statuses.count(AppImage.STATUS_FAILED)}'
+        ))
@@ -0,0 +1,47 @@
+from django.core.management.base import BaseCommand
+
+from jira.models import Kanban, Task
+from jira.ranking import MIN_RANK_GAP, rank_gap_health, rebalance_kanban_tasks, rebalance_project_kanbans
+
+
+class Command(BaseCommand):
+    help = '检查各看板内任务、各项目内看板的 rank 间隔, 可选择批量重新编号'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--min-gap', type=float, default=MIN_RANK_GAP, help='小于该间隔视为需要重新编号')
+        parser.add_argument('--compact', action='store_true', help='对间隔不足的看板/项目重新编号')
+        parser.add_argument('--all', action='store_true', help='与 --compact 一起使用, 对所有看板/项目重新编号')
+
+    def handle(self, *args, **options):
+        min_gap = options['min_gap']
+        targets = (
+            ('task', Task, 'kanban_id', rebalance_kanban_tasks),
+            ('kanban', Kanban, 'project_id', rebalance_project_kanbans),
+        )
+
+        for label, model, scope_field, rebalance_fn in targets:
+            health = rank_gap_health(model, scope_field, min_gap=min_gap)
+            self.stdout.write(
+                f'{label}: rows={health["rows"]}, scopes={health["scopes"]}, narrow_scopes={len(health["narrow"])}'
+            )
+            for item in health['narrow']:
+                self.stdout.write(
+                    f'  {scope_field}={item["scope_id"]} count={item["count"]} '
+                    f'min_gap={item["min_gap"]:.3g} collisions={item["collisions"]}'
+                )
+
+            if not options['compact']:
+                continue
+
+            if options['all']:
+                scope_ids = list(
+                    model.objects.exclude(**{f'{scope_field}__isnull': True})
+                    .order_by(scope_field).values_list(scope_field, flat=True).distinct()
+                )
+            else:
+                scope_ids = [item['scope_id'] for item in health['narrow']]
+
+            rows = 0
+            for scope_id in scope_ids:
+                rows += rebalance_fn(scope_id)
+            self.stdout.write(self.style.SUCCESS(f'{label}: compacted {len(scope_ids)} scopes, {rows} rows'))
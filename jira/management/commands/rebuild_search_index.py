@@ -0,0 +1,19 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from jira.search import DOC_TYPE_NAMES, rebuild_index
+
+
+class Command(BaseCommand):
+    help = '批量重建项目、任务组、看板、任务的搜索索引 (bulk_create 等不触发信号的写入之后需要执行)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--types', nargs='+', choices=list(DOC_TYPE_NAMES), default=list(DOC_TYPE_NAMES))
+        parser.add_argument('--chunk-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        for name in options['types']:
+            start = time.perf_counter()
+            count = rebuild_index(DOC_TYPE_NAMES[name], chunk_size=options['chunk_size'])
+            self.stdout.write(f'{name}: {count} documents, {time.perf_counter() - start:.1f}s')
@@ -0,0 +1,106 @@
+"""
+按请求统计数据库查询。
+
+QueryBudgetMiddleware 通过 connection.execute_wrapper 记录每个请求的查询次数、SQL 总耗时,
+并把 SQL 归一化为指纹 (去掉字面量与 IN 列表长度) 统计重复次数, 用于发现 N+1 查询。
+DEBUG 时写入响应头 X-DB-*, 否则在 jira.querybudget 日志中输出一行 JSON。
+"""
+import json
+import logging
+import re
+import threading
+import time
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger('jira.querybudget')
+
+# 同一指纹出现次数达到该值视为疑似 N+1
+DUPLICATE_THRESHOLD = 3
+
+_STRING_RE = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_RE = re.compile(r'\b\d+(?:\.\d+)?\b')
+_IN_LIST_RE = re.compile(r'\bIN\s*\((?:\s*(?:%s|\?|NULL)\s*,?)+\)', re.IGNORECASE)
+_SPACE_RE = re.compile(r'\s+')
+
+
+def fingerprint(sql):
+    """WHERE id = 1 与 WHERE id = 2 得到相同指纹; 参数化 SQL 的占位符保持原样"""
+    sql = _STRING_RE.sub('?', sql)
+    sql = _NUMBER_RE.sub('?', sql)
+    sql = _IN_LIST_RE.sub('IN (...)', sql)
+    return _SPACE_RE.sub(' ', sql).strip()
+
+
+class QueryStats:
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.fingerprints = Counter()
+        # jira.fanout 会把统计带到线程池的连接上
+        self._lock = threading.Lock()
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - start
+            key = fingerprint(sql)
+            with self._lock:
+                self.duration += elapsed
+                self.count += 1
+                self.fingerprints[key] += 1
+
+    def duplicates(self, threshold=DUPLICATE_THRESHOLD):
+        """[(指纹, 次数)], 按次数从多到少"""
+        return [(sql, n) for sql, n in self.fingerprints.most_common() if n >= threshold]
+
+    def as_dict(self):
+        duplicates = self.duplicates()
+        return {
+            'queries': self.count,
+            'db_ms': round(self.duration * 1000, 2),
+            'duplicate_queries': sum(n for _, n in duplicates),
+            'duplicates': [{'sql': sql[:200], 'count': n} for sql, n in duplicates[:5]],
+        }
+
+
+@contextmanager
+def capture_queries(aliases=None):
+    """在 with 块内统计所有数据库连接上执行的查询"""
+    stats = QueryStats()
+    with ExitStack() as stack:
+        for alias in aliases or settings.DATABASES:
+            stack.enter_context(connections[alias].execute_wrapper(stats))
+        yield stats
+
+
+class QueryBudgetMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        start = time.perf_counter()
+        with capture_queries() as stats:
+            response = self.get_response(request)
+        elapsed = time.perf_counter() - start
+
+        summary = stats.as_dict()
+        if settings.DEBUG:
+            response['X-DB-Query-Count'] = str(summary['queries'])
+            response['X-DB-Query-Time-Ms'] = str(summary['db_ms'])
+            response['X-DB-Duplicate-Queries'] = str(summary['duplicate_queries'])
+        else:
+            summary.update({
+                'method': request.method,
+                'path': request.path,
+                'status': response.status_code,
+                'total_ms': round(elapsed * 1000, 2),
+            })
+            level = logging.WARNING if summary['duplicate_queries'] else logging.INFO
+            logger.log(level, json.dumps(summary, ensure_ascii=False))
+        return response
@@ -0,0 +1,26 @@
+# Generated by Django 3.2.12 on 2026-10-18 12:41
+
+from django.db import migrations, models
+from django.db.models import Max
+
+
+def remove_duplicated_settings(apps, schema_editor):
+    # 加唯一约束之前, 每个 (user, project) 只保留最新的一条
+    ProjectUserSetting = apps.get_model('jira', 'ProjectUserSetting')
+    keep_ids = ProjectUserSetting.objects.values('user_id', 'project_id').annotate(keep_id=Max('id')).values('keep_id')
+    ProjectUserSetting.objects.exclude(id__in=list(keep_ids)).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('jira', '0005_task_reporter'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicated_settings, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='projectusersetting',
+            constraint=models.UniqueConstraint(fields=('user', 'project'), name='uniq_project_user_setting'),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 3.2.12 on 2026-10-18 12:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('jira', '0006_project_user_setting_unique'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='kanban',
+            index=models.Index(fields=['project', 'rank'], name='jira_kanban_project_rank_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(fields=['kanban', 'rank'], name='jira_task_kanban_rank_idx'),
+        ),
+    ]
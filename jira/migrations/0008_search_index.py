@@ -0,0 +1,36 @@
+# Generated by Django 3.2.12 on 2026-10-18 13:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('jira', '0007_rank_scope_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchIndexEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('gram', models.CharField(max_length=8, verbose_name='词元')),
+                ('doc_type', models.PositiveSmallIntegerField(choices=[(1, '项目'), (2, '任务组'), (3, '看板'), (4, '任务')], verbose_name='文档类型')),
+                ('doc_id', models.BigIntegerField(verbose_name='文档ID')),
+                ('project_id', models.BigIntegerField(verbose_name='项目ID')),
+                ('in_name', models.BooleanField(verbose_name='是否出现在名称中')),
+            ],
+            options={
+                'verbose_name': '搜索索引',
+                'verbose_name_plural': '搜索索引',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='searchindexentry',
+            index=models.Index(fields=['gram', 'doc_type', 'project_id', 'doc_id'], name='jira_search_gram_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='searchindexentry',
+            index=models.Index(fields=['doc_type', 'doc_id'], name='jira_search_doc_idx'),
+        ),
+    ]
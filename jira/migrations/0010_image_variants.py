@@ -0,0 +1,28 @@
+# Generated by Django 3.2.12 on 2026-10-18 13:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('jira', '0009_filter_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='appimage',
+            name='status',
+            field=models.PositiveSmallIntegerField(choices=[(0, '处理中'), (1, '已完成'), (2, '处理失败')], default=1, verbose_name='处理状态'),
+        ),
+        migrations.AddField(
+            model_name='appimage',
+            name='variants',
+            field=models.JSONField(blank=True, default=dict, verbose_name='缩略图'),
+        ),
+        migrations.AlterField(
+            model_name='appimage',
+            name='img',
+            field=models.ImageField(upload_to=''),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.2.12 on 2026-10-18 13:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('jira', '0010_image_variants'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='appimage',
+            name='sha256',
+            field=models.CharField(blank=True, db_index=True, default='', max_length=64, verbose_name='内容摘要'),
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 3.2.12 on 2026-10-18 13:28
+
+import django.core.serializers.json
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('jira', '0011_image_sha256'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChangeLogEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('object_type', models.PositiveSmallIntegerField(choices=[(1, '项目'), (2, '任务组'), (3, '看板'), (4, '任务'), (5, '项目用户设置')], verbose_name='对象类型')),
+                ('object_id', models.BigIntegerField(verbose_name='对象ID')),
+                ('project_id', models.BigIntegerField(verbose_name='项目ID')),
+                ('user_id', models.BigIntegerField(default=0, verbose_name='用户ID')),
+                ('action', models.PositiveSmallIntegerField(choices=[(1, '新建'), (2, '修改'), (3, '删除'), (4, '排序'), (5, '批量变更, 需要重新拉取')], verbose_name='变更类型')),
+                ('data', models.JSONField(blank=True, encoder=django.core.serializers.json.DjangoJSONEncoder, null=True, verbose_name='变更后的字段')),
+                ('create_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name': '变更记录',
+                'verbose_name_plural': '变更记录',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='changelogentry',
+            index=models.Index(fields=['project_id', 'id'], name='jira_change_project_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='changelogentry',
+            index=models.Index(fields=['object_type', 'object_id'], name='jira_change_object_idx'),
+        ),
+    ]
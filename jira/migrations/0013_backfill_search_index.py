@@ -0,0 +1,75 @@
+# Generated by Django 3.2.12 on 2026-10-18 22:00
+
+import re
+import unicodedata
+
+from django.db import migrations
+
+# 以下为 jira.search 在本迁移时的分词规则与文档定义的副本: 迁移只能依赖历史模型,
+# 之后修改 jira.search 或相关模型时不影响本迁移
+_RUN_RE = re.compile(r'[^\W_]+')
+CHUNK_SIZE = 5000
+
+# 文档类型 -> (模型名, 名称字段, 其余参与索引的字段, 所属项目字段)
+DOCUMENTS = {
+    1: ('Project', 'name', ('organization',), 'id'),
+    2: ('Epic', 'name', (), 'project_id'),
+    3: ('Kanban', 'name', (), 'project_id'),
+    4: ('Task', 'name', ('note',), 'project_id'),
+}
+
+
+def normalize(text):
+    decomposed = unicodedata.normalize('NFKD', text or '')
+    stripped = ''.join(char for char in decomposed if not unicodedata.combining(char))
+    return unicodedata.normalize('NFKC', stripped).lower()
+
+
+def text_grams(text):
+    grams = set()
+    for run in _RUN_RE.findall(normalize(text)):
+        if len(run) == 1:
+            grams.add(run)
+        else:
+            grams.update(run[i:i + 2] for i in range(len(run) - 1))
+    return grams
+
+
+def backfill_search_index(apps, schema_editor):
+    # 0008 之前已有的数据没有索引, 名称/说明的过滤与搜索查不到; 按文档类型全部重建一次
+    SearchIndexEntry = apps.get_model('jira', 'SearchIndexEntry')
+    for doc_type, (model_name, name_field, other_fields, project_field) in DOCUMENTS.items():
+        model = apps.get_model('jira', model_name)
+        columns = list(dict.fromkeys(('id', project_field, name_field) + other_fields))
+        SearchIndexEntry.objects.filter(doc_type=doc_type).delete()
+        last_id = 0
+        while True:
+            rows = list(model.objects.filter(id__gt=last_id).order_by('id').values(*columns)[:CHUNK_SIZE])
+            if not rows:
+                break
+            entries = []
+            for row in rows:
+                name_grams = text_grams(row[name_field])
+                other_grams = set()
+                for field in other_fields:
+                    other_grams |= text_grams(row[field])
+                entries.extend(
+                    SearchIndexEntry(
+                        gram=gram, doc_type=doc_type, doc_id=row['id'], project_id=row[project_field],
+                        in_name=gram in name_grams,
+                    )
+                    for gram in sorted(name_grams | other_grams)
+                )
+            SearchIndexEntry.objects.bulk_create(entries, batch_size=CHUNK_SIZE)
+            last_id = rows[-1]['id']
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('jira', '0012_change_log'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_search_index, migrations.RunPython.noop),
+    ]
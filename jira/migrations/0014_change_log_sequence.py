@@ -0,0 +1,52 @@
+# Generated by Django 3.2.12 on 2026-10-19 10:00
+
+from django.db import migrations, models
+from django.db.models import F, Max
+
+
+def backfill_seq(apps, schema_editor):
+    # 已有记录的序号沿用主键, 客户端手中的游标仍然有效
+    ChangeLogEntry = apps.get_model('jira', 'ChangeLogEntry')
+    ChangeLogSequence = apps.get_model('jira', 'ChangeLogSequence')
+    ChangeLogEntry.objects.update(seq=F('id'))
+    ChangeLogSequence.objects.create(pk=1, value=ChangeLogEntry.objects.aggregate(Max('id'))['id__max'] or 0)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('jira', '0013_backfill_search_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChangeLogSequence',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('value', models.BigIntegerField(default=0, verbose_name='已分配的最大序号')),
+            ],
+            options={
+                'verbose_name': '变更记录序号',
+                'verbose_name_plural': '变更记录序号',
+            },
+        ),
+        migrations.AddField(
+            model_name='changelogentry',
+            name='seq',
+            field=models.BigIntegerField(null=True, verbose_name='序号'),
+        ),
+        migrations.RunPython(backfill_seq, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='changelogentry',
+            name='seq',
+            field=models.BigIntegerField(unique=True, verbose_name='序号'),
+        ),
+        migrations.RemoveIndex(
+            model_name='changelogentry',
+            name='jira_change_project_idx',
+        ),
+        migrations.AddIndex(
+            model_name='changelogentry',
+            index=models.Index(fields=['project_id', 'seq'], name='jira_change_project_seq_idx'),
+        ),
+    ]
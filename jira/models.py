@@ -1,17 +1,80 @@
 import uuid
 
 from django.contrib.auth.models import AbstractUser
-from django.db import models
-from django.db.models import Max
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import models, router, transaction
+from django.db.models import Case, Max, OuterRef, Subquery, Value, When, BooleanField, IntegerField
+from django.db.models.signals import post_init, pre_save
+
+
+RANK_STEP = 100.0
+
+
+def next_rank(queryset):
+    """
+    取 queryset 范围内 (同一看板/同一项目) 的最大 rank 再加 RANK_STEP,
+    queryset 的过滤条件需与 (kanban_id, rank)/(project_id, rank) 索引前缀一致, MAX 只需一次索引查找。
+    """
+    rank_max = queryset.aggregate(Max('rank'))['rank__max']
+    if rank_max is None:
+        return 1.0
+    return rank_max + RANK_STEP
+
+
+def lock_rows(queryset):
+    """SELECT ... FOR UPDATE 按主键顺序锁住父记录, 串行化同一范围内的 rank 分配, 返回锁住的主键"""
+    return list(queryset.select_for_update().order_by('pk').values_list('pk', flat=True))
+
+
+def lock_task_scopes(kanban_ids=(), project_ids=()):
+    """
+    锁住任务所在的范围: 有看板时为看板, 没有看板时为项目 (先项目后看板, 各处加锁顺序一致)。
+    新建任务与把任务移入其他看板/项目之前都要锁住目标范围, 持锁期间不会有其他事务往该范围加入任务。
+    """
+    if project_ids:
+        lock_rows(Project.objects.filter(pk__in=project_ids))
+    if kanban_ids:
+        lock_rows(Kanban.objects.filter(pk__in=kanban_ids))
+
+
+class AtomicSaveModel(models.Model):
+    """保存与 post_save 信号中的写入 (jira.changelog 的变更记录等) 在同一个事务中, 已在事务中时不再建立保存点"""
+
+    def save(self, force_insert=False, force_update=False, using=None, update_fields=None):
+        using = using or router.db_for_write(type(self), instance=self)
+        with transaction.atomic(using=using, savepoint=False):
+            super().save(force_insert, force_update, using, update_fields)
+
+    class Meta:
+        abstract = True
 
 
 class AppImage(models.Model):
+    """
+    上传请求中只保存原图; 解码、按 EXIF 方向旋转与生成缩略图由 jira.images 在后台完成,
+    完成前 status 为 STATUS_PENDING, width/height 为文件头中读到的尺寸。
+    原图与缩略图按内容寻址保存 (jira.blobs)。
+    """
+    STATUS_PENDING = 0
+    STATUS_READY = 1
+    STATUS_FAILED = 2
+    STATUS_CHOICES = (
+        (STATUS_PENDING, '处理中'),
+        (STATUS_READY, '已完成'),
+        (STATUS_FAILED, '处理失败'),
+    )
+
     id = models.UUIDField(primary_key=True, default=uuid.uuid1, editable=False)
 
     width = models.IntegerField(null=True, blank=True)
     height = models.IntegerField(null=True, blank=True)
-    img = models.ImageField(width_field='width', height_field='height')
+    img = models.ImageField()
     desc = models.CharField(max_length=191, blank=True, null=False, verbose_name="图片备注")
+    status = models.PositiveSmallIntegerField(choices=STATUS_CHOICES, default=STATUS_READY, verbose_name='处理状态')
+    # {边长: {格式: 文件名}}, 如 {"64": {"jpeg": "blobs/ab/cd/<sha256>.jpg", "webp": "blobs/ef/01/<sha256>.webp"}}
+    variants = models.JSONField(default=dict, blank=True, verbose_name='缩略图')
+    # 原图内容的 sha256, 相同内容的上传共用 jira.blobs 中的同一个文件
+    sha256 = models.CharField(max_length=64, blank=True, default='', db_index=True, verbose_name='内容摘要')
 
     create_at = models.DateTimeField(auto_now_add=True)
 
@@ -27,7 +90,7 @@ class User(AbstractUser):
     avatar = models.ForeignKey(AppImage, on_delete=models.SET_NULL, db_constraint=False, null=True, blank=True)
 
 
-class Project(models.Model):
+class Project(AtomicSaveModel):
     name = models.CharField(max_length=191, verbose_name='名称')
     person = models.ForeignKey(User, on_delete=models.CASCADE, verbose_name='负责人')
     organization = models.CharField(max_length=191, verbose_name='部门')
@@ -40,9 +103,14 @@ class Project(models.Model):
 
     class Meta:
         verbose_name = verbose_name_plural = '项目'
+        indexes = (
+            # ProjectFilter: createAtMin/createAtMax, personId + createAtMin/createAtMax
+            models.Index(fields=('create_at',), name='jira_project_create_at_idx'),
+            models.Index(fields=('person', 'create_at'), name='jira_project_person_create_idx'),
+        )
 
 
-class ProjectUserSetting(models.Model):
+class ProjectUserSetting(AtomicSaveModel):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
     project = models.ForeignKey(Project, on_delete=models.CASCADE, related_name='+')
     is_pinned = models.BooleanField(verbose_name='是否收藏')
@@ -52,9 +120,42 @@ class ProjectUserSetting(models.Model):
 
     class Meta:
         verbose_name = verbose_name_plural = '项目用户设置'
-
-
-class Epic(models.Model):
+        constraints = (
+            models.UniqueConstraint(fields=('user', 'project'), name='uniq_project_user_setting'),
+        )
+
+
+def annotate_pin(queryset, user, field_name='pin', project_field='pk'):
+    """
+    以子查询的方式为每行标注当前用户对项目的收藏状态, 避免逐行查询 ProjectUserSetting。
+    子查询命中 (user, project) 唯一索引; 未设置过或匿名用户时为 None。
+    """
+    if user is None or user.is_anonymous:
+        return queryset.annotate(**{field_name: Value(None, output_field=BooleanField())})
+    pin_qs = ProjectUserSetting.objects.filter(user=user, project=OuterRef(project_field)).values('is_pinned')[:1]
+    return queryset.annotate(**{field_name: Subquery(pin_qs, output_field=BooleanField())})
+
+
+def pinned_project_ids(user):
+    """用户收藏的项目ID, 经 (user, project) 唯一索引读取; 每个用户只收藏少量项目"""
+    if user is None or user.is_anonymous:
+        return []
+    return list(ProjectUserSetting.objects.filter(user=user, is_pinned=True).values_list('project_id', flat=True))
+
+
+def annotate_pinned_rank(queryset, pinned_ids, field_name='pinned_rank'):
+    """
+    标注收藏排序值: pinned_ids (pinned_project_ids) 中的项目为 0, 其余为 1。
+    CASE WHEN id IN (...) 只依赖本行的主键, 不需要像 annotate_pin 那样对每行执行关联子查询。
+    """
+    if not pinned_ids:
+        return queryset.annotate(**{field_name: Value(1, output_field=IntegerField())})
+    return queryset.annotate(**{field_name: Case(
+        When(pk__in=pinned_ids, then=Value(0)), default=Value(1), output_field=IntegerField(),
+    )})
+
+
+class Epic(AtomicSaveModel):
     name = models.CharField(max_length=191)
     project = models.ForeignKey(Project, on_delete=models.CASCADE, related_name='epics')
     start = models.DateTimeField(verbose_name='开始时间')
@@ -70,23 +171,22 @@ class Epic(models.Model):
         verbose_name = verbose_name_plural = '任务组'
 
 
-class Kanban(models.Model):
+class Kanban(AtomicSaveModel):
     name = models.CharField(max_length=191)
     project = models.ForeignKey(Project, on_delete=models.CASCADE, related_name='kanbans')
     rank = models.FloatField(verbose_name='排序参考值', blank=True)
     create_at = models.DateTimeField(auto_now_add=True)
     update_at = models.DateTimeField(auto_now=True)
 
-    # noinspection DuplicatedCode
     def save(self, force_insert=False, force_update=False, using=None, update_fields=None):
-        if self.rank is None:
-            rank_max = Kanban.objects.aggregate(Max('rank'))['rank__max']
-            if rank_max is None:
-                self.rank = 1.0
-            else:
-                self.rank = rank_max + 100
+        if self.rank is not None:
+            return super().save(force_insert, force_update, using, update_fields)
 
-        super().save(force_insert, force_update, using, update_fields)
+        using = using or router.db_for_write(Kanban, instance=self)
+        with transaction.atomic(using=using):
+            lock_rows(Project.objects.using(using).filter(pk=self.project_id))
+            self.rank = next_rank(Kanban.objects.using(using).filter(project_id=self.project_id))
+            super().save(force_insert, force_update, using, update_fields)
 
     def __str__(self):
         return self.name
@@ -94,9 +194,12 @@ class Kanban(models.Model):
     class Meta:
         verbose_name = verbose_name_plural = '看板'
         ordering = ('rank',)
+        indexes = (
+            models.Index(fields=('project', 'rank'), name='jira_kanban_project_rank_idx'),
+        )
 
 
-class Task(models.Model):
+class Task(AtomicSaveModel):
     name = models.CharField(max_length=191, verbose_name='名称')
     reporter = models.ForeignKey(User, verbose_name='报告人', blank=True, null=True, on_delete=models.SET_NULL, related_name='+')
     processor = models.ForeignKey(User, verbose_name='经办人', blank=True, null=True, on_delete=models.SET_NULL, related_name='tasks')
@@ -110,16 +213,20 @@ class Task(models.Model):
     create_at = models.DateTimeField(auto_now_add=True)
     update_at = models.DateTimeField(auto_now=True)
 
-    # noinspection DuplicatedCode
     def save(self, force_insert=False, force_update=False, using=None, update_fields=None):
-        if self.rank is None:
-            rank_max = Task.objects.aggregate(Max('rank'))['rank__max']
-            if rank_max is None:
-                self.rank = 1.0
+        if self.rank is not None:
+            return super().save(force_insert, force_update, using, update_fields)
+
+        using = using or router.db_for_write(Task, instance=self)
+        with transaction.atomic(using=using):
+            if self.kanban_id is None:
+                lock_rows(Project.objects.using(using).filter(pk=self.project_id))
+                scope = Task.objects.using(using).filter(project_id=self.project_id, kanban__isnull=True)
             else:
-                self.rank = rank_max + 100
-
-        super().save(force_insert, force_update, using, update_fields)
+                lock_rows(Kanban.objects.using(using).filter(pk=self.kanban_id))
+                scope = Task.objects.using(using).filter(kanban_id=self.kanban_id)
+            self.rank = next_rank(scope)
+            super().save(force_insert, force_update, using, update_fields)
 
     def __str__(self):
         return self.name
@@ -127,3 +234,124 @@ class Task(models.Model):
     class Meta:
         verbose_name = verbose_name_plural = '任务'
         ordering = ('kanban__rank', 'rank',)
+        indexes = (
+            models.Index(fields=('kanban', 'rank'), name='jira_task_kanban_rank_idx'),
+            # TaskFilter: projectId 与 processorId/epicId/typeId 组合
+            models.Index(fields=('project', 'processor'), name='jira_task_project_proc_idx'),
+            models.Index(fields=('project', 'epic'), name='jira_task_project_epic_idx'),
+            models.Index(fields=('project', 'type_id'), name='jira_task_project_type_idx'),
+        )
+
+
+class SearchIndexEntry(models.Model):
+    """
+    名称/说明的 n-gram 倒排索引, 由 jira.search 维护。
+    每个文档的每个词元一行; 查询时按词元取出文档并要求命中全部词元。
+    """
+    DOC_TYPE_PROJECT = 1
+    DOC_TYPE_EPIC = 2
+    DOC_TYPE_KANBAN = 3
+    DOC_TYPE_TASK = 4
+    DOC_TYPE_CHOICES = (
+        (DOC_TYPE_PROJECT, '项目'),
+        (DOC_TYPE_EPIC, '任务组'),
+        (DOC_TYPE_KANBAN, '看板'),
+        (DOC_TYPE_TASK, '任务'),
+    )
+
+    gram = models.CharField(max_length=8, verbose_name='词元')
+    doc_type = models.PositiveSmallIntegerField(choices=DOC_TYPE_CHOICES, verbose_name='文档类型')
+    doc_id = models.BigIntegerField(verbose_name='文档ID')
+    project_id = models.BigIntegerField(verbose_name='项目ID')
+    in_name = models.BooleanField(verbose_name='是否出现在名称中')
+
+    class Meta:
+        verbose_name = verbose_name_plural = '搜索索引'
+        indexes = (
+            models.Index(fields=('gram', 'doc_type', 'project_id', 'doc_id'), name='jira_search_gram_idx'),
+            models.Index(fields=('doc_type', 'doc_id'), name='jira_search_doc_idx'),
+        )
+
+
+class ChangeLogEntry(models.Model):
+    """
+    项目、任务组、看板、任务与收藏设置的变更记录, 只追加, 由 jira.changelog 写入, 经 /changes 接口增量同步。
+    data 为变更后的完整字段 (删除时为空), 同一对象较早的记录可以被 compact_changes 合并掉。
+    """
+    OBJECT_TYPE_PROJECT = 1
+    OBJECT_TYPE_EPIC = 2
+    OBJECT_TYPE_KANBAN = 3
+    OBJECT_TYPE_TASK = 4
+    OBJECT_TYPE_PROJECT_USER_SETTING = 5
+    OBJECT_TYPE_CHOICES = (
+        (OBJECT_TYPE_PROJECT, '项目'),
+        (OBJECT_TYPE_EPIC, '任务组'),
+        (OBJECT_TYPE_KANBAN, '看板'),
+        (OBJECT_TYPE_TASK, '任务'),
+        (OBJECT_TYPE_PROJECT_USER_SETTING, '项目用户设置'),
+    )
+
+    ACTION_CREATE = 1
+    ACTION_UPDATE = 2
+    ACTION_DELETE = 3
+    ACTION_REORDER = 4
+    ACTION_RESET = 5
+    ACTION_CHOICES = (
+        (ACTION_CREATE, '新建'),
+        (ACTION_UPDATE, '修改'),
+        (ACTION_DELETE, '删除'),
+        (ACTION_REORDER, '排序'),
+        (ACTION_RESET, '批量变更, 需要重新拉取'),
+    )
+
+    # 游标; 由 ChangeLogSequence 在写入的事务中分配, 序号顺序即提交顺序
+    seq = models.BigIntegerField(unique=True, verbose_name='序号')
+    object_type = models.PositiveSmallIntegerField(choices=OBJECT_TYPE_CHOICES, verbose_name='对象类型')
+    object_id = models.BigIntegerField(verbose_name='对象ID')
+    project_id = models.BigIntegerField(verbose_name='项目ID')
+    # 0 为所有用户可见; 收藏设置只对所属用户可见
+    user_id = models.BigIntegerField(default=0, verbose_name='用户ID')
+    action = models.PositiveSmallIntegerField(choices=ACTION_CHOICES, verbose_name='变更类型')
+    data = models.JSONField(null=True, blank=True, encoder=DjangoJSONEncoder, verbose_name='变更后的字段')
+
+    create_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = verbose_name_plural = '变更记录'
+        indexes = (
+            models.Index(fields=('project_id', 'seq'), name='jira_change_project_seq_idx'),
+            models.Index(fields=('object_type', 'object_id'), name='jira_change_object_idx'),
+        )
+
+
+class ChangeLogSequence(models.Model):
+    """
+    变更记录序号的计数器, 只有一行。写入记录的事务先把它加上记录条数再读出 (jira.changelog.record),
+    行锁持有到事务提交: 后一个事务要等前一个提交后才能分配序号, 读方看到的序号总是连续的前缀。
+    """
+    value = models.BigIntegerField(default=0, verbose_name='已分配的最大序号')
+
+    class Meta:
+        verbose_name = verbose_name_plural = '变更记录序号'
+
+
+def _remember_project(sender, instance, **kwargs):
+    instance._loaded_project_id = instance.__dict__.get('project_id')
+
+
+def _shift_project(sender, instance, raw=False, **kwargs):
+    instance._previous_project_id = instance.__dict__.get('_loaded_project_id')
+    instance._loaded_project_id = instance.__dict__.get('project_id')
+
+
+def previous_project_id(instance):
+    """
+    在 post_save 中读取: 本次保存之前 (加载或上次保存时) 的 project_id, 用于发现移到其他项目的对象;
+    新建时与当前值相同, project_id 被延迟加载时为 None。
+    """
+    return instance.__dict__.get('_previous_project_id')
+
+
+for _model in (Epic, Kanban, Task):
+    post_init.connect(_remember_project, sender=_model, dispatch_uid=f'remember_project_{_model.__name__}')
+    pre_save.connect(_shift_project, sender=_model, dispatch_uid=f'shift_project_{_model.__name__}')
@@ -0,0 +1,174 @@
+"""
+列表接口的分页。
+
+默认沿用 PageNumberPagination (未配置 PAGE_SIZE 时不分页); 客户端带上 ``cursor`` 参数
+(第一页传空值 ``?cursor=``) 时切换为基于排序列的 keyset 分页:
+按视图的 cursor_ordering (最后一列必须唯一, 一般为 id) 做范围查找, 不执行 COUNT, 也不使用 OFFSET。
+"""
+import base64
+import json
+import math
+
+from django.core.exceptions import ValidationError
+from django.db.models import CharField, F, FloatField, IntegerField, Q, TextField
+from rest_framework import exceptions
+from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+def encode_cursor(position):
+    raw = json.dumps(position, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def ordering_fields(model, ordering, annotations=None):
+    """
+    cursor_ordering 中各列 (可以跨关联, 如 kanban__rank) 对应的模型字段, 外键取其指向的字段;
+    annotations 中的标注列取其 output_field
+    """
+    fields = []
+    for path in ordering:
+        if annotations and path in annotations:
+            fields.append(annotations[path].output_field)
+            continue
+        parts = path.lstrip('-').split('__')
+        opts = model._meta
+        for part in parts[:-1]:
+            opts = opts.get_field(part).related_model._meta
+        field = opts.get_field(parts[-1])
+        fields.append(field.target_field if field.is_relation else field)
+    return fields
+
+
+def _valid_value(field, value):
+    # NULL 排在最前, 任何列都可以是 None
+    if value is None:
+        return True
+    if isinstance(field, FloatField):
+        return isinstance(value, (int, float)) and not isinstance(value, bool) and math.isfinite(value)
+    if isinstance(field, IntegerField):
+        return isinstance(value, int) and not isinstance(value, bool)
+    if isinstance(field, (CharField, TextField)):
+        return isinstance(value, str)
+    try:
+        field.to_python(value)
+    except ValidationError:
+        return False
+    return True
+
+
+def decode_cursor(cursor, fields=None):
+    """fields 为排序列对应的模型字段 (ordering_fields), 传入时校验列数与每一列的类型"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        position = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')).decode('utf-8'))
+    except (ValueError, TypeError):
+        raise exceptions.ValidationError({'msg': 'cursor is invalid'})
+    if not isinstance(position, list):
+        raise exceptions.ValidationError({'msg': 'cursor is invalid'})
+    if fields is not None:
+        if len(position) != len(fields):
+            raise exceptions.ValidationError({'msg': 'cursor is invalid'})
+        for field, value in zip(fields, position):
+            if not _valid_value(field, value):
+                raise exceptions.ValidationError({'msg': f'cursor is invalid, {field.name}={value!r}'})
+    return position
+
+
+def keyset_after(names, position):
+    """
+    生成 "排在 position 之后" 的过滤条件, 所有列均为升序, NULL 排在最前 (与 MySQL/SQLite 一致)。
+    (a, b, id) > (x, y, z) 展开为 a > x OR (a = x AND (b > y OR (b = y AND id > z)))。
+    再加上冗余的 a >= x: OR 展开后优化器无法从索引中定位起点, 有了第一列的范围才能直接跳到 position 处。
+    """
+    condition = None
+    for name, value in reversed(list(zip(names, position))):
+        if value is None:
+            equal, greater = Q(**{f'{name}__isnull': True}), Q(**{f'{name}__isnull': False})
+        else:
+            equal, greater = Q(**{name: value}), Q(**{f'{name}__gt': value})
+        condition = greater if condition is None else greater | (equal & condition)
+    if position and position[0] is not None:
+        condition = Q(**{f'{names[0]}__gte': position[0]}) & condition
+    return condition
+
+
+def keyset_queryset(queryset, ordering, position=None):
+    """按 ordering 排序并把各列标注为 keyset_<i>, 给出 position 时只取排在它之后的行; 返回 (queryset, 标注名)"""
+    names = [f'keyset_{i}' for i in range(len(ordering))]
+    queryset = queryset.annotate(**{name: F(field) for name, field in zip(names, ordering)}).order_by(*ordering)
+    if position is not None:
+        queryset = queryset.filter(keyset_after(names, position))
+    return queryset, names
+
+
+class CursorOrPageNumberPagination(PageNumberPagination):
+    cursor_query_param = 'cursor'
+    cursor_page_size_query_param = 'pageSize'
+    cursor_page_size = 50
+    cursor_max_page_size = 500
+
+    def __init__(self):
+        self.cursor_mode = False
+        self.next_position = None
+
+    @staticmethod
+    def get_cursor_ordering(view):
+        # 排序列随请求变化的视图 (如 pinnedFirst) 实现 get_cursor_ordering, 其余取 cursor_ordering
+        getter = getattr(view, 'get_cursor_ordering', None)
+        return getter() if getter is not None else getattr(view, 'cursor_ordering', None)
+
+    def use_cursor(self, request, view):
+        return self.cursor_query_param in request.query_params and self.get_cursor_ordering(view) is not None
+
+    def get_cursor_page_size(self, request):
+        try:
+            page_size = int(request.query_params.get(self.cursor_page_size_query_param, self.cursor_page_size))
+        except ValueError:
+            page_size = self.cursor_page_size
+        return max(1, min(page_size, self.cursor_max_page_size))
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if not self.use_cursor(request, view):
+            return super().paginate_queryset(queryset, request, view)
+
+        self.cursor_mode = True
+        self.request = request
+
+        ordering = self.get_cursor_ordering(view)
+        position = None
+        cursor = request.query_params.get(self.cursor_query_param)
+        if cursor:
+            position = decode_cursor(cursor, ordering_fields(queryset.model, ordering, queryset.query.annotations))
+        queryset, names = keyset_queryset(queryset, ordering, position)
+
+        page_size = self.get_cursor_page_size(request)
+        rows = list(queryset[:page_size + 1])
+        has_next = len(rows) > page_size
+        rows = rows[:page_size]
+
+        self.next_position = None
+        if has_next:
+            last = rows[-1]
+            if isinstance(last, dict):
+                self.next_position = [last[name] for name in names]
+            else:
+                self.next_position = [getattr(last, name) for name in names]
+        return rows
+
+    def get_next_link(self):
+        if not self.cursor_mode:
+            return super().get_next_link()
+        if self.next_position is None:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, encode_cursor(self.next_position))
+
+    def get_paginated_response(self, data):
+        if not self.cursor_mode:
+            return super().get_paginated_response(data)
+        return Response({
+            'next': self.get_next_link(),
+            'results': data,
+        })
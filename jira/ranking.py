@@ -0,0 +1,200 @@
+"""
+看板/任务拖拽排序使用的 rank 工具。
+
+rank 为浮点数, 把元素拖到两个相邻元素之间时取二者的中点。反复拖到同一位置时间隔每次减半,
+约 50 次后浮点精度耗尽, rank 会相同, 排序静默出错。这里在间隔小于 MIN_RANK_GAP 时
+把整个看板 (任务) 或整个项目 (看板) 重新按 RANK_STEP 编号, 用一次 bulk_update 完成。
+"""
+import logging
+
+from django.db import transaction
+from django.utils import timezone
+
+from .models import RANK_STEP, Project, Kanban, Task, lock_rows
+from .signals import bulk_changed
+
+logger = logging.getLogger(__name__)
+
+# 相邻 rank 的最小间隔, 从 RANK_STEP 开始约可连续插入 17 次才会触发重新编号
+MIN_RANK_GAP = 1e-3
+
+
+def neighbour_ranks(scope, reference_rank, position):
+    """
+    返回把元素放到 reference 之前/之后时左右两侧的 (lo, hi)。
+    scope 为同一看板/项目内且已排除被移动元素的 queryset。
+    """
+    if position == 'before':
+        hi = reference_rank
+        prev_rank = scope.filter(rank__lt=hi).order_by('-rank').values_list('rank', flat=True).first()
+        lo = hi - RANK_STEP if prev_rank is None else prev_rank
+    elif position == 'after':
+        lo = reference_rank
+        next_rank = scope.filter(rank__gt=lo).order_by('rank').values_list('rank', flat=True).first()
+        hi = lo + RANK_STEP if next_rank is None else next_rank
+    else:
+        raise ValueError(f'invalid position: {position}')
+    return lo, hi
+
+
+def rank_between(lo, hi):
+    """两个 rank 的中点, 间隔过小时返回 None, 调用方需先重新编号"""
+    if hi - lo < MIN_RANK_GAP:
+        return None
+    return float(lo + hi) / 2
+
+
+def rebalance(queryset):
+    """
+    把 queryset 内的元素按当前顺序重新编号为 1, 1 + RANK_STEP, ...
+    调用方负责锁住所属的看板/项目。
+    """
+    rows = list(queryset.order_by('rank', 'id').only('id', 'rank'))
+    now = timezone.now()
+    for i, row in enumerate(rows):
+        row.rank = 1.0 + RANK_STEP * i
+        row.update_at = now
+    queryset.model.objects.bulk_update(rows, ('rank', 'update_at'))
+    bulk_changed.send(sender=queryset.model, pks=[row.pk for row in rows])
+    logger.info('rebalance %s ranks, count=%d', queryset.model.__name__, len(rows))
+    return len(rows)
+
+
+def rebalance_kanban_tasks(kanban_id):
+    with transaction.atomic():
+        lock_rows(Kanban.objects.filter(pk=kanban_id))
+        return rebalance(Task.objects.filter(kanban_id=kanban_id))
+
+
+def rebalance_project_kanbans(project_id):
+    with transaction.atomic():
+        lock_rows(Project.objects.filter(pk=project_id))
+        return rebalance(Kanban.objects.filter(project_id=project_id))
+
+
+def rank_for_move(scope, reference, position, moving_pk):
+    """
+    计算把 moving_pk 放到 reference 之前/之后的新 rank, 间隔耗尽时先对 scope 重新编号。
+    需在已锁住 scope 所属看板/项目的事务中调用。
+    """
+    others = scope.exclude(pk=moving_pk)
+    lo, hi = neighbour_ranks(others, reference.rank, position)
+    new_rank = rank_between(lo, hi)
+    if new_rank is None:
+        rebalance(scope)
+        reference.refresh_from_db(fields=('rank',))
+        lo, hi = neighbour_ranks(others, reference.rank, position)
+        new_rank = rank_between(lo, hi)
+    return new_rank
+
+
+def rank_gap_health(model, scope_field, min_gap=MIN_RANK_GAP, chunk_size=2000):
+    """
+    按 scope_field (kanban_id / project_id) 流式扫描 (scope, rank) 索引, 统计每个范围内
+    元素个数、最小间隔以及 rank 完全相同的次数。返回间隔不足 min_gap 的范围以及总体统计。
+    """
+    rows = model.objects.exclude(**{f'{scope_field}__isnull': True}) \
+        .order_by(scope_field, 'rank') \
+        .values_list(scope_field, 'rank') \
+        .iterator(chunk_size=chunk_size)
+
+    stats = {}
+    prev_scope, prev_rank = object(), None
+    for scope_id, rank in rows:
+        item = stats.get(scope_id)
+        if item is None:
+            item = stats[scope_id] = {'scope_id': scope_id, 'count': 0, 'min_gap': None, 'collisions': 0}
+        item['count'] += 1
+        if scope_id == prev_scope:
+            gap = rank - prev_rank
+            if item['min_gap'] is None or gap < item['min_gap']:
+                item['min_gap'] = gap
+            if gap == 0:
+                item['collisions'] += 1
+        prev_scope, prev_rank = scope_id, rank
+
+    narrow = [item for item in stats.values() if item['min_gap'] is not None and item['min_gap'] < min_gap]
+    return {
+        'scopes': len(stats),
+        'rows': sum(item['count'] for item in stats.values()),
+        'narrow': narrow,
+    }
+
+
+def _assign_ranks(objs, moved):
+    """
+    objs 为某个看板/项目内移动完成后的顺序, 为其中被移动的元素计算 rank。
+    相邻的一段被移动元素在左右两个未移动元素之间均匀分布; 间隔不足时整段重新编号。
+    返回 rank 有变化的元素。
+    """
+    changed = []
+    n = len(objs)
+    i = 0
+    while i < n:
+        if objs[i].pk not in moved:
+            i += 1
+            continue
+        j = i
+        while j < n and objs[j].pk in moved:
+            j += 1
+        count = j - i
+
+        lo = objs[i - 1].rank if i > 0 else None
+        hi = objs[j].rank if j < n else None
+        if lo is None and hi is None:
+            lo, hi = 1.0 - RANK_STEP, 1.0 + RANK_STEP * count
+        elif lo is None:
+            lo = hi - RANK_STEP * (count + 1)
+        elif hi is None:
+            hi = lo + RANK_STEP * (count + 1)
+
+        step = (hi - lo) / (count + 1)
+        if step < MIN_RANK_GAP:
+            for k, obj in enumerate(objs):
+                obj.rank = 1.0 + RANK_STEP * k
+            return list(objs)
+
+        for k in range(count):
+            objs[i + k].rank = lo + step * (k + 1)
+            changed.append(objs[i + k])
+        i = j
+    return changed
+
+
+def plan_moves(lists, moves, scope_attr):
+    """
+    在内存中按顺序执行一批移动并计算 rank, 不访问数据库。
+
+    lists: {scope_id: [obj, ...]}, 每个看板/项目内按 rank 排好序的全部元素
+    moves: [(pk, target_scope_id, reference_pk, position), ...], reference_pk 为 None 时放到末尾
+    scope_attr: 'kanban_id' / 'project_id'
+    返回需要写回数据库的元素; 非法的移动抛出 ValueError。
+    """
+    index = {obj.pk: obj for objs in lists.values() for obj in objs}
+    moved = set()
+
+    for pk, target_scope_id, reference_pk, position in moves:
+        obj = index.get(pk)
+        if obj is None:
+            raise ValueError(f'item {pk} does not exist')
+        target = lists.get(target_scope_id)
+        if target is None:
+            raise ValueError(f'scope {target_scope_id} does not exist')
+
+        lists[getattr(obj, scope_attr)].remove(obj)
+        if reference_pk is None:
+            target.append(obj)
+        else:
+            reference = index.get(reference_pk)
+            if reference is None or reference is obj or getattr(reference, scope_attr) != target_scope_id:
+                raise ValueError(f'reference item {reference_pk} is not in scope {target_scope_id}')
+            i = target.index(reference)
+            target.insert(i if position == 'before' else i + 1, obj)
+        setattr(obj, scope_attr, target_scope_id)
+        moved.add(pk)
+
+    changed = []
+    for scope_id, objs in lists.items():
+        if scope_id is not None:
+            changed.extend(_assign_ranks(objs, moved))
+    return changed
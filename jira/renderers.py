@@ -0,0 +1,280 @@
+"""
+驼峰/下划线转换的 JSON 渲染器与解析器。
+
+djangorestframework_camel_case 先复制一遍整个响应 (每个 dict 的每个 key 做一次正则替换), 再交给 json.dumps
+遍历一次。这里的 CamelCaseJSONRenderer 只遍历一次: 编码 dict 时直接写出转换后的 key, 不构建中间副本;
+接口里出现的 key 种类很少, 转换并转义后的 '"key":' 片段按 key 缓存。其余逻辑与 djangorestframework_camel_case
+保持一致, 输出字节完全相同 (包括 JSON_UNDERSCOREIZE 配置)。带缩进的输出 (可浏览 API、?indent=) 不在热点路径上,
+仍先转换再编码。
+"""
+import json
+from functools import lru_cache
+from json.encoder import encode_basestring, encode_basestring_ascii
+
+from django.conf import settings
+from django.core.files import File
+from django.http import QueryDict
+from django.http.multipartparser import MultiPartParser as DjangoMultiPartParser, MultiPartParserError
+from django.utils.datastructures import MultiValueDict
+from django.utils.encoding import force_str
+from django.utils.functional import Promise
+from djangorestframework_camel_case.settings import api_settings
+from djangorestframework_camel_case.util import camelize_re, underscore_to_camel, get_underscoreize_re
+from rest_framework.compat import LONG_SEPARATORS, SHORT_SEPARATORS
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import FormParser, MultiPartParser, DataAndFiles
+from rest_framework.renderers import BrowsableAPIRenderer
+from rest_framework.utils.serializer_helpers import ReturnDict
+
+KEY_CACHE_SIZE = 4096
+
+_SCALAR_TYPES = (str, int, float, bool, type(None))
+
+
+@lru_cache(maxsize=KEY_CACHE_SIZE)
+def camelize_key(key):
+    if '_' not in key:
+        return key
+    return camelize_re.sub(underscore_to_camel, key)
+
+
+@lru_cache(maxsize=KEY_CACHE_SIZE)
+def underscoreize_key(key, no_underscore_before_number=False):
+    options = {'no_underscore_before_number': no_underscore_before_number}
+    return get_underscoreize_re(options).sub(r'\1_\2', key).lower()
+
+
+def _is_iterable(obj):
+    try:
+        iter(obj)
+    except TypeError:
+        return False
+    return True
+
+
+def camelize(data, ignore_fields=()):
+    """与 djangorestframework_camel_case.util.camelize 的结果相同"""
+    if isinstance(data, _SCALAR_TYPES):
+        return data
+    if isinstance(data, Promise):
+        data = force_str(data)
+    if isinstance(data, dict):
+        new_dict = ReturnDict(serializer=data.serializer) if isinstance(data, ReturnDict) else {}
+        for key, value in data.items():
+            if isinstance(key, Promise):
+                key = force_str(key)
+            new_key = camelize_key(key) if isinstance(key, str) else key
+            if ignore_fields and (key in ignore_fields or new_key in ignore_fields):
+                new_dict[new_key] = value
+            else:
+                new_dict[new_key] = camelize(value, ignore_fields)
+        return new_dict
+    if not isinstance(data, str) and _is_iterable(data):
+        return [camelize(item, ignore_fields) for item in data]
+    return data
+
+
+def underscoreize(data, no_underscore_before_number=False, ignore_fields=()):
+    """与 djangorestframework_camel_case.util.underscoreize 的结果相同"""
+    if isinstance(data, dict):
+        if type(data) == MultiValueDict:
+            new_data = MultiValueDict()
+            for key in data.keys():
+                new_data.setlist(underscoreize_key(key, no_underscore_before_number), data.getlist(key))
+            return new_data
+
+        items = data.lists() if isinstance(data, QueryDict) else data.items()
+        new_dict = {}
+        for key, value in items:
+            new_key = underscoreize_key(key, no_underscore_before_number) if isinstance(key, str) else key
+            if ignore_fields and (key in ignore_fields or new_key in ignore_fields):
+                new_dict[new_key] = value
+            else:
+                new_dict[new_key] = underscoreize(value, no_underscore_before_number, ignore_fields)
+
+        if isinstance(data, QueryDict):
+            new_query = QueryDict(mutable=True)
+            for key, value in new_dict.items():
+                new_query.setlist(key, value)
+            return new_query
+        return new_dict
+    if not isinstance(data, (str, File)) and _is_iterable(data):
+        return [underscoreize(item, no_underscore_before_number, ignore_fields) for item in data]
+    return data
+
+
+def _options():
+    options = api_settings.JSON_UNDERSCOREIZE
+    return {
+        'no_underscore_before_number': bool(options.get('no_underscore_before_number')),
+        'ignore_fields': tuple(options.get('ignore_fields') or ()),
+    }
+
+
+def _float_str(value, allow_nan):
+    # 与 json.encoder 的 floatstr 相同
+    if value != value:
+        text = 'NaN'
+    elif value == float('inf'):
+        text = 'Infinity'
+    elif value == -float('inf'):
+        text = '-Infinity'
+    else:
+        return float.__repr__(value)
+    if not allow_nan:
+        raise ValueError('Out of range float values are not JSON compliant: ' + repr(value))
+    return text
+
+
+def make_camelize_encoder(encoder, ensure_ascii, allow_nan, item_separator, key_separator, ignore_fields=()):
+    """
+    返回 encode(data) -> str, 结果与 json.dumps(camelize(data, ignore_fields), ...) 相同, 但只遍历一次 data。
+    encoder 为同样参数构造的 JSONEncoder 实例: 提供 default, 并编码 ignore_fields 下不转换的值。
+    """
+    encode_str = encode_basestring_ascii if ensure_ascii else encode_basestring
+    key_parts = {}
+
+    def key_part(key):
+        # camelize 之后由 json 转为字符串的 key, 连同分隔符一起缓存
+        part = key_parts.get(key)
+        if part is None:
+            if isinstance(key, Promise):
+                key = force_str(key)
+            if isinstance(key, str):
+                text = camelize_key(key)
+            elif isinstance(key, float):
+                text = _float_str(key, allow_nan)
+            elif key is True or key is False or key is None:
+                text = json.dumps(key)
+            elif isinstance(key, int):
+                text = int.__repr__(key)
+            else:
+                raise TypeError(f'keys must be str, int, float, bool or None, not {key.__class__.__name__}')
+            part = encode_str(text) + key_separator
+            # 1、1.0 与 True 的哈希相同, 只缓存字符串 key
+            if isinstance(key, str) and len(key_parts) < KEY_CACHE_SIZE:
+                key_parts[key] = part
+        return part
+
+    def ignored(key):
+        if isinstance(key, Promise):
+            key = force_str(key)
+        return key in ignore_fields or (isinstance(key, str) and camelize_key(key) in ignore_fields)
+
+    def encode(value, parts):
+        # 类型判断的顺序与 camelize 相同: 标量、Promise、dict、非字符串的可迭代对象, 其余交给 default
+        if isinstance(value, str):
+            parts.append(encode_str(value))
+        elif value is None:
+            parts.append('null')
+        elif value is True:
+            parts.append('true')
+        elif value is False:
+            parts.append('false')
+        elif isinstance(value, int):
+            parts.append(int.__repr__(value))
+        elif isinstance(value, float):
+            parts.append(_float_str(value, allow_nan))
+        elif isinstance(value, Promise):
+            parts.append(encode_str(force_str(value)))
+        elif isinstance(value, dict):
+            if not value:
+                parts.append('{}')
+                return
+            parts.append('{')
+            first = True
+            for key, item in value.items():
+                if first:
+                    first = False
+                else:
+                    parts.append(item_separator)
+                parts.append(key_part(key))
+                if ignore_fields and ignored(key):
+                    parts.append(encoder.encode(item))
+                else:
+                    encode(item, parts)
+            parts.append('}')
+        elif _is_iterable(value):
+            parts.append('[')
+            first = True
+            for item in value:
+                if first:
+                    first = False
+                else:
+                    parts.append(item_separator)
+                encode(item, parts)
+            parts.append(']')
+        else:
+            # camelize 原样保留的对象, 由 json.dumps 经 default 编码, 不再转换其中的 key
+            parts.append(encoder.encode(value))
+
+    def encode_data(data):
+        parts = []
+        encode(data, parts)
+        return ''.join(parts)
+
+    return encode_data
+
+
+class CamelCaseJSONRenderer(api_settings.RENDERER_CLASS):
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        ignore_fields = _options()['ignore_fields']
+        renderer_context = renderer_context or {}
+        if self.get_indent(accepted_media_type, renderer_context) is not None:
+            return super().render(camelize(data, ignore_fields), accepted_media_type, renderer_context)
+
+        item_separator, key_separator = SHORT_SEPARATORS if self.compact else LONG_SEPARATORS
+        encoder = self.encoder_class(
+            ensure_ascii=self.ensure_ascii, allow_nan=not self.strict, separators=(item_separator, key_separator),
+        )
+        encode = make_camelize_encoder(
+            encoder, self.ensure_ascii, not self.strict, item_separator, key_separator, ignore_fields,
+        )
+        ret = encode(data)
+        # 与 JSONRenderer 一样转义 \u2028 与 \u2029
+        ret = ret.replace('\u2028', '\\u2028').replace('\u2029', '\\u2029')
+        return ret.encode()
+
+
+class CamelCaseBrowsableAPIRenderer(BrowsableAPIRenderer):
+    def render(self, data, *args, **kwargs):
+        return super().render(camelize(data, _options()['ignore_fields']), *args, **kwargs)
+
+
+class CamelCaseJSONParser(api_settings.PARSER_CLASS):
+    def parse(self, stream, media_type=None, parser_context=None):
+        parser_context = parser_context or {}
+        encoding = parser_context.get('encoding', settings.DEFAULT_CHARSET)
+
+        try:
+            data = stream.read().decode(encoding)
+            return underscoreize(json.loads(data), **_options())
+        except ValueError as exc:
+            raise ParseError('JSON parse error - %s' % str(exc))
+
+
+class CamelCaseFormParser(FormParser):
+    def parse(self, stream, media_type=None, parser_context=None):
+        return underscoreize(super().parse(stream, media_type, parser_context), **_options())
+
+
+class CamelCaseMultiPartParser(MultiPartParser):
+    media_type = 'multipart/form-data'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        parser_context = parser_context or {}
+        request = parser_context['request']
+        encoding = parser_context.get('encoding', settings.DEFAULT_CHARSET)
+        meta = request.META.copy()
+        meta['CONTENT_TYPE'] = media_type
+        upload_handlers = request.upload_handlers
+
+        try:
+            parser = DjangoMultiPartParser(meta, stream, upload_handlers, encoding)
+            data, files = parser.parse()
+            options = _options()
+            return DataAndFiles(underscoreize(data, **options), underscoreize(files, **options))
+        except MultiPartParserError as exc:
+            raise ParseError('Multipart form parse error - %s' % str(exc))
@@ -0,0 +1,218 @@
+"""
+列表接口的服务端响应缓存。
+
+同一项目的看板常被多人同时打开, 各 worker 重复执行相同的查询与序列化。这里缓存 list 接口序列化后的数据:
+- 默认关闭, 由 RESPONSE_CACHE 开启; 多个 worker 需要配置共享缓存 (CACHE_URL)
+- 键由接口 (basename)、请求的 scheme 与 host、归一化后的查询参数、项目版本号与嵌套对象版本号组成。
+  输出中的头像/图片地址是按请求的 host 生成的绝对地址, 经不同域名访问时不能共用缓存
+- 项目版本号在 Task/Kanban/Epic/Project 写入 (post_save/post_delete 与 bulk_changed 信号) 时更换, 任务移到其他项目时
+  新旧两个项目都更换; 旧键不再被读到, 只等缓存后端自行淘汰, 不依赖 TTL 保证新鲜度
+- 带 projectId 的请求只使用该项目的版本号, 其他项目的写入不影响它; 不带 projectId 的请求使用全局版本号,
+  任何项目的写入都会更换它
+- User/AppImage 嵌套在各接口的输出里, 它们的写入更换嵌套对象版本号 (登录只更新 last_login 时除外)
+- 与当前用户相关的 pin 不进入缓存: 取出缓存后用一次 ProjectUserSetting 查询覆盖, 因此收藏设置的写入不需要更换版本号
+- 冷启动时只有拿到锁 (cache.add) 的请求构建缓存, 其他请求轮询等待结果, 等待超时后各自构建但不写缓存
+
+只依赖 get/set/add/delete/get_many/set_many, 本机内存、文件缓存以及 redis/memcached 后端都可用。
+"""
+import hashlib
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from rest_framework.response import Response
+
+from .models import AppImage, User, ProjectUserSetting, Project, Epic, Kanban, Task, previous_project_id
+from .signals import bulk_changed
+
+VERSION_KEY = 'jira:rc:version:{}'
+DATA_KEY = 'jira:rc:data:{}:{}'
+ALL_PROJECTS = 'all'
+NESTED = 'nested'
+
+LOCK_TIMEOUT = 10
+WAIT_TIMEOUT = 2.0
+WAIT_INTERVAL = 0.02
+
+
+def get_versions(project_id=None):
+    """返回 (项目版本号, 嵌套对象版本号), 不指定项目时为全局版本号; 缓存中没有时生成随机值"""
+    keys = [VERSION_KEY.format(ALL_PROJECTS if project_id is None else project_id), VERSION_KEY.format(NESTED)]
+    values = cache.get_many(keys)
+    for key in keys:
+        if key not in values:
+            cache.add(key, uuid.uuid4().hex, None)
+            values[key] = cache.get(key)
+    return tuple(values[key] for key in keys)
+
+
+def _bump(names):
+    cache.set_many({VERSION_KEY.format(name): uuid.uuid4().hex for name in names}, None)
+
+
+def bump_versions(project_ids):
+    _bump([ALL_PROJECTS, *set(project_ids)])
+
+
+def _bump_twice(names):
+    """
+    立即更换一次, 当前请求接下来的读取不会命中旧数据;
+    事务提交后再更换一次, 提交前其他请求用旧数据构建的缓存也会失效。
+    """
+    names = list(names)
+    _bump(names)
+    transaction.on_commit(lambda: _bump(names))
+
+
+def invalidate(project_ids):
+    _bump_twice([ALL_PROJECTS, *set(project_ids)])
+
+
+def on_saved_or_deleted(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    if sender is Project:
+        invalidate([instance.pk])
+        return
+    # 移到其他项目时原项目也要更换版本号
+    invalidate({instance.project_id, previous_project_id(instance)} - {None})
+
+
+def on_bulk_changed(sender, pks=None, project_ids=None, **kwargs):
+    if sender not in (Project, Epic, Kanban, Task):
+        return
+    if project_ids is None:
+        if sender is Project:
+            project_ids = pks
+        else:
+            project_ids = sender.objects.filter(pk__in=pks).values_list('project_id', flat=True).distinct()
+    invalidate(project_ids)
+
+
+def on_nested_changed(sender, update_fields=None, **kwargs):
+    # 与 conditional 的 change stamp 一样只在写入时更换一次
+    if update_fields is not None and set(update_fields) <= {'last_login'}:
+        return
+    _bump([NESTED])
+
+
+for _model in (Project, Epic, Kanban, Task):
+    post_save.connect(on_saved_or_deleted, sender=_model, dispatch_uid=f'response_cache_saved_{_model.__name__}')
+    post_delete.connect(on_saved_or_deleted, sender=_model, dispatch_uid=f'response_cache_deleted_{_model.__name__}')
+for _model in (User, AppImage):
+    post_save.connect(on_nested_changed, sender=_model, dispatch_uid=f'response_cache_nested_saved_{_model.__name__}')
+    post_delete.connect(on_nested_changed, sender=_model, dispatch_uid=f'response_cache_nested_deleted_{_model.__name__}')
+bulk_changed.connect(on_bulk_changed, dispatch_uid='response_cache_bulk_changed')
+
+
+def get_or_build(key, build, timeout=None):
+    """
+    build 返回 (data, cacheable)。返回 data。
+    同一个键同时只有一个请求执行 build, 其余请求等待其结果。
+    """
+    entry = cache.get(key)
+    if entry is not None:
+        return entry['data']
+
+    lock_key = f'{key}:lock'
+    if cache.add(lock_key, 1, LOCK_TIMEOUT):
+        try:
+            data, cacheable = build()
+            if cacheable:
+                cache.set(key, {'data': data}, timeout)
+            return data
+        finally:
+            cache.delete(lock_key)
+
+    deadline = time.monotonic() + WAIT_TIMEOUT
+    while time.monotonic() < deadline:
+        time.sleep(WAIT_INTERVAL)
+        entry = cache.get(key)
+        if entry is not None:
+            return entry['data']
+        if cache.get(lock_key) is None:
+            # 构建方结束了但没有写缓存 (不可缓存或出错)
+            break
+    return build()[0]
+
+
+def _pin_targets(data, pin_path):
+    items = data['results'] if isinstance(data, dict) else data
+    for item in items:
+        target = item
+        for name in pin_path[:-1]:
+            target = target.get(name) if isinstance(target, dict) else None
+        if isinstance(target, dict) and pin_path[-1] in target:
+            yield target
+
+
+def overlay_pins(data, user, pin_path):
+    """把缓存数据中的 pin 换成当前用户的收藏状态"""
+    targets = list(_pin_targets(data, pin_path))
+    if not targets:
+        return data
+    if user is None or user.is_anonymous:
+        pins = {}
+    else:
+        pins = dict(ProjectUserSetting.objects.filter(
+            user=user, project_id__in={target['id'] for target in targets},
+        ).values_list('project_id', 'is_pinned'))
+    for target in targets:
+        target[pin_path[-1]] = pins.get(target['id'])
+    return data
+
+
+class ResponseCacheMixin:
+    """
+    为 list 缓存序列化后的数据, 放在 ConditionalGetMixin 之后、CompiledReadMixin 之前。
+    response_cache_pin_path 为输出中 pin 的路径, 如 ('pin',) 或 ('project', 'pin')。
+    """
+    response_cache_project_param = 'projectId'
+    response_cache_pin_path = None
+    # 这些参数的结果因人而异, 不缓存
+    response_cache_bypass_params = ()
+
+    def get_response_cache_key(self, request):
+        project_id = None
+        if self.response_cache_project_param:
+            value = request.query_params.get(self.response_cache_project_param)
+            if value:
+                try:
+                    project_id = int(value)
+                except ValueError:
+                    return None
+        params = sorted((name, tuple(values)) for name, values in request.query_params.lists())
+        parts = (request.build_absolute_uri('/'), params, get_versions(project_id))
+        digest = hashlib.md5(repr(parts).encode('utf-8')).hexdigest()
+        return DATA_KEY.format(self.basename, digest)
+
+    def list(self, request, *args, **kwargs):
+        if not settings.RESPONSE_CACHE or any(request.query_params.get(name) for name in self.response_cache_bypass_params):
+            return super().list(request, *args, **kwargs)
+        key = self.get_response_cache_key(request)
+        if key is None:
+            return super().list(request, *args, **kwargs)
+
+        response = None
+
+        def build():
+            nonlocal response
+            response = super(ResponseCacheMixin, self).list(request, *args, **kwargs)
+            cacheable = response.status_code == 200 and self._pins_overlayable(response.data)
+            return response.data, cacheable
+
+        data = get_or_build(key, build, settings.RESPONSE_CACHE_TIMEOUT)
+        if response is not None:
+            return response
+        if self.response_cache_pin_path:
+            data = overlay_pins(data, request.user, self.response_cache_pin_path)
+        return Response(data)
+
+    def _pins_overlayable(self, data):
+        # ?fields= 去掉了 id 时无法按项目覆盖 pin
+        if not self.response_cache_pin_path:
+            return True
+        return all('id' in target for target in _pin_targets(data, self.response_cache_pin_path))
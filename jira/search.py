@@ -0,0 +1,239 @@
+"""
+项目、任务组、看板、任务的名称/说明搜索。
+
+名称大多是中文, MySQL 的分词全文索引用不上, icontains 又是全表扫描。这里维护一张二元组 (bigram)
+倒排索引表 SearchIndexEntry:
+- 文本经 NFKC 归一化、去掉重音符号 (é -> e) 并转小写后, 按连续的字母/数字/汉字切成片段,
+  每个片段取相邻两字符组成词元, 只有一个字符的片段取单字
+- 模型保存/删除时通过信号更新索引; bulk_create/bulk_update/queryset.update 不触发信号,
+  批量写入方需要调用 index_documents, 或在写入后执行 rebuild_search_index
+- 查询串同样切成二元组, 取其中最少见的两个词元求交得到候选, 再用 icontains 在候选集合上确认;
+  查询串不足两个字符时退回 icontains
+- 结果与数据库的 icontains 一致的前提是归一化不比排序规则更严: 数据库认为相同的两段文本, 词元也相同,
+  候选集合就不会漏掉 icontains 能匹配的行, 多出的候选由 icontains 排除。MySQL 的 *_general_ci 不区分大小写
+  与重音, 因此归一化也去掉重音; SQLite 的 icontains 只忽略 ASCII 大小写, 归一化更宽松, 同样一致。
+  例外是 general_ci 中一个字符对应多个字符的情况 (如 ß 与 ss 不相等, 而 ß 与 s 相等), 这类文本可能查不到
+"""
+import re
+import unicodedata
+
+from django.db import transaction
+from django.db.models import Case, Count, Q, Value, When
+from django.db.models.functions import Length
+from django.db.models.signals import post_delete, post_save
+
+from .models import Project, Epic, Kanban, Task, SearchIndexEntry
+
+_RUN_RE = re.compile(r'[^\W_]+')
+
+MAX_SELECTED_GRAMS = 2
+
+# 文档类型 -> (模型, 名称字段, 其余参与索引的字段, 所属项目字段)
+DOCUMENTS = {
+    SearchIndexEntry.DOC_TYPE_PROJECT: (Project, 'name', ('organization',), 'id'),
+    SearchIndexEntry.DOC_TYPE_EPIC: (Epic, 'name', (), 'project_id'),
+    SearchIndexEntry.DOC_TYPE_KANBAN: (Kanban, 'name', (), 'project_id'),
+    SearchIndexEntry.DOC_TYPE_TASK: (Task, 'name', ('note',), 'project_id'),
+}
+DOC_TYPE_NAMES = {
+    'project': SearchIndexEntry.DOC_TYPE_PROJECT,
+    'epic': SearchIndexEntry.DOC_TYPE_EPIC,
+    'kanban': SearchIndexEntry.DOC_TYPE_KANBAN,
+    'task': SearchIndexEntry.DOC_TYPE_TASK,
+}
+DOC_TYPE_KEYS = {value: key for key, value in DOC_TYPE_NAMES.items()}
+MODEL_DOC_TYPES = {model: doc_type for doc_type, (model, *_) in DOCUMENTS.items()}
+
+
+def normalize(text):
+    # NFKD 拆出重音符号后去掉, 再 NFKC 合并全角/兼容字符
+    decomposed = unicodedata.normalize('NFKD', text or '')
+    stripped = ''.join(char for char in decomposed if not unicodedata.combining(char))
+    return unicodedata.normalize('NFKC', stripped).lower()
+
+
+def text_grams(text):
+    """索引用: 所有片段的二元组, 单字符片段取单字"""
+    grams = set()
+    for run in _RUN_RE.findall(normalize(text)):
+        if len(run) == 1:
+            grams.add(run)
+        else:
+            grams.update(run[i:i + 2] for i in range(len(run) - 1))
+    return grams
+
+
+def query_grams(q):
+    """
+    查询用: 只取两个字符以上片段的二元组。单字符片段在文本中可能是更长片段的一部分,
+    索引里没有对应的单字, 交给 icontains 确认。
+    """
+    grams = set()
+    for run in _RUN_RE.findall(normalize(q)):
+        if len(run) > 1:
+            grams.update(run[i:i + 2] for i in range(len(run) - 1))
+    return grams
+
+
+def document_entries(doc_type, row):
+    """row 为包含 id、项目字段与各索引字段的 dict"""
+    model, name_field, other_fields, project_field = DOCUMENTS[doc_type]
+    name_grams = text_grams(row[name_field])
+    other_grams = set()
+    for field in other_fields:
+        other_grams |= text_grams(row[field])
+    return [
+        SearchIndexEntry(
+            gram=gram, doc_type=doc_type, doc_id=row['id'], project_id=row[project_field], in_name=gram in name_grams,
+        )
+        for gram in sorted(name_grams | other_grams)
+    ]
+
+
+def document_columns(doc_type):
+    model, name_field, other_fields, project_field = DOCUMENTS[doc_type]
+    return list(dict.fromkeys(('id', project_field, name_field) + other_fields))
+
+
+def index_document(instance):
+    index_documents([instance])
+
+
+def index_documents(instances):
+    """重建一批同一模型的文档的索引, 供 bulk_create/bulk_update 之后调用"""
+    if not instances:
+        return
+    doc_type = MODEL_DOC_TYPES[type(instances[0])]
+    columns = document_columns(doc_type)
+    entries = []
+    for instance in instances:
+        entries.extend(document_entries(doc_type, {column: getattr(instance, column) for column in columns}))
+    with transaction.atomic():
+        SearchIndexEntry.objects.filter(doc_type=doc_type, doc_id__in=[instance.pk for instance in instances]).delete()
+        SearchIndexEntry.objects.bulk_create(entries)
+
+
+def rebuild_index(doc_type, chunk_size=5000):
+    """按主键分段重建一种文档的索引, 返回处理的文档数"""
+    model = DOCUMENTS[doc_type][0]
+    columns = document_columns(doc_type)
+    SearchIndexEntry.objects.filter(doc_type=doc_type).delete()
+
+    count, last_id = 0, 0
+    while True:
+        rows = list(model.objects.filter(id__gt=last_id).order_by('id').values(*columns)[:chunk_size])
+        if not rows:
+            return count
+        entries = []
+        for row in rows:
+            entries.extend(document_entries(doc_type, row))
+        with transaction.atomic():
+            SearchIndexEntry.objects.bulk_create(entries, batch_size=chunk_size)
+        count += len(rows)
+        last_id = rows[-1]['id']
+
+
+def _entries(doc_type, project_id=None, name_only=False):
+    entries = SearchIndexEntry.objects.filter(doc_type=doc_type)
+    if project_id is not None:
+        entries = entries.filter(project_id=project_id)
+    if name_only:
+        entries = entries.filter(in_name=True)
+    return entries
+
+
+def select_grams(doc_type, grams, project_id=None, name_only=False):
+    """
+    取文档数最少的 MAX_SELECTED_GRAMS 个词元求候选: 结果最终由 icontains 确认, 少用几个词元只会多一些候选,
+    而常见词元 (如 "开发") 的倒排列表很长, 全部参与求交反而更慢。
+    各词元的文档数由一次 GROUP BY gram 查询得到, 走 (gram, doc_type, project_id, doc_id) 索引。
+    """
+    counts = dict(
+        _entries(doc_type, project_id, name_only).filter(gram__in=grams)
+        .values('gram').annotate(count=Count('id')).values_list('gram', 'count')
+    )
+    missing = sorted(set(grams) - set(counts))
+    if missing:
+        return missing[:1]
+    # 最少见的词元放在最内层子查询
+    return [gram for count, gram in sorted((count, gram) for gram, count in counts.items())[:MAX_SELECTED_GRAMS]]
+
+
+def candidate_ids(doc_type, grams, project_id=None, name_only=False):
+    """
+    同时包含 grams 中全部词元的文档ID (子查询)。
+    用嵌套 IN 求交而不是 GROUP BY doc_id HAVING COUNT, 后者会让优化器改走 (doc_type, doc_id) 索引扫描整类文档。
+    """
+    ids = _entries(doc_type, project_id, name_only).filter(gram=grams[0]).values('doc_id')
+    for gram in grams[1:]:
+        ids = _entries(doc_type, project_id, name_only).filter(gram=gram, doc_id__in=ids).values('doc_id')
+    return ids
+
+
+def contains_condition(doc_type, q, name_only=False):
+    model, name_field, other_fields, project_field = DOCUMENTS[doc_type]
+    condition = Q(**{f'{name_field}__icontains': q})
+    if not name_only:
+        for field in other_fields:
+            condition |= Q(**{f'{field}__icontains': q})
+    return condition
+
+
+def filter_queryset(queryset, q, name_only=False, project_id=None):
+    """等价于在名称 (及说明) 上 icontains, 有可用的词元时先用倒排索引缩小范围"""
+    doc_type = MODEL_DOC_TYPES[queryset.model]
+    grams = query_grams(q)
+    if grams:
+        grams = select_grams(doc_type, grams, project_id=project_id, name_only=name_only)
+        queryset = queryset.filter(pk__in=candidate_ids(doc_type, grams, project_id=project_id, name_only=name_only))
+    return queryset.filter(contains_condition(doc_type, q, name_only=name_only))
+
+
+def search(q, doc_types=None, project_id=None, limit=20):
+    """
+    返回 [{'type', 'type_name', 'id', 'name', 'project_id'}]。
+    排序: 名称包含查询串的在前, 其次名称越短越靠前 (越接近查询串), 最后按类型与ID。
+    """
+    results = []
+    for doc_type in doc_types or DOCUMENTS:
+        model, name_field, other_fields, project_field = DOCUMENTS[doc_type]
+        queryset = filter_queryset(model.objects.all(), q, project_id=project_id)
+        if project_id is not None:
+            queryset = queryset.filter(**{project_field: project_id})
+        queryset = queryset.annotate(
+            search_name_match=Case(When(**{f'{name_field}__icontains': q}, then=Value(0)), default=Value(1)),
+            search_name_length=Length(name_field),
+        ).order_by('search_name_match', 'search_name_length', 'id')
+
+        type_name = SearchIndexEntry(doc_type=doc_type).get_doc_type_display()
+        for row in queryset.values(*dict.fromkeys(('id', project_field, name_field, 'search_name_match')))[:limit]:
+            results.append({
+                'type': DOC_TYPE_KEYS[doc_type],
+                'type_name': type_name,
+                'id': row['id'],
+                'name': row[name_field],
+                'project_id': row[project_field],
+                'name_match': row['search_name_match'] == 0,
+            })
+
+    results.sort(key=lambda item: (not item['name_match'], len(item['name']), item['type'], item['id']))
+    return results[:limit]
+
+
+def on_document_saved(sender, instance, raw=False, update_fields=None, **kwargs):
+    if raw:
+        return
+    # 只更新了 rank/kanban 等字段时不需要重建
+    if update_fields is not None and not set(update_fields) & set(document_columns(MODEL_DOC_TYPES[sender])):
+        return
+    index_document(instance)
+
+
+def on_document_deleted(sender, instance, **kwargs):
+    SearchIndexEntry.objects.filter(doc_type=MODEL_DOC_TYPES[sender], doc_id=instance.pk).delete()
+
+
+# 按模型分别注册, 不带 sender 的接收器会让所有模型的级联删除都无法走快速删除
+for _model in MODEL_DOC_TYPES:
+    post_save.connect(on_document_saved, sender=_model, dispatch_uid=f'search_index_saved_{_model.__name__}')
+    post_delete.connect(on_document_deleted, sender=_model, dispatch_uid=f'search_index_deleted_{_model.__name__}')
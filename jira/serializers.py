@@ -1,14 +1,136 @@
 import logging
+import os
 
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models import Max, Q
+from django.utils import timezone
+from PIL import UnidentifiedImageError
 from rest_framework import serializers, exceptions
+from djangorestframework_camel_case.settings import api_settings as camel_case_settings
+from djangorestframework_camel_case.util import camel_to_underscore
 from rest_framework.request import Request
 
-from .models import AppImage, User, Project, ProjectUserSetting, Epic, Kanban, Task
+from .models import AppImage, User, Project, ProjectUserSetting, Epic, Kanban, Task, RANK_STEP, lock_rows, lock_task_scopes
+from . import blobs, search
+from .images import read_header
+from .ranking import rank_for_move, plan_moves
+from .signals import bulk_changed
 
 logger = logging.getLogger(__name__)
 
 
-class AppImageSerializer(serializers.ModelSerializer):
+def parse_field_paths(value):
+    """'id,createAt,project.name' -> {'id', 'create_at', 'project.name'}, 参数不存在时返回 None"""
+    if value is None:
+        return None
+    paths = set()
+    for item in value.split(','):
+        item = item.strip()
+        if item:
+            paths.add('.'.join(camel_to_underscore(part, **camel_case_settings.JSON_UNDERSCOREIZE) for part in item.split('.')))
+    return paths
+
+
+class FieldSpec:
+    """
+    请求参数 ?fields= 与 ?expand= 的解析结果, 均为逗号分隔、可用 . 表示嵌套的字段路径。
+
+    - fields: 只输出列出的字段, 如 fields=id,name,kanban.name; 嵌套对象未列出子字段时输出全部子字段
+    - expand: 只展开列出的嵌套对象, 如 expand=project,reporter.avatar; 不传时保持各接口的默认展开方式
+    """
+
+    def __init__(self, fields=None, expand=None):
+        self.fields = fields
+        self.expand = expand
+
+    @classmethod
+    def from_request(cls, request):
+        fields = parse_field_paths(request.query_params.get('fields'))
+        expand = parse_field_paths(request.query_params.get('expand'))
+        if fields is None and expand is None:
+            return None
+        if expand is not None:
+            # fields 中出现的嵌套路径以及 expand 路径的各级前缀都视为展开
+            nested = {path.rsplit('.', 1)[0] for path in (fields or ()) if '.' in path}
+            expand = {
+                '.'.join(path.split('.')[:i])
+                for path in expand | nested
+                for i in range(1, path.count('.') + 2)
+            }
+        return cls(fields, expand)
+
+    def keep(self, parent_path, name, nested):
+        """位于 parent_path 下的字段 name 是否需要输出"""
+        if self.fields is not None:
+            prefix = f'{parent_path}.' if parent_path else ''
+            wanted = {path[len(prefix):].split('.')[0] for path in self.fields if path.startswith(prefix)}
+            # 嵌套对象下没有列出子字段时输出全部子字段
+            if (not parent_path or wanted) and name not in wanted:
+                return False
+        if nested and self.expand is not None:
+            path = f'{parent_path}.{name}' if parent_path else name
+            if path not in self.expand:
+                return False
+        return True
+
+    def includes(self, path, nested=True):
+        """path (如 'project.person') 指向的字段是否会被输出, 用于决定是否需要 join/标注"""
+        parts = path.split('.')
+        for i, name in enumerate(parts):
+            is_nested = nested if i == len(parts) - 1 else True
+            if not self.keep('.'.join(parts[:i]), name, is_nested):
+                return False
+        return True
+
+
+class DynamicFieldsMixin:
+    """按 context['field_spec'] 裁剪字段, 未输出的嵌套序列化器不会被实例化访问, 也就不会触发查询"""
+
+    def get_field_path(self):
+        parts = []
+        node = self
+        while node is not None:
+            if node.field_name:
+                parts.append(node.field_name)
+            node = node.parent
+        return '.'.join(reversed(parts))
+
+    def get_fields(self):
+        fields = super().get_fields()
+        spec: FieldSpec = self.context.get('field_spec')
+        if spec is None:
+            return fields
+        path = self.get_field_path()
+        return {
+            name: field for name, field in fields.items()
+            if spec.keep(path, name, isinstance(field, serializers.BaseSerializer))
+        }
+
+
+class ImageVariantsField(serializers.Field):
+    """AppImage.variants 中的文件名转换为 URL: {边长: {格式: URL}}"""
+
+    def __init__(self, **kwargs):
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)
+
+    def to_representation(self, value):
+        request = self.context.get('request')
+        ret = {}
+        for size, formats in (value or {}).items():
+            ret[size] = {}
+            for format_name, name in formats.items():
+                url = default_storage.url(name)
+                ret[size][format_name] = request.build_absolute_uri(url) if request is not None else url
+        return ret
+
+
+class AppImageSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
+    # 不用 ImageField: 它会在请求中完整解码图片做校验, 这里只读取文件头, 解码交给 jira.images
+    img = serializers.FileField()
+    variants = ImageVariantsField()
+
     class Meta:
         model = AppImage
         fields = (
@@ -17,15 +139,46 @@ class AppImageSerializer(serializers.ModelSerializer):
             'height',
             'img',
             'desc',
+            'status',
+            'variants',
         )
         read_only_fields = (
             'id',
             'width',
             'height',
+            'status',
         )
 
+    def validate(self, attrs):
+        try:
+            image_format, attrs['width'], attrs['height'] = read_header(attrs['img'])
+        except (UnidentifiedImageError, OSError):
+            raise serializers.ValidationError({'msg': 'upload a valid image'})
+        attrs['status'] = AppImage.STATUS_PENDING
+        attrs['img_format'] = image_format
+        return attrs
+
+    def create(self, validated_data):
+        upload = validated_data['img']
+        ext = blobs.IMAGE_EXTENSIONS.get(validated_data.pop('img_format'))
+        if ext is None:
+            ext = os.path.splitext(upload.name)[1].lstrip('.').lower() or 'bin'
+        digest = blobs.file_sha256(upload)
+        validated_data['sha256'] = digest
+
+        done = AppImage.objects.filter(sha256=digest, status=AppImage.STATUS_READY).first()
+        if done is not None:
+            # 相同内容已处理过, 复用文件与缩略图, 不需要后台处理
+            validated_data.update(
+                img=done.img.name, width=done.width, height=done.height, variants=done.variants,
+                status=AppImage.STATUS_READY,
+            )
+        else:
+            validated_data['img'] = blobs.save_blob(upload, digest, ext)
+        return super().create(validated_data)
 
-class UserSerializer(serializers.ModelSerializer):
+
+class UserSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     username = serializers.CharField(min_length=5, max_length=20, required=True)
     avatar_id = serializers.CharField(required=False)
     email = serializers.EmailField(required=True)
@@ -83,11 +236,29 @@ class UserSerializer(serializers.ModelSerializer):
         )
 
 
-class ProjectSerializer(serializers.ModelSerializer):
+def copy_project_pin(instance):
+    """
+    把 annotate_pin(..., field_name='project_pin', project_field='project') 的标注结果
+    挂到已 select_related 的 project 上, 供嵌套的 ProjectSerializer.get_pin 使用。
+    """
+    if not hasattr(instance, 'project_pin'):
+        return
+    if type(instance).project.is_cached(instance):
+        instance.project.pin = instance.project_pin
+    if isinstance(instance, Task) and Task.epic.is_cached(instance):
+        epic = instance.epic
+        if epic is not None and epic.project_id == instance.project_id and Epic.project.is_cached(epic):
+            epic.project.pin = instance.project_pin
+
+
+class ProjectSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     person = UserSerializer(read_only=True)
     person_id = serializers.IntegerField(label='负责人ID')
     pin = serializers.SerializerMethodField()
 
+    # jira.compiled 快速路径中 pin 直接读取 annotate_pin 的标注
+    compiled_method_fields = {'pin': 'pin'}
+
     def get_pin(self, obj: Project):
         request = self.context.get('request')
         if request is None:
@@ -95,16 +266,20 @@ class ProjectSerializer(serializers.ModelSerializer):
         user: User = request.user
         if user.is_anonymous:
             return None
+        if hasattr(obj, 'pin'):
+            # 列表接口已通过 annotate_pin 标注, 无需再查询
+            return obj.pin
         project_user_setting = ProjectUserSetting.objects.filter(user=user, project=obj).first()
         if project_user_setting is None:
             return None
         return project_user_setting.is_pinned
 
-    def to_representation(self, instance):
-        ret = super().to_representation(instance)
+    def get_fields(self):
+        fields = super().get_fields()
         if self.context.get('project_no_person'):
-            del ret['person']
-        return ret
+            # 直接去掉字段, 而不是序列化之后再删除, 避免加载负责人
+            fields.pop('person', None)
+        return fields
 
     class Meta:
         model = Project
@@ -132,15 +307,39 @@ class ProjectTogglePinSerializer(serializers.Serializer):
     new_val = serializers.BooleanField(label='是否收藏')
 
 
-class EpicSerializer(serializers.ModelSerializer):
+class SearchParamsSerializer(serializers.Serializer):
+    q = serializers.CharField(label='查询串', max_length=191)
+    type = serializers.CharField(label='类型, 逗号分隔: project,epic,kanban,task', required=False)
+    project_id = serializers.IntegerField(label='项目ID', required=False)
+    limit = serializers.IntegerField(label='返回条数', min_value=1, max_value=100, default=20)
+
+    def validate_type(self, value):
+        names = [item.strip() for item in value.split(',') if item.strip()]
+        unknown = [name for name in names if name not in search.DOC_TYPE_NAMES]
+        if unknown:
+            raise serializers.ValidationError(f'unknown type: {",".join(unknown)}')
+        return [search.DOC_TYPE_NAMES[name] for name in names]
+
+
+class ChangeFeedParamsSerializer(serializers.Serializer):
+    since = serializers.IntegerField(label='游标, 为上一次返回的 cursor; 不传时只返回当前游标', min_value=0, required=False)
+    project_id = serializers.IntegerField(label='项目ID', required=False)
+    limit = serializers.IntegerField(label='返回条数', min_value=1, max_value=1000, default=500)
+
+
+class EpicSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     project = ProjectSerializer(read_only=True)
     project_id = serializers.IntegerField(label='项目ID')
 
-    def to_representation(self, instance):
-        ret = super().to_representation(instance)
+    def get_fields(self):
+        fields = super().get_fields()
         if self.context.get('epic_no_project'):
-            del ret['project']
-        return ret
+            fields.pop('project', None)
+        return fields
+
+    def to_representation(self, instance):
+        copy_project_pin(instance)
+        return super().to_representation(instance)
 
     class Meta:
         model = Epic
@@ -162,7 +361,7 @@ class EpicSerializer(serializers.ModelSerializer):
         )
 
 
-class KanbanSerializer(serializers.ModelSerializer):
+class KanbanSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     project_id = serializers.IntegerField(label='项目ID')
 
     class Meta:
@@ -184,7 +383,22 @@ class KanbanSerializer(serializers.ModelSerializer):
         )
 
 
-class TaskSerializer(serializers.ModelSerializer):
+def _lock_destination_scopes(changes):
+    """changes 为 [(任务, 要写入的字段)]; 任务将移入其他看板/项目时锁住目标范围, 见 lock_task_scopes"""
+    kanban_ids, project_ids = set(), set()
+    for task, data in changes:
+        kanban_id = data.get('kanban_id', task.kanban_id)
+        project_id = data.get('project_id', task.project_id)
+        if (kanban_id, project_id) == (task.kanban_id, task.project_id):
+            continue
+        if kanban_id is not None:
+            kanban_ids.add(kanban_id)
+        else:
+            project_ids.add(project_id)
+    lock_task_scopes(kanban_ids, project_ids)
+
+
+class TaskSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     reporter = UserSerializer(read_only=True)
     processor = UserSerializer(read_only=True)
     project = ProjectSerializer(read_only=True)
@@ -198,15 +412,22 @@ class TaskSerializer(serializers.ModelSerializer):
     kanban_id = serializers.IntegerField(label='看板ID', required=False, allow_null=True)
     type_id = serializers.IntegerField(label="类型ID", default=1)
 
+    def to_representation(self, instance):
+        copy_project_pin(instance)
+        return super().to_representation(instance)
+
+    def update(self, instance, validated_data):
+        with transaction.atomic():
+            _lock_destination_scopes([(instance, validated_data)])
+            return super().update(instance, validated_data)
+
     def create(self, validated_data):
-        task: Task = super().create(validated_data)
         request: Request = self.context.get('request')
-
+        # 报告人随 INSERT 一起写入, 不再单独 save 一次
         if request is not None and not request.user.is_anonymous:
-            task.reporter = request.user
-            task.save()
-
-        return task
+            validated_data.pop('reporter_id', None)
+            validated_data['reporter'] = request.user
+        return super().create(validated_data)
 
     class Meta:
         model = Task
@@ -242,6 +463,333 @@ class TaskSerializer(serializers.ModelSerializer):
         )
 
 
+class BoardTaskSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
+    """看板快照中的任务, 关联对象只输出 ID, 由快照顶层的 epics/users 提供详情"""
+
+    class Meta:
+        model = Task
+        fields = (
+            'id',
+            'name',
+            'reporter_id',
+            'processor_id',
+            'project_id',
+            'epic_id',
+            'kanban_id',
+            'type_id',
+            'note',
+            'rank',
+            'create_at',
+            'update_at',
+        )
+        read_only_fields = fields
+
+
+# 一次批量写入最多允许的任务数 (新建 + 修改 + 删除)
+MAX_BULK_TASKS = 500
+
+
+class TaskBulkUpdateItemSerializer(TaskSerializer):
+    id = serializers.IntegerField(label='任务ID')
+
+
+class TaskBulkSerializer(serializers.Serializer):
+    """
+    批量新建/修改/删除任务: {"create": [...], "update": [{"id": 1, "name": "..."}], "delete": [1, 2]}
+
+    - 每一项按 TaskSerializer 校验 (修改为部分字段), 引用的任务/项目/看板/任务组/用户每种只查询一次,
+      任一项不合法时整体不写入, 错误按下标返回
+    - 新建的任务按看板 (无看板时按项目) 分组, 锁住父记录后每种范围只取一次最大 rank, 在内存中依次分配
+    - 在一个事务内 delete -> bulk_update -> bulk_create; bulk 写入不触发 post_save,
+      之后发送 bulk_changed 并更新搜索索引
+    """
+    create = serializers.ListField(child=serializers.DictField(), required=False, default=list)
+    update = serializers.ListField(child=serializers.DictField(), required=False, default=list)
+    delete = serializers.ListField(child=serializers.IntegerField(), required=False, default=list)
+
+    def _validate_items(self, serializer_class, items, partial):
+        context = {'request': self.context.get('request')}
+        validated, errors = [], []
+        for item in items:
+            serializer = serializer_class(data=item, partial=partial, context=context)
+            if not serializer.is_valid():
+                validated.append(None)
+                errors.append(serializer.errors)
+            elif partial and 'id' not in serializer.validated_data:
+                validated.append(None)
+                errors.append({'id': ['This field is required.']})
+            else:
+                validated.append(dict(serializer.validated_data))
+                errors.append({})
+        return validated, errors if any(errors) else None
+
+    @staticmethod
+    def _check_references(creates, updates, deletes):
+        """返回错误信息列表"""
+        task_ids = {item['id'] for item in updates}.union(deletes)
+        tasks = {row['id']: row for row in Task.objects.filter(pk__in=task_ids).values('id', 'project_id', 'kanban_id', 'epic_id')}
+        missing = task_ids.difference(tasks)
+        if missing:
+            return [f'taskId is invalid, taskId={sorted(missing)}']
+
+        # 修改后的最终状态: 未修改的字段取原值
+        items = [('create', i, item) for i, item in enumerate(creates)]
+        items += [('update', i, {**tasks[item['id']], **item}) for i, item in enumerate(updates)]
+
+        def ids(field):
+            return {item[field] for _, _, item in items if item.get(field) is not None}
+
+        projects = set(Project.objects.filter(pk__in=ids('project_id')).values_list('id', flat=True))
+        kanbans = dict(Kanban.objects.filter(pk__in=ids('kanban_id')).values_list('id', 'project_id'))
+        epics = dict(Epic.objects.filter(pk__in=ids('epic_id')).values_list('id', 'project_id'))
+        users = set(User.objects.filter(pk__in=ids('processor_id') | ids('reporter_id')).values_list('id', flat=True))
+
+        errors = []
+        for op, i, item in items:
+            project_id = item['project_id']
+            if project_id not in projects:
+                errors.append(f'{op}[{i}].projectId is invalid, projectId={project_id}')
+            for field, name, parents in (('kanban_id', 'kanbanId', kanbans), ('epic_id', 'epicId', epics)):
+                value = item.get(field)
+                if value is not None and parents.get(value) != project_id:
+                    errors.append(f'{op}[{i}].{name} is invalid, {name}={value}, projectId={project_id}')
+            for field, name in (('processor_id', 'processorId'), ('reporter_id', 'reporterId')):
+                value = item.get(field)
+                if value is not None and value not in users:
+                    errors.append(f'{op}[{i}].{name} is invalid, {name}={value}')
+        return errors
+
+    def validate(self, attrs):
+        total = len(attrs['create']) + len(attrs['update']) + len(attrs['delete'])
+        if total == 0:
+            raise serializers.ValidationError({'msg': 'create, update or delete is required!'})
+        if total > MAX_BULK_TASKS:
+            raise serializers.ValidationError({'msg': f'too many items, max={MAX_BULK_TASKS}'})
+
+        creates, create_errors = self._validate_items(TaskSerializer, attrs['create'], partial=False)
+        updates, update_errors = self._validate_items(TaskBulkUpdateItemSerializer, attrs['update'], partial=True)
+        if create_errors or update_errors:
+            errors = {'msg': 'invalid items'}
+            if create_errors:
+                errors['create'] = create_errors
+            if update_errors:
+                errors['update'] = update_errors
+            raise serializers.ValidationError(errors)
+
+        update_ids = [item['id'] for item in updates]
+        if len(set(update_ids)) != len(update_ids) or len(set(attrs['delete'])) != len(attrs['delete']):
+            raise serializers.ValidationError({'msg': 'duplicate task id'})
+        if set(update_ids) & set(attrs['delete']):
+            raise serializers.ValidationError({'msg': 'a task cannot be both updated and deleted'})
+
+        errors = self._check_references(creates, updates, attrs['delete'])
+        if errors:
+            raise serializers.ValidationError({'msg': '; '.join(errors)})
+
+        return {'create': creates, 'update': updates, 'delete': attrs['delete']}
+
+    @staticmethod
+    def _rank_scope(task):
+        return ('kanban', task.kanban_id) if task.kanban_id is not None else ('project', task.project_id)
+
+    def _allocate_ranks(self, tasks):
+        """与 Task.save 的分配规则一致: 追加到所在看板 (无看板时为项目) 的末尾"""
+        kanban_ids = {task.kanban_id for task in tasks if task.kanban_id is not None}
+        project_ids = {task.project_id for task in tasks if task.kanban_id is None}
+        lock_task_scopes(kanban_ids, project_ids)
+
+        rank_max = {}
+        if kanban_ids:
+            rows = Task.objects.filter(kanban_id__in=kanban_ids).values('kanban_id').annotate(rank_max=Max('rank'))
+            rank_max.update((('kanban', row['kanban_id']), row['rank_max']) for row in rows.order_by())
+        if project_ids:
+            rows = Task.objects.filter(project_id__in=project_ids, kanban__isnull=True).values('project_id').annotate(
+                rank_max=Max('rank'),
+            )
+            rank_max.update((('project', row['project_id']), row['rank_max']) for row in rows.order_by())
+
+        for task in tasks:
+            scope = self._rank_scope(task)
+            current = rank_max.get(scope)
+            task.rank = 1.0 if current is None else current + RANK_STEP
+            rank_max[scope] = task.rank
+
+    def _recover_ids(self, tasks, id_floor):
+        """
+        MySQL 的 bulk_create 不返回自增主键。新建前已锁住各范围 (lock_task_scopes), 持锁期间只有本次插入的行
+        会进入这些范围, 因此范围内主键大于插入前最大主键 id_floor 的行就是本次插入的行;
+        同一条 INSERT 中自增主键按行的顺序递增, 按主键排序后与插入顺序一一对应。
+        """
+        scopes = {}
+        for task in tasks:
+            scopes.setdefault(self._rank_scope(task), []).append(task)
+        condition = Q()
+        for kind, scope_id in scopes:
+            if kind == 'kanban':
+                condition |= Q(kanban_id=scope_id)
+            else:
+                condition |= Q(project_id=scope_id, kanban__isnull=True)
+        inserted = {}
+        rows = Task.objects.filter(condition, id__gt=id_floor).order_by('id').values_list('id', 'project_id', 'kanban_id')
+        for pk, project_id, kanban_id in rows:
+            scope = ('kanban', kanban_id) if kanban_id is not None else ('project', project_id)
+            inserted.setdefault(scope, []).append(pk)
+        for scope, scope_tasks in scopes.items():
+            pks = inserted.get(scope, [])
+            if len(pks) != len(scope_tasks):
+                raise RuntimeError(f'cannot recover ids of bulk created tasks, scope={scope}')
+            for task, pk in zip(scope_tasks, pks):
+                task.pk = pk
+
+    def _create(self, items, user):
+        tasks = []
+        for item in items:
+            if user is not None and not user.is_anonymous:
+                # 与 TaskSerializer.create 一致, 报告人为当前用户
+                item['reporter_id'] = user.id
+            tasks.append(Task(**item))
+        self._allocate_ranks(tasks)
+        id_floor = Task.objects.aggregate(Max('id'))['id__max'] or 0
+        Task.objects.bulk_create(tasks)
+        if tasks[0].pk is None:
+            self._recover_ids(tasks, id_floor)
+        search.index_documents(tasks)
+        bulk_changed.send(sender=Task, pks=[task.pk for task in tasks], action='create')
+        return tasks
+
+    @staticmethod
+    def _update(items):
+        tasks = Task.objects.select_for_update().in_bulk([item['id'] for item in items])
+        _lock_destination_scopes([(tasks[item['id']], item) for item in items])
+        previous = {task.pk: task.project_id for task in tasks.values()}
+        now = timezone.now()
+        fields = set()
+        for item in items:
+            task = tasks[item['id']]
+            for field, value in item.items():
+                if field != 'id':
+                    setattr(task, field, value)
+                    fields.add(field)
+            task.update_at = now
+        changed = [tasks[item['id']] for item in items]
+        Task.objects.bulk_update(changed, sorted(fields) + ['update_at'])
+        if fields & {'name', 'note', 'project_id'}:
+            search.index_documents(changed)
+        # 移到其他项目的任务, 原项目同样涉及
+        moved = {task.pk: previous[task.pk] for task in changed if task.project_id != previous[task.pk]}
+        project_ids = set(previous.values()) | {task.project_id for task in changed}
+        bulk_changed.send(
+            sender=Task, pks=[task.pk for task in changed], project_ids=project_ids, action='update', moved=moved,
+        )
+        return changed
+
+    def write(self, validated_data, user):
+        """返回每一项的结果: 新建与修改后的任务 (按请求中的顺序) 及删除的任务ID"""
+        created, updated = [], []
+        with transaction.atomic():
+            if validated_data['delete']:
+                # 逐行触发 post_delete, 事件/响应缓存/变更记录/搜索索引随之更新
+                Task.objects.filter(pk__in=validated_data['delete']).delete()
+            if validated_data['update']:
+                updated = self._update(validated_data['update'])
+            if validated_data['create']:
+                created = self._create(validated_data['create'], user)
+        return {
+            'create': BoardTaskSerializer(created, many=True, context=self.context).data,
+            'update': BoardTaskSerializer(updated, many=True, context=self.context).data,
+            'delete': validated_data['delete'],
+        }
+
+
+# 一次批量排序最多允许的移动次数
+MAX_BATCH_MOVES = 500
+
+
+# noinspection PyAbstractClass
+class SortParamsListSerializer(serializers.ListSerializer):
+    """
+    批量排序: 整个列表只校验一次, 在内存中依次执行每个移动并计算 rank,
+    最后在一个事务内用一次 bulk_update 写回。
+    """
+
+    def validate(self, attrs):
+        if len(attrs) > MAX_BATCH_MOVES:
+            raise serializers.ValidationError({'msg': f'too many moves, max={MAX_BATCH_MOVES}'})
+        return attrs
+
+    @staticmethod
+    def _apply(model, lists, moves, scope_attr, fields):
+        try:
+            changed = plan_moves(lists, moves, scope_attr)
+        except ValueError as e:
+            raise serializers.ValidationError({'msg': str(e)})
+
+        now = timezone.now()
+        for obj in changed:
+            obj.update_at = now
+        model.objects.bulk_update(changed, fields)
+        bulk_changed.send(sender=model, pks=[obj.pk for obj in changed])
+        return changed
+
+    def sort_kanbans(self, validated_data):
+        kanban_ids = set()
+        for item in validated_data:
+            if item['reference_id'] is None:
+                raise serializers.ValidationError({'msg': 'referenceId is required!'})
+            kanban_ids.update((item['from_id'], item['reference_id']))
+
+        project_ids = set(Kanban.objects.filter(pk__in=kanban_ids).values_list('project_id', flat=True))
+
+        with transaction.atomic():
+            lock_rows(Project.objects.filter(pk__in=project_ids))
+            lists = {project_id: [] for project_id in project_ids}
+            kanbans = Kanban.objects.filter(project_id__in=project_ids).order_by('project_id', 'rank', 'id')
+            for kanban in kanbans.only('id', 'project_id', 'rank'):
+                lists[kanban.project_id].append(kanban)
+
+            index = {kanban.pk: kanban for kanbans in lists.values() for kanban in kanbans}
+            moves = []
+            for item in validated_data:
+                kanban_from = index.get(item['from_id'])
+                reference = index.get(item['reference_id'])
+                if kanban_from is None or reference is None or kanban_from.project_id != reference.project_id:
+                    raise serializers.ValidationError({
+                        'msg': f'fromId/referenceId is invalid, fromId={item["from_id"]}, referenceId={item["reference_id"]}'
+                    })
+                moves.append((kanban_from.pk, reference.project_id, reference.pk, item['type']))
+
+            return self._apply(Kanban, lists, moves, 'project_id', ('rank', 'update_at'))
+
+    def sort_tasks(self, validated_data):
+        task_ids = set()
+        kanban_ids = set()
+        for item in validated_data:
+            if item['from_kanban_id'] is None or item['to_kanban_id'] is None:
+                raise serializers.ValidationError({'msg': 'fromKanbanId, toKanbanId is required!'})
+            task_ids.add(item['from_id'])
+            if item['reference_id'] is not None:
+                task_ids.add(item['reference_id'])
+            kanban_ids.update((item['from_kanban_id'], item['to_kanban_id']))
+
+        kanban_ids.update(Task.objects.filter(pk__in=task_ids, kanban__isnull=False).values_list('kanban_id', flat=True))
+
+        with transaction.atomic():
+            locked_ids = lock_rows(Kanban.objects.filter(pk__in=kanban_ids))
+            missing = kanban_ids.difference(locked_ids)
+            if missing:
+                raise serializers.ValidationError({'msg': f'kanbanId is invalid, kanbanId={sorted(missing)}'})
+
+            lists = {kanban_id: [] for kanban_id in locked_ids}
+            tasks = Task.objects.filter(kanban_id__in=locked_ids).order_by('kanban_id', 'rank', 'id')
+            for task in tasks.only('id', 'kanban_id', 'rank'):
+                lists[task.kanban_id].append(task)
+            # 尚未放入看板的任务只参与移出, 不重新计算其余无看板任务的 rank
+            lists[None] = list(Task.objects.filter(pk__in=task_ids, kanban__isnull=True).only('id', 'kanban_id', 'rank'))
+
+            moves = [(item['from_id'], item['to_kanban_id'], item['reference_id'], item['type']) for item in validated_data]
+            return self._apply(Task, lists, moves, 'kanban_id', ('kanban', 'rank', 'update_at'))
+
+
 # noinspection PyAbstractClass
 class SortParamsSerializer(serializers.Serializer):
     from_id = serializers.IntegerField(required=True, label='要重新排序的 itemID')
@@ -251,6 +799,9 @@ class SortParamsSerializer(serializers.Serializer):
     from_kanban_id = serializers.IntegerField(required=False, label="移动task时的源kanbanID", allow_null=True, default=None)
     to_kanban_id = serializers.IntegerField(required=False, label="移动task时的目标kanbanID", allow_null=True, default=None)
 
+    class Meta:
+        list_serializer_class = SortParamsListSerializer
+
     def sort_kanban(self, validated_data):
         from_id = validated_data['from_id']
         reference_id = validated_data['reference_id']
@@ -263,27 +814,15 @@ class SortParamsSerializer(serializers.Serializer):
 
         kanban_to = Kanban.objects.get(pk=reference_id)
 
-        if type == 'before':
-            hi = kanban_to.rank
-            kanban_to_before = Kanban.objects.filter(rank__lt=kanban_to.rank).first()
-            if kanban_to_before is None:
-                lo = hi - 100.0
-            else:
-                lo = kanban_to_before.rank
-            new_rank = float(lo + hi) / 2
-        elif type == 'after':
-            lo = kanban_to.rank
-            kanban_to_after = Kanban.objects.filter(rank__gt=kanban_to.rank).first()
-            if kanban_to_after is None:
-                hi = lo + 100.0
-            else:
-                hi = kanban_to_after.rank
-            new_rank = float(lo + hi) / 2
-        else:
+        if type not in ('before', 'after'):
             raise serializers.ValidationError({'msg': 'type is invalid'})
 
-        kanban_from.rank = new_rank
-        kanban_from.save()
+        with transaction.atomic():
+            lock_rows(Project.objects.filter(pk=kanban_to.project_id))
+            new_rank = rank_for_move(Kanban.objects.filter(project_id=kanban_to.project_id), kanban_to, type, kanban_from.pk)
+
+            kanban_from.rank = new_rank
+            kanban_from.save(update_fields=('rank', 'update_at'))
 
         return kanban_from
 
@@ -309,31 +848,23 @@ class SortParamsSerializer(serializers.Serializer):
 
         task_from = Task.objects.get(pk=from_id)
 
-        if reference_id is None:
-            new_rank = 100
-        else:
-            task_to = Task.objects.get(pk=reference_id)
-            if type == 'before':
-                hi = task_to.rank
-                task_to_before = Task.objects.filter(rank__lt=task_to.rank, kanban=task_to.kanban).first()
-                if task_to_before is None:
-                    lo = hi - 100.0
-                else:
-                    lo = task_to_before.rank
-                new_rank = float(lo + hi) / 2
-            elif type == 'after':
-                lo = task_to.rank
-                task_to_after = Task.objects.filter(rank__gt=task_to.rank, kanban=task_to.kanban).first()
-                if task_to_after is None:
-                    hi = lo + 100.0
-                else:
-                    hi = task_to_after.rank
-                new_rank = float(lo + hi) / 2
+        with transaction.atomic():
+            lock_rows(Kanban.objects.filter(pk=kanban_to.pk))
+            if reference_id is None:
+                new_rank = 100
             else:
-                raise serializers.ValidationError({'msg': 'type is invalid'})
-
-        task_from.kanban = kanban_to
-        task_from.rank = new_rank
-        task_from.save()
+                task_to = Task.objects.get(pk=reference_id)
+                if type not in ('before', 'after'):
+                    raise serializers.ValidationError({'msg': 'type is invalid'})
+                # 只锁了目标看板, 参照任务必须在目标看板中, 否则排序值会按另一个看板计算
+                if task_to.kanban_id != kanban_to.pk:
+                    raise serializers.ValidationError(
+                        {'msg': f'referenceId is not in toKanbanId, referenceId={reference_id}, toKanbanId={to_kanban_id}'}
+                    )
+                new_rank = rank_for_move(Task.objects.filter(kanban_id=kanban_to.pk), task_to, type, task_from.pk)
+
+            task_from.kanban = kanban_to
+            task_from.rank = new_rank
+            task_from.save(update_fields=('kanban', 'rank', 'update_at'))
 
         return task_from
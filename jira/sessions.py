@@ -0,0 +1,90 @@
+"""
+缓存 + 数据库延迟写入的会话后端 (SESSION_MODE=write_behind)。
+
+读取与 cached_db 相同: 先读缓存, 未命中再读 django_session 并回填缓存。
+写入时只同步写缓存, 数据库的写入交给后台线程合并执行, 同一个会话在写入前多次修改只落库一次。
+新建会话 (需要保证 session_key 唯一) 与删除会话 (避免缓存未命中时从数据库读回) 仍同步写数据库。
+进程退出前会尽量写完队列; 意外退出时最多丢失缓存中尚未落库的修改。
+"""
+import atexit
+import logging
+import threading
+
+from django.contrib.sessions.backends import cached_db
+from django.db import close_old_connections
+
+logger = logging.getLogger(__name__)
+
+
+class WriteBehindQueue:
+    def __init__(self):
+        self._pending = {}
+        self._cond = threading.Condition()
+        self._thread = None
+        self._busy = False
+
+    def put(self, store):
+        with self._cond:
+            self._pending[store.session_key] = store
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='session-write-behind', daemon=True)
+                self._thread.start()
+            self._cond.notify()
+
+    def discard(self, session_key):
+        with self._cond:
+            self._pending.pop(session_key, None)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._pending:
+                    self._cond.wait()
+                batch, self._pending = self._pending, {}
+                self._busy = True
+            try:
+                self._write(batch)
+            finally:
+                with self._cond:
+                    self._busy = False
+                    self._cond.notify_all()
+
+    @staticmethod
+    def _write(batch):
+        close_old_connections()
+        for store in batch.values():
+            try:
+                store.save_to_db()
+            except Exception:
+                logger.exception('write-behind session save failed, session_key=%s', store.session_key)
+        close_old_connections()
+
+    def flush(self, timeout=None):
+        """等待队列中的会话全部写入数据库"""
+        with self._cond:
+            return self._cond.wait_for(lambda: not self._pending and not self._busy, timeout)
+
+
+write_behind_queue = WriteBehindQueue()
+atexit.register(write_behind_queue.flush, 5)
+
+
+class SessionStore(cached_db.SessionStore):
+    cache_key_prefix = 'jira.sessions.write_behind'
+
+    def save(self, must_create=False):
+        if must_create or self.session_key is None:
+            return super().save(must_create)
+        data = self._get_session()
+        self._cache.set(self.cache_key, data, self.get_expiry_age())
+        # 后台线程中使用的是数据快照
+        snapshot = self.__class__(self.session_key)
+        snapshot._session_cache = dict(data)
+        write_behind_queue.put(snapshot)
+
+    def save_to_db(self):
+        cached_db.DBStore.save(self)
+
+    def delete(self, session_key=None):
+        write_behind_queue.discard(session_key or self.session_key)
+        super().delete(session_key)
@@ -0,0 +1,7 @@
+from django.dispatch import Signal
+
+# bulk_create/bulk_update/queryset.update 不会触发 post_save, 批量写入方在写入后发送该信号。
+# sender 为模型类; 参数 pks 为写入的主键列表, project_ids 为涉及的项目ID (不传时由接收方根据 pks 查询),
+# action 为 'create'/'update' 表示新建/修改了任意字段, 不传时表示只调整了排序 (rank/看板)
+# moved 为 {主键: 原项目ID}, 只包含移到其他项目的对象; 接收方据此通知原项目该对象已移出
+bulk_changed = Signal()
@@ -0,0 +1,109 @@
+"""
+/api/v1/projects/{id}/events: 以 Server-Sent Events 推送项目的变更事件 (jira.events)。
+
+直接实现为 ASGI 应用, 由 jira_backend.asgi 按路径分发, 不经过 Django 的请求处理:
+每个连接只占用一个协程与一个有界队列, 不占用线程与数据库连接, 大量空闲连接的开销很小。
+连接建立后先发送 ready 事件, 客户端收到后 (包括断线重连后) 拉取一次看板, 之后按事件增量更新;
+每 EVENTS_HEARTBEAT 秒发送一行注释保持连接, 以免被代理断开。
+与列表接口相同, 匿名用户也可以订阅。
+"""
+import asyncio
+import json
+import re
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+
+from .events import channel_name, get_broker
+from .models import Project
+
+EVENTS_PATH_RE = re.compile(r'^/api/v1/projects/(?P<project_id>\d+)/events/?$')
+
+# 客户端断线后的重连间隔 (毫秒)
+RETRY_MS = 3000
+
+HEARTBEAT = b': ping\n\n'
+
+
+def format_event(message):
+    return f'event: {message["event"]}\ndata: {message["data"]}\n\n'.encode('utf-8')
+
+
+def _project_exists(project_id):
+    close_old_connections()
+    try:
+        return Project.objects.filter(pk=project_id).exists()
+    finally:
+        close_old_connections()
+
+
+async def send_json(send, status, data):
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [(b'content-type', b'application/json')],
+    })
+    await send({'type': 'http.response.body', 'body': json.dumps(data).encode('utf-8')})
+
+
+async def wait_disconnect(receive):
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            return
+
+
+async def event_stream(scope, receive, send, project_id):
+    if scope['method'] != 'GET':
+        return await send_json(send, 405, {'msg': 'method not allowed'})
+    if not await sync_to_async(_project_exists)(project_id):
+        return await send_json(send, 404, {'msg': 'project not found'})
+
+    await send({
+        'type': 'http.response.start',
+        'status': 200,
+        'headers': [
+            (b'content-type', b'text/event-stream; charset=utf-8'),
+            (b'cache-control', b'no-cache'),
+            # nginx 默认会缓冲响应
+            (b'x-accel-buffering', b'no'),
+        ],
+    })
+
+    subscription = get_broker().subscribe(channel_name(project_id))
+    disconnect = asyncio.ensure_future(wait_disconnect(receive))
+    next_message = asyncio.ensure_future(subscription.get())
+    try:
+        ready = format_event({'event': 'ready', 'data': json.dumps({'projectId': project_id})})
+        await send({'type': 'http.response.body', 'body': f'retry: {RETRY_MS}\n'.encode() + ready, 'more_body': True})
+        while True:
+            done, _ = await asyncio.wait(
+                {next_message, disconnect}, timeout=settings.EVENTS_HEARTBEAT, return_when=asyncio.FIRST_COMPLETED,
+            )
+            if disconnect in done:
+                break
+            if next_message in done:
+                body = format_event(next_message.result())
+                next_message = asyncio.ensure_future(subscription.get())
+            else:
+                body = HEARTBEAT
+            await send({'type': 'http.response.body', 'body': body, 'more_body': True})
+    finally:
+        subscription.close()
+        next_message.cancel()
+        disconnect.cancel()
+
+
+class EventStreamRouter:
+    """事件流路径交给 event_stream, 其余请求交给 Django"""
+
+    def __init__(self, application):
+        self.application = application
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'http':
+            match = EVENTS_PATH_RE.match(scope['path'])
+            if match:
+                return await event_stream(scope, receive, send, int(match['project_id']))
+        return await self.application(scope, receive, send)
@@ -0,0 +1,82 @@
+"""
+容器启动时的 migrate / collectstatic 判断 (bootstrap.py)。
+
+- 迁移: 由磁盘上的迁移文件构建迁移图, 与数据库 django_migrations 中已执行的记录对比,
+  没有待执行的迁移时跳过 migrate (也就跳过了 post_migrate 中 contenttypes/permissions 的同步)。
+  迁移图的指纹只用于日志, 判断以数据库为准: 同一个数据库可能被其他实例或手工迁移过。
+- 静态文件: 对 finders 找到的全部源文件 (相对路径与内容) 及 STATICFILES_STORAGE 计算指纹,
+  与上次 collectstatic 后写在 STATIC_ROOT 下的指纹相同时跳过。
+"""
+import hashlib
+import os
+
+from django.conf import settings
+from django.contrib.staticfiles.finders import get_finders
+from django.core.management import call_command
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.migrations.executor import MigrationExecutor
+
+STATIC_FINGERPRINT_FILE = '.collectstatic.sha256'
+# 与 collectstatic 默认的 ignore_patterns 一致
+STATIC_IGNORE_PATTERNS = ['CVS', '.*', '*~']
+
+
+def migration_graph_fingerprint(loader):
+    sha256 = hashlib.sha256()
+    for app_label, name in sorted(loader.graph.nodes):
+        sha256.update(f'{app_label}.{name}\n'.encode())
+    return sha256.hexdigest()
+
+
+def pending_migrations(database=DEFAULT_DB_ALIAS):
+    """返回 (迁移图指纹, 待执行的迁移列表)"""
+    executor = MigrationExecutor(connections[database])
+    targets = executor.loader.graph.leaf_nodes()
+    plan = executor.migration_plan(targets)
+    return migration_graph_fingerprint(executor.loader), [migration for migration, backwards in plan]
+
+
+def migrate_if_needed(database=DEFAULT_DB_ALIAS, force=False, **options):
+    """有待执行的迁移 (或 force) 时执行 migrate, 返回 (是否执行, 迁移图指纹, 待执行的迁移数)"""
+    fingerprint, pending = pending_migrations(database)
+    if not pending and not force:
+        return False, fingerprint, 0
+    call_command('migrate', database=database, interactive=False, **options)
+    return True, fingerprint, len(pending)
+
+
+def static_fingerprint():
+    sha256 = hashlib.sha256()
+    sha256.update(settings.STATICFILES_STORAGE.encode())
+    files = {}
+    for finder in get_finders():
+        for path, storage in finder.list(STATIC_IGNORE_PATTERNS):
+            prefixed = os.path.join(getattr(storage, 'prefix', None) or '', path)
+            # 与 collectstatic 一致, 同名文件以先找到的为准
+            files.setdefault(prefixed, (storage, path))
+    for prefixed in sorted(files):
+        storage, path = files[prefixed]
+        sha256.update(prefixed.encode() + b'\0')
+        with storage.open(path) as file:
+            for chunk in iter(lambda: file.read(64 * 1024), b''):
+                sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+def _fingerprint_path():
+    return os.path.join(str(settings.STATIC_ROOT), STATIC_FINGERPRINT_FILE)
+
+
+def collectstatic_if_needed(force=False, **options):
+    """静态文件有变化 (或 force) 时执行 collectstatic, 返回 (是否执行, 指纹)"""
+    fingerprint = static_fingerprint()
+    path = _fingerprint_path()
+    if not force and os.path.exists(path):
+        with open(path) as file:
+            if file.read().strip() == fingerprint:
+                return False, fingerprint
+    call_command('collectstatic', interactive=False, **options)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w') as file:
+        file.write(fingerprint)
+    return True, fingerprint
@@ -4,7 +4,7 @@ import os
 from pprint import pprint
 from random import shuffle
 
-from django.test import TestCase
+from django.test import TestCase, TransactionTestCase
 from django.urls import reverse
 from rest_framework.test import APITestCase
 
@@ -19,6 +19,29 @@ class TestGenMockData(TestCase):
         tasks_json = json.dumps(TaskSerializer(ret['tasks'], many=True).data, indent=2, ensure_ascii=False)
         print(tasks_json)
 
+    def test_gen_scaled(self):
+        from django.contrib.auth import authenticate
+        from .generate_mock_data import generate_scaled_data, MOCK_USER_PASS
+        from .models import Kanban, Task, ProjectUserSetting
+        from .ranking import rank_gap_health
+        from .search import filter_queryset
+
+        counts = generate_scaled_data(users=3, projects=4, tasks_per_project=30, pins=5, seed=1, chunk_size=7)
+        self.assertEqual(counts, {'users': 3, 'projects': 4, 'kanbans': 12, 'epics': 8, 'tasks': 120, 'pins': 5})
+        self.assertEqual(Task.objects.count(), 120)
+        self.assertEqual(ProjectUserSetting.objects.count(), 5)
+        self.assertEqual(rank_gap_health(Task, 'kanban_id', min_gap=1)['narrow'], [])
+        self.assertEqual(rank_gap_health(Kanban, 'project_id', min_gap=1)['narrow'], [])
+        self.assertIsNotNone(authenticate(username=Task.objects.first().reporter.username, password=MOCK_USER_PASS))
+        # bulk_create 写入的任务同样建立了搜索索引
+        self.assertEqual(filter_queryset(Task.objects.all(), '任务0-', name_only=True).count(), 30)
+
+        # 新增行在已有数据之后分配主键, Task.save 仍按范围接着分配 rank
+        generate_scaled_data(users=1, projects=1, tasks_per_project=3, seed=1)
+        task = Task.objects.order_by('-id').first()
+        new_task = Task.objects.create(name='new', type_id=1, project=task.project, kanban=task.kanban)
+        self.assertEqual(new_task.rank, max(Task.objects.filter(kanban=task.kanban).values_list('rank', flat=True)))
+
 
 def dict_to_str(d):
     return json.dumps(d, indent=2, ensure_ascii=False)
@@ -81,3 +104,1938 @@ class TestSort(APITestCase):
                     self.assertLess(task1.rank, task2.rank)
                 if _type == 'after':
                     self.assertGreater(task1.rank, task2.rank)
+
+
+class TestProjectPin(APITestCase):
+    def setUp(self) -> None:
+        super().setUp()
+
+        from .generate_mock_data import generate_mock_data, MOCK_USER_PASS
+
+        self.mock_data = generate_mock_data()
+
+        self.client.login(username='aweffr', password=MOCK_USER_PASS)
+
+    def _add_projects(self, n):
+        from .models import Project, User
+
+        person = User.objects.get(username='guying')
+        for i in range(n):
+            Project.objects.create(name=f'项目{i}', organization='测试组', person=person)
+
+    def test_pin_query_count_does_not_grow(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+
+        url = reverse('project-list')
+
+        with CaptureQueriesContext(connection) as ctx_small:
+            self.client.get(url, format='json')
+
+        self._add_projects(10)
+        with CaptureQueriesContext(connection) as ctx_large:
+            resp = self.client.get(url, format='json')
+
+        self.assertEqual(len(resp.data), 11)
+        self.assertEqual(len(ctx_small.captured_queries), len(ctx_large.captured_queries))
+
+    def test_toggle_pin_and_pinned_first(self):
+        from urllib.parse import parse_qsl, urlsplit
+        from .models import Project, ProjectUserSetting
+
+        self._add_projects(3)
+        project = Project.objects.order_by('-id').first()
+
+        for new_val in (True, False, True):
+            resp = self.client.post(reverse('project-toggle-pin', args=(project.id,)), {'new_val': new_val}, format='json')
+            self.assertEqual(resp.data['pin'], new_val)
+        self.assertEqual(ProjectUserSetting.objects.filter(project=project).count(), 1)
+
+        resp = self.client.get(reverse('project-list'), {'pinnedFirst': 'true'}, format='json')
+        self.assertEqual(resp.data[0]['id'], project.id)
+        self.assertTrue(resp.data[0]['pin'])
+        self.assertIsNone(resp.data[1]['pin'])
+
+        # 游标分页同样先返回收藏的项目, 翻页不重复也不遗漏
+        ids, cursor = [], ''
+        while cursor is not None:
+            resp = self.client.get(reverse('project-list'), {'pinnedFirst': 'true', 'cursor': cursor, 'pageSize': 2})
+            self.assertEqual(resp.status_code, 200)
+            ids.extend(item['id'] for item in resp.data['results'])
+            cursor = resp.data['next'] and dict(parse_qsl(urlsplit(resp.data['next']).query))['cursor']
+        others = sorted(Project.objects.exclude(pk=project.id).values_list('id', flat=True))
+        self.assertEqual(ids, [project.id] + others)
+
+        resp = self.client.get(reverse('task-list'), format='json')
+        for task in resp.data:
+            self.assertIsNone(task['project']['pin'])
+
+
+class TestRankScope(TestCase):
+    def test_rank_allocated_per_scope(self):
+        from .generate_mock_data import generate_mock_data
+        from .models import Project, Kanban, Task, RANK_STEP
+
+        ret = generate_mock_data()
+        project = ret['tasks'][0].project
+
+        other_project = Project.objects.create(name='其他项目', organization='测试组', person=project.person)
+        kanban = Kanban.objects.create(name='待完成', project=other_project)
+        self.assertEqual(kanban.rank, 1.0)
+        self.assertEqual(Kanban.objects.create(name='已完成', project=other_project).rank, 1.0 + RANK_STEP)
+
+        task = Task.objects.create(name='新任务', project=other_project, kanban=kanban, type_id=1)
+        self.assertEqual(task.rank, 1.0)
+
+        for kanban in Kanban.objects.filter(project=project):
+            ranks = list(Task.objects.filter(kanban=kanban).values_list('rank', flat=True))
+            self.assertEqual(ranks, [1.0 + RANK_STEP * i for i in range(len(ranks))])
+
+
+class TestRankRebalance(APITestCase):
+    def setUp(self) -> None:
+        super().setUp()
+
+        from .generate_mock_data import generate_mock_data, MOCK_USER_PASS
+
+        self.mock_data = generate_mock_data()
+
+        self.client.login(username='aweffr', password=MOCK_USER_PASS)
+
+    def test_repeated_drop_into_same_slot(self):
+        from .models import Task
+
+        kanban = self.mock_data['kanbans'][0]
+        tasks = [Task.objects.create(name=f'任务{i}', project=kanban.project, kanban=kanban, type_id=1) for i in range(3)]
+        first, second, third = tasks
+
+        url = reverse('task-reorder')
+        # 交替把两个任务拖到 first 之后, 每次都落在 first 与另一个任务之间, 间隔持续减半
+        for i in range(60):
+            moving = (second, third)[i % 2]
+            payload = {
+                'from_id': moving.id,
+                'reference_id': first.id,
+                'type': 'after',
+                'from_kanban_id': kanban.id,
+                'to_kanban_id': kanban.id,
+            }
+            resp = self.client.post(url, payload, format='json')
+            self.assertEqual(resp.status_code, 200)
+
+            ranks = dict(Task.objects.filter(pk__in=[t.id for t in tasks]).values_list('id', 'rank'))
+            self.assertLess(ranks[first.id], ranks[moving.id])
+            self.assertEqual(len(set(Task.objects.filter(kanban=kanban).values_list('rank', flat=True))),
+                             Task.objects.filter(kanban=kanban).count())
+
+    def test_rank_health_command(self):
+        from io import StringIO
+        from django.core.management import call_command
+        from .models import Task
+
+        kanban = self.mock_data['kanbans'][0]
+        Task.objects.create(name='冲突1', project=kanban.project, kanban=kanban, type_id=1, rank=5.0)
+        Task.objects.create(name='冲突2', project=kanban.project, kanban=kanban, type_id=1, rank=5.0)
+
+        out = StringIO()
+        call_command('rank_health', '--compact', stdout=out)
+        self.assertIn(f'kanban_id={kanban.id}', out.getvalue())
+
+        out = StringIO()
+        call_command('rank_health', stdout=out)
+        self.assertIn('task: rows=', out.getvalue())
+        self.assertIn('narrow_scopes=0', out.getvalue())
+
+
+class TestBatchReorder(APITestCase):
+    def setUp(self) -> None:
+        super().setUp()
+
+        from .generate_mock_data import generate_mock_data, MOCK_USER_PASS
+
+        self.mock_data = generate_mock_data()
+
+        self.client.login(username='aweffr', password=MOCK_USER_PASS)
+
+    def test_batch_task_reorder(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        from .models import Task
+
+        kanban_from, kanban_to = self.mock_data['kanbans'][0], self.mock_data['kanbans'][1]
+        reference = Task.objects.create(name='参考任务', project=kanban_to.project, kanban=kanban_to, type_id=1)
+        moving = [Task.objects.create(name=f'任务{i}', project=kanban_from.project, kanban=kanban_from, type_id=1) for i in range(5)]
+
+        # 依次放到 reference 之前, 最终顺序与提交顺序相同
+        payload = [
+            {'from_id': task.id, 'reference_id': reference.id, 'type': 'before',
+             'from_kanban_id': kanban_from.id, 'to_kanban_id': kanban_to.id}
+            for task in moving
+        ]
+        with CaptureQueriesContext(connection) as ctx:
+            resp = self.client.post(reverse('task-reorder'), payload, format='json')
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual({item['id'] for item in resp.data['ranks']}, {task.id for task in moving})
+        self.assertLess(len(ctx.captured_queries), 15)
+
+        ordered = list(Task.objects.filter(kanban=kanban_to).order_by('rank').values_list('id', flat=True))
+        self.assertEqual(ordered[-len(moving) - 1:], [task.id for task in moving] + [reference.id])
+
+    def test_batch_kanban_reorder(self):
+        from .models import Kanban
+
+        k1, k2, k3 = self.mock_data['kanbans']
+        payload = [
+            {'from_id': k3.id, 'reference_id': k1.id, 'type': 'before'},
+            {'from_id': k1.id, 'reference_id': k2.id, 'type': 'after'},
+        ]
+        resp = self.client.post(reverse('kanban-reorder'), payload, format='json')
+        self.assertEqual(resp.status_code, 200)
+        ordered = list(Kanban.objects.filter(project=k1.project).values_list('id', flat=True))
+        self.assertEqual(ordered, [k3.id, k2.id, k1.id])
+
+    def test_batch_reorder_invalid_reference(self):
+        k1 = self.mock_data['kanbans'][0]
+        payload = [{'from_id': k1.id, 'reference_id': k1.id, 'type': 'before'}]
+        resp = self.client.post(reverse('kanban-reorder'), payload, format='json')
+        self.assertEqual(resp.status_code, 400)
+
+    def test_task_reorder_reference_outside_target_kanban(self):
+        from .models import Task
+
+        kanban_from, kanban_to = self.mock_data['kanbans'][0], self.mock_data['kanbans'][1]
+        reference = Task.objects.create(name='参考任务', project=kanban_from.project, kanban=kanban_from, type_id=1)
+        moving = Task.objects.create(name='任务', project=kanban_from.project, kanban=kanban_from, type_id=1)
+
+        # 参照任务不在目标看板中, 排序值无法在目标看板内计算
+        payload = [{'from_id': moving.id, 'reference_id': reference.id, 'type': 'before',
+                    'from_kanban_id': kanban_from.id, 'to_kanban_id': kanban_to.id}]
+        resp = self.client.post(reverse('task-reorder'), payload, format='json')
+        self.assertEqual(resp.status_code, 400)
+        moving.refresh_from_db()
+        self.assertEqual(moving.kanban_id, kanban_from.id)
+
+
+class TestProjectBoard(APITestCase):
+    def setUp(self) -> None:
+        super().setUp()
+
+        from .generate_mock_data import generate_mock_data, MOCK_USER_PASS
+
+        self.mock_data = generate_mock_data()
+        self.project = self.mock_data['tasks'][0].project
+
+        self.client.login(username='aweffr', password=MOCK_USER_PASS)
+
+    def test_board(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        from .models import Task
+
+        url = reverse('project-board', args=(self.project.id,))
+        with CaptureQueriesContext(connection) as ctx_small:
+            resp = self.client.get(url, format='json')
+        self.assertEqual(resp.status_code, 200)
+
+        kanbans = resp.data['kanbans']
+        self.assertEqual([k['id'] for k in kanbans], [k.id for k in self.mock_data['kanbans']])
+        for kanban in kanbans:
+            ranks = [task['rank'] for task in kanban['tasks']]
+            self.assertEqual(ranks, sorted(ranks))
+        self.assertEqual(sum(len(k['tasks']) for k in kanbans), Task.objects.filter(project=self.project).count())
+        self.assertEqual(len(resp.data['epics']), 2)
+
+        kanban = self.mock_data['kanbans'][0]
+        for i in range(20):
+            Task.objects.create(name=f'任务{i}', project=self.project, kanban=kanban, type_id=1,
+                                processor=self.mock_data['users'][i % 2])
+        with CaptureQueriesContext(connection) as ctx_large:
+            resp = self.client.get(url, format='json')
+        self.assertEqual(len(ctx_small.captured_queries), len(ctx_large.captured_queries))
+
+        etag = resp['ETag']
+        resp = self.client.get(url, format='json', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(resp.status_code, 304)
+
+        Task.objects.filter(project=self.project).first().delete()
+        resp = self.client.get(url, format='json', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(resp.status_code, 200)
+
+
+class TestCursorPagination(APITestCase):
+    def setUp(self) -> None:
+        super().setUp()
+
+        from .generate_mock_data import generate_mock_data, MOCK_USER_PASS
+        from .models import Task
+
+        self.mock_data = generate_mock_data()
+        project = self.mock_data['tasks'][0].project
+        # 无看板的任务 kanban_id 为 NULL, 排在最前面
+        for i in range(3):
+            Task.objects.create(name=f'未分配{i}', project=project, type_id=1)
+
+        self.client.login(username='aweffr', password=MOCK_USER_PASS)
+
+    def test_task_cursor_pages(self):
+        from urllib.parse import parse_qsl, urlsplit
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+
+        from django.db.models import F
+        from .models import Task
+
+        url = reverse('task-list')
+        expected = list(
+            Task.objects.order_by(F('kanban_id').asc(nulls_first=True), 'rank', 'id').values_list('id', flat=True)
+        )
+
+        ids = []
+        params = {'cursor': '', 'pageSize': 3}
+        while True:
+            with CaptureQueriesContext(connection) as ctx:
+                resp = self.client.get(url, params, format='json')
+            self.assertFalse(any('COUNT(' in q['sql'] for q in ctx.captured_queries))
+            self.assertLessEqual(len(resp.data['results']), 3)
+            ids.extend(task['id'] for task in resp.data['results'])
+            if resp.data['next'] is None:
+                break
+            params = dict(parse_qsl(urlsplit(resp.data['next']).query))
+
+        self.assertEqual(ids, expected)
+
+    def test_invalid_cursor(self):
+        from .pagination import encode_cursor
+
+        resp = self.client.get(reverse('kanban-list'), {'cursor': 'not-a-cursor'}, format='json')
+        self.assertEqual(resp.status_code, 400)
+
+        # 列数或类型与排序列 (kanban_id, rank, id) 不符
+        url = reverse('task-list')
+        for position in ([1, 'a', 3], [1.0, 2.0], [None, 1.0, '3'], [None, True, 3], [None, float('nan'), 3], [[1], 1.0, 3]):
+            resp = self.client.get(url, {'cursor': encode_cursor(position)}, format='json')
+            self.assertEqual(resp.status_code, 400, position)
+            self.assertIn('cursor is invalid', resp.json()['msg'])
+        self.assertEqual(self.client.get(url, {'cursor': 'WzEsImEiLDNd'}, format='json').status_code, 400)
+        resp = self.client.get(url, {'cursor': encode_cursor([None, 1, 3])}, format='json')
+        self.assertEqual(resp.status_code, 200)
+
+
+class TestFieldsAndExpand(APITestCase):
+    def setUp(self) -> None:
+        super().setUp()
+
+        from .generate_mock_data import generate_mock_data, MOCK_USER_PASS
+
+        generate_mock_data()
+
+        self.client.login(username='aweffr', password=MOCK_USER_PASS)
+
+    def test_sparse_fields(self):
+        resp = self.client.get(reverse('task-list'), {'fields': 'id,name,createAt,kanban.name'}, format='json')
+        for task in resp.data:
+            self.assertEqual(set(task.keys()), {'id', 'name', 'create_at', 'kanban'})
+            if task['kanban'] is not None:
+                self.assertEqual(set(task['kanban'].keys()), {'name'})
+
+    def test_expand(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+
+        url = reverse('task-list')
+        with CaptureQueriesContext(connection) as ctx:
+            resp = self.client.get(url, {'expand': 'processor'}, format='json')
+        for task in resp.data:
+            self.assertNotIn('project', task)
+            self.assertNotIn('epic', task)
+            self.assertIn('project_id', task)
+            self.assertIn('processor', task)
+            if task['processor'] is not None:
+                self.assertNotIn('avatar', task['processor'])
+
+        # 数据查询与条件 GET 的聚合查询都不需要 join 未输出的关联
+        task_sql = [q['sql'] for q in ctx.captured_queries if 'FROM "jira_task"' in q['sql']]
+        self.assertEqual(len([sql for sql in task_sql if 'MAX(' not in sql]), 1)
+        for sql in task_sql:
+            self.assertNotIn('"jira_project"', sql)
+            self.assertNotIn('"jira_epic"', sql)
+
+    def test_default_unchanged(self):
+        resp = self.client.get(reverse('task-list'), format='json')
+        task = resp.data[0]
+        self.assertIn('project', task)
+        self.assertNotIn('person', task['project'])
+        self.assertIn('pin', task['project'])
+
+        resp = self.client.get(reverse('epic-list'), {'expand': 'project'}, format='json')
+        self.assertNotIn('person', resp.data[0]['project'])
+
+
+class TestCompiledReadPath(APITestCase):
+    def setUp(self) -> None:
+        super().setUp()
+
+        from .generate_mock_data import generate_mock_data, MOCK_USER_PASS
+        from .models import Project, ProjectUserSetting, User
+
+        self.mock_data = generate_mock_data()
+        self.project = self.mock_data['tasks'][0].project
+        user = User.objects.get(username='aweffr')
+        ProjectUserSetting.objects.create(user=user, project=self.project, is_pinned=True)
+        Project.objects.create(name='空项目', organization='测试组', person=user)
+
+        self.client.login(username='aweffr', password=MOCK_USER_PASS)
+
+    def assert_same_output(self, url, params=None):
+        from django.test import override_settings
+
+        # 响应缓存的键不区分两种序列化方式
+        with override_settings(FAST_READ_PATH=True, RESPONSE_CACHE=False):
+            fast = self.client.get(url, params, format='json')
+        with override_settings(FAST_READ_PATH=False, RESPONSE_CACHE=False):
+            slow = self.client.get(url, params, format='json')
+        self.assertEqual(fast.status_code, slow.status_code)
+        self.assertEqual(fast.content, slow.content)
+
+    def test_lists_match_serializers(self):
+        for name in ('user', 'project', 'epic', 'kanban', 'task'):
+            self.assert_same_output(reverse(f'{name}-list'))
+        self.assert_same_output(reverse('task-list'), {'fields': 'id,name,project.pin,reporter.avatar'})
+        self.assert_same_output(reverse('task-list'), {'expand': 'kanban', 'cursor': '', 'pageSize': 2})
+        self.assert_same_output(reverse('project-list'), {'pinnedFirst': 'true'})
+
+    def test_retrieve_matches_serializers(self):
+        self.assert_same_output(reverse('task-detail', args=(self.mock_data['tasks'][0].id,)))
+        self.assert_same_output(reverse('project-detail', args=(self.project.id,)))
+        self.assert_same_output(reverse('project-detail', args=(0,)))
+
+
+class TestCamelCaseRenderer(APITestCase):
+    def setUp(self) -> None:
+        super().setUp()
+
+        from .generate_mock_data import generate_mock_data, MOCK_USER_PASS
+
+        self.mock_data = generate_mock_data()
+        self.client.login(username='aweffr', password=MOCK_USER_PASS)
+
+    def test_render_matches_library(self):
+        from djangorestframework_camel_case.render import CamelCaseJSONRenderer as LibraryRenderer
+        from .renderers import CamelCaseJSONRenderer
+
+        data = {
+            'user_id': 1, 'v2_name': 'x', 'name_2': [{'create_at': None, 'a_b_c': (1, 2)}],
+            'plain': 'snake_case_value', 3: 'int key', 'nested': {'update_at': {'x_1': 1.5}},
+        }
+        self.assertEqual(CamelCaseJSONRenderer().render(data), LibraryRenderer().render(data))
+
+        for name in ('project', 'epic', 'kanban', 'task'):
+            resp = self.client.get(reverse(f'{name}-list'), format='json')
+            self.assertEqual(resp.content, LibraryRenderer().render(resp.data))
+            self.assertEqual(
+                CamelCaseJSONRenderer().render(resp.data, 'application/json; indent=2'),
+                LibraryRenderer().render(resp.data, 'application/json; indent=2'),
+            )
+
+    def test_single_pass_matches_camelize(self):
+        import datetime
+        import decimal
+        import uuid
+        from django.utils.functional import lazy
+        from rest_framework.utils.encoders import JSONEncoder
+        from .renderers import camelize, make_camelize_encoder
+
+        lazy_str = lazy(lambda text: text, str)
+        data = {
+            'user_id': 1, True: 'bool key', 1.5: 'float key', None: 'none key', 2: 'int key', lazy_str('lazy_key'): 1,
+            'empty_dict': {}, 'empty_list': [], 'tuple_value': ('a_b', {'c_d': 1}), 'gen_value': (i for i in range(2)),
+            'set_value': {3}, 'when': datetime.datetime(2026, 10, 18, tzinfo=datetime.timezone.utc),
+            'amount': decimal.Decimal('1.5'), 'uuid_value': uuid.UUID(int=1), 'lazy_value': lazy_str('x_y'),
+            'text': 'ünïcode \u2028 "quoted"', 'nan_value': float('nan'), 'big': 10 ** 20,
+            'raw_field': {'keep_me': {'and_me': 1}}, 'rawField2': {'keep_me': 1},
+        }
+        for ensure_ascii, separators in ((False, (',', ':')), (True, (', ', ': '))):
+            encoder = JSONEncoder(ensure_ascii=ensure_ascii, separators=separators)
+            for ignore_fields in ((), ('raw_field', 'rawField2')):
+                encode = make_camelize_encoder(encoder, ensure_ascii, True, *separators, ignore_fields=ignore_fields)
+                expected = json.dumps(
+                    camelize(dict(data, gen_value=[0, 1]), ignore_fields),
+                    cls=JSONEncoder, ensure_ascii=ensure_ascii, separators=separators,
+                )
+                self.assertEqual(encode(dict(data, gen_value=(i for i in range(2)))), expected)
+
+        strict = make_camelize_encoder(JSONEncoder(allow_nan=False), True, False, ',', ':')
+        with self.assertRaises(ValueError):
+            strict({'nan_value': float('nan')})
+
+    def test_parse_matches_library(self):
+        from djangorestframework_camel_case.util import underscoreize as library_underscoreize
+        from django.http import QueryDict
+        from .renderers import underscoreize
+
+        payload = {'projectId': 1, 'kanbanId2': [{'fromKanbanId': 2, 'type': 'after'}], 'v2Name': 'a'}
+        for options in ({}, {'no_underscore_before_number': True}):
+            self.assertEqual(underscoreize(payload, **options), library_underscoreize(payload, **options))
+
+        query = QueryDict('projectId=1&projectId=2&personId=3')
+        self.assertEqual(
+            dict(underscoreize(query, no_underscore_before_number=True).lists()),
+            dict(library_underscoreize(query, no_underscore_before_number=True).lists()),
+        )
+
+        resp = self.client.post(reverse('kanban-list'), {'name': 'k', 'projectId': self.mock_data['tasks'][0].project_id})
+        self.assertEqual(resp.status_code, 201, resp.data)
+
+
+def scale_mock_data(mock_data, factor):
+    """在 generate_mock_data 的基础上按 factor 批量追加项目、看板、任务组、任务、用户头像与置顶设置"""
+    from django.utils import timezone
+    from .models import AppImage, User, Project, ProjectUserSetting, Kanban, Epic, Task
+
+    user1, user2 = mock_data['users']
+    now = timezone.now()
+    users = [user1, user2]
+    for i in range(factor):
+        avatar = AppImage.objects.create(img=f'avatar{i}.png', width=1, height=1)
+        users.append(User.objects.create(username=f'scale{i}', phone_number=f'scale{i}', avatar=avatar))
+
+    for i in range(factor):
+        project = Project.objects.create(name=f'项目{i}', organization='测试组', person=users[i % len(users)])
+        ProjectUserSetting.objects.create(user=user1, project=project, is_pinned=bool(i % 2))
+        kanbans = [Kanban.objects.create(name=f'看板{j}', project=project) for j in range(3)]
+        epics = [Epic.objects.create(name=f'任务组{j}', project=project, start=now, end=now) for j in range(2)]
+        Task.objects.bulk_create([
+            Task(
+                name=f'任务{j}', note='', type_id=1, project=project, rank=float(j),
+                reporter=users[j % len(users)], processor=users[(j + 1) % len(users)] if j % 3 else None,
+                kanban=kanbans[j % len(kanbans)], epic=epics[j % len(epics)],
+            )
+            for j in range(factor * 3)
+        ])
+    return users
+
+
+class TestQueryBudget(APITestCase):
+    """
+    每个路由接口的查询次数上限; 数据量放大后次数不能增长 (N+1)。
+    超出预算时先确认是否引入了逐行查询, 确实需要增加查询时再调整 BUDGETS。
+    """
+    # 含读取会话 (默认 SESSION_MODE=db) 与认证用户的查询; 项目/任务组/看板/任务的 list/retrieve 含一次条件 GET 的聚合查询
+    # 写请求每次写入变更记录含分配序号的 UPDATE/SELECT 与 INSERT (jira.changelog)
+    BUDGETS = {
+        'api-root': 2,
+        'user-list': 3,
+        'user-detail': 4,
+        'user-about-me': 2,
+        'user-auth-cache-stats': 2,
+        'user-db-pool-stats': 2,
+        'appimage-detail': 3,
+        'project-list': 6,  # pinnedFirst 先读取收藏的项目ID
+        'project-detail': 5,
+        'project-board': 10,
+        'project-toggle-pin': 12,
+        'epic-list': 5,
+        'epic-detail': 5,
+        'kanban-list': 4,
+        'kanban-detail': 4,
+        'kanban-reorder': 12,
+        'task-list': 5,
+        'task-detail': 5,
+        'task-reorder': 14,
+        'task-bulk': 38,
+        'search-list': 10,
+        'changes-list': 3,
+    }
+    SCALES = (2, 12)
+
+    def measure(self, factor):
+        from django.db import transaction
+        from .generate_mock_data import generate_mock_data, MOCK_USER_PASS
+        from .middleware import capture_queries
+        from .models import AppImage
+
+        counts = {}
+        sid = transaction.savepoint()
+        mock_data = generate_mock_data()
+        scale_mock_data(mock_data, factor)
+        self.client.login(username='aweffr', password=MOCK_USER_PASS)
+
+        task = mock_data['tasks'][0]
+        project_id, kanbans = task.project_id, mock_data['kanbans']
+        image = AppImage.objects.first()
+        requests = {
+            'api-root': ('get', reverse('api-root'), None),
+            'user-list': ('get', reverse('user-list'), None),
+            'user-detail': ('get', reverse('user-detail', args=('aweffr',)), None),
+            'user-about-me': ('get', reverse('user-about-me'), None),
+            'user-auth-cache-stats': ('get', reverse('user-auth-cache-stats'), None),
+            'user-db-pool-stats': ('get', reverse('user-db-pool-stats'), None),
+            'appimage-detail': ('get', reverse('appimage-detail', args=(image.id,)), None),
+            'project-list': ('get', reverse('project-list'), {'pinnedFirst': 'true'}),
+            'project-detail': ('get', reverse('project-detail', args=(project_id,)), None),
+            'project-board': ('get', reverse('project-board', args=(project_id,)), None),
+            'project-toggle-pin': ('post', reverse('project-toggle-pin', args=(project_id,)), {'newVal': True}),
+            'epic-list': ('get', reverse('epic-list'), None),
+            'epic-detail': ('get', reverse('epic-detail', args=(mock_data['epics'][0].id,)), None),
+            'kanban-list': ('get', reverse('kanban-list'), {'projectId': project_id}),
+            'kanban-detail': ('get', reverse('kanban-detail', args=(kanbans[0].id,)), None),
+            'kanban-reorder': ('post', reverse('kanban-reorder'), {
+                'fromId': kanbans[0].id, 'referenceId': kanbans[2].id, 'type': 'after',
+            }),
+            'task-list': ('get', reverse('task-list'), None),
+            'task-detail': ('get', reverse('task-detail', args=(task.id,)), None),
+            'search-list': ('get', reverse('search-list'), {'q': '开发', 'projectId': project_id}),
+            'changes-list': ('get', reverse('changes-list'), {'since': 0, 'projectId': project_id}),
+            'task-reorder': ('post', reverse('task-reorder'), {
+                'fromId': task.id, 'referenceId': mock_data['tasks'][1].id, 'type': 'before',
+                'fromKanbanId': task.kanban_id, 'toKanbanId': mock_data['tasks'][1].kanban_id,
+            }),
+            'task-bulk': ('post', reverse('task-bulk'), {
+                'create': [
+                    {'name': f'批量任务{i}', 'projectId': project_id, 'kanbanId': kanbans[i % 2].id} for i in range(4)
+                ],
+                'update': [{'id': mock_data['tasks'][1].id, 'name': '批量修改'}],
+                'delete': [mock_data['tasks'][2].id],
+            }),
+        }
+        for name, (method, url, data) in requests.items():
+            with capture_queries() as stats:
+                resp = getattr(self.client, method)(url, data, format='json' if method == 'post' else None)
+            self.assertLess(resp.status_code, 300, (name, resp.content[:200]))
+            counts[name] = stats.count
+
+        self.client.logout()
+        transaction.savepoint_rollback(sid)
+        return counts
+
+    def test_query_budgets(self):
+        small, large = (self.measure(factor) for factor in self.SCALES)
+        self.assertEqual(set(small), set(self.BUDGETS))
+        for name, budget in self.BUDGETS.items():
+            self.assertEqual(small[name], large[name], f'{name}: query count grows with data size')
+            self.assertLessEqual(large[name], budget, f'{name}: {large[name]} queries > budget {budget}')
+
+    def test_debug_headers(self):
+        from django.test import override_settings
+        from .generate_mock_data import generate_mock_data, MOCK_USER_PASS
+
+        generate_mock_data()
+        self.client.login(username='aweffr', password=MOCK_USER_PASS)
+        with override_settings(DEBUG=True):
+            resp = self.client.get(reverse('task-list'))
+        self.assertGreater(int(resp['X-DB-Query-Count']), 0)
+        self.assertIn('X-DB-Query-Time-Ms', resp)
+        self.assertEqual(resp['X-DB-Duplicate-Queries'], '0')
+
+        resp = self.client.get(reverse('task-list'))
+        self.assertNotIn('X-DB-Query-Count', resp)
+
+
+class TestCachedTokenAuthentication(APITestCase):
+    def setUp(self) -> None:
+        super().setUp()
+
+        from .authentication import token_cache
+        from .generate_mock_data import generate_mock_data, MOCK_USER_PASS
+
+        token_cache.clear()
+        self.mock_data = generate_mock_data()
+        resp = self.client.post(reverse('token_login'), {'username': 'aweffr', 'password': MOCK_USER_PASS}, format='json')
+        self.token = resp.data['token']
+
+    def get_about_me(self, token=None):
+        from django.test.utils import CaptureQueriesContext
+        from django.db import connection
+
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {token or self.token}')
+        with CaptureQueriesContext(connection) as ctx:
+            resp = self.client.get(reverse('user-about-me'))
+        return resp, len(ctx.captured_queries)
+
+    def test_cache_hit(self):
+        from .authentication import token_cache
+
+        before = token_cache.stats()
+        resp, miss_queries = self.get_about_me()
+        self.assertEqual(resp.status_code, 200)
+        resp, hit_queries = self.get_about_me()
+        self.assertEqual(resp.data['username'], 'aweffr')
+        self.assertEqual(hit_queries, miss_queries - 1)
+
+        after = token_cache.stats()
+        self.assertEqual(after['hits'] - before['hits'], 1)
+        self.assertEqual(after['misses'] - before['misses'], 1)
+
+        resp = self.client.get(reverse('user-auth-cache-stats'))
+        self.assertEqual(resp.data['size'], 1)
+
+    def test_invalidation(self):
+        from rest_framework.authtoken.models import Token
+        from .models import User
+
+        self.get_about_me()
+        user = User.objects.get(username='aweffr')
+        user.is_active = False
+        user.save()
+        resp, _ = self.get_about_me()
+        self.assertEqual(resp.status_code, 403)
+
+        user.is_active = True
+        user.save()
+        self.assertEqual(self.get_about_me()[0].status_code, 200)
+
+        Token.objects.filter(key=self.token).delete()
+        self.assertEqual(self.get_about_me()[0].status_code, 403)
+        new_token = Token.objects.create(user=user)
+        self.assertEqual(self.get_about_me(new_token.key)[0].status_code, 200)
+
+    def test_invalidate_user_uses_index(self):
+        from .authentication import TokenCache
+        from .models import User
+
+        users = list(User.objects.all()[:2])
+        token_cache = TokenCache(max_size=3, ttl=60)
+        for i in range(2):
+            for user in users:
+                token_cache.set(f'{user.pk}-{i}', (user, None))
+        # 超出上限被淘汰的记录同时从索引中移除
+        self.assertEqual(token_cache.stats()['size'], 3)
+        self.assertEqual(sum(len(keys) for keys in token_cache._user_keys.values()), 3)
+
+        token_cache.invalidate(user_id=users[0].pk)
+        self.assertEqual(list(token_cache._data), [f'{users[1].pk}-0', f'{users[1].pk}-1'])
+        self.assertEqual(list(token_cache._user_keys), [users[1].pk])
+        self.assertEqual(token_cache.stats()['invalidations'], 1)
+
+    def test_invalidation_across_processes(self):
+        from .authentication import TokenCache
+        from .models import User
+
+        # 另一个 worker 的缓存: 收不到本进程的失效信号, 靠共享缓存中的代数发现变化
+        other_worker = TokenCache(max_size=10, ttl=60)
+        user = User.objects.get(username='aweffr')
+        other_worker.set(self.token, (user, None))
+        self.assertIsNotNone(other_worker.get(self.token))
+
+        user.first_name = 'renamed'
+        user.save()
+        self.assertIsNone(other_worker.get(self.token))
+        self.assertEqual(other_worker.stats()['size'], 0)
+
+        other_worker.set(self.token, (User.objects.get(pk=user.pk), None))
+        self.assertEqual(other_worker.get(self.token)[0].first_name, 'renamed')
+
+
+class TestWriteBehindSession(TransactionTestCase):
+    # 后台线程使用自己的数据库连接, 需要看到已提交的数据
+    def test_save_and_flush(self):
+        from django.contrib.sessions.models import Session
+        from .sessions import SessionStore, write_behind_queue
+
+        session = SessionStore()
+        session['a'] = 1
+        session.create()
+        session_key = session.session_key
+        self.assertEqual(Session.objects.get(session_key=session_key).get_decoded(), {'a': 1})
+
+        session['a'] = 2
+        session.save()
+        self.assertEqual(SessionStore(session_key)['a'], 2)
+        self.assertTrue(write_behind_queue.flush(timeout=10))
+        self.assertEqual(Session.objects.get(session_key=session_key).get_decoded(), {'a': 2})
+
+        session.delete()
+        self.assertFalse(Session.objects.filter(session_key=session_key).exists())
+        self.assertEqual(SessionStore(session_key).load(), {})
+
+
+class TestSearch(APITestCase):
+    def setUp(self) -> None:
+        super().setUp()
+
+        from .generate_mock_data import generate_mock_data, MOCK_USER_PASS
+
+        self.mock_data = generate_mock_data()
+        self.project = self.mock_data['tasks'][0].project
+        self.client.login(username='aweffr', password=MOCK_USER_PASS)
+
+    def assert_same_as_icontains(self, model, q, fields):
+        from django.db.models import Q
+        from .search import filter_queryset
+
+        expected = Q()
+        for field in fields:
+            expected |= Q(**{f'{field}__icontains': q})
+        self.assertEqual(
+            sorted(filter_queryset(model.objects.all(), q, name_only=fields == ('name',)).values_list('id', flat=True)),
+            sorted(model.objects.filter(expected).values_list('id', flat=True)),
+            q,
+        )
+
+    def test_filter_matches_icontains(self):
+        from .models import Task, Project, Epic, Kanban
+
+        for q in ('开发', '界面开发', '管理登录', '发', 'UI', 'ui开', 'JWT', '单测~', '完成', '不存在的', 'x'):
+            self.assert_same_as_icontains(Task, q, ('name', 'note'))
+            self.assert_same_as_icontains(Task, q, ('name',))
+        for model in (Project, Epic, Kanban):
+            for q in ('快递', '地图开发', '开发中', '完成'):
+                self.assert_same_as_icontains(model, q, ('name',))
+
+        resp = self.client.get(reverse('task-list'), {'q': '尽快'})
+        self.assertEqual([task['name'] for task in resp.data], ['管理注册界面开发'])
+        resp = self.client.get(reverse('task-list'), {'name': '尽快'})
+        self.assertEqual(resp.data, [])
+
+    def test_accent_insensitive(self):
+        from .models import Task, SearchIndexEntry
+        from .search import query_grams, select_grams, candidate_ids
+
+        task = self.mock_data['tasks'][0]
+        task.name = 'Café 页面'
+        task.save()
+
+        # MySQL 的 *_general_ci 中 cafe 与 café 相等, 索引的候选集合必须包含该任务, 交给 icontains 确认
+        doc_type = SearchIndexEntry.DOC_TYPE_TASK
+        for q in ('cafe', 'CAFÉ', 'café'):
+            self.assertEqual(query_grams(q), {'ca', 'af', 'fe'})
+            grams = select_grams(doc_type, query_grams(q), name_only=True)
+            self.assertIn(task.id, candidate_ids(doc_type, grams, name_only=True).values_list('doc_id', flat=True))
+            self.assert_same_as_icontains(Task, q, ('name',))
+
+    def test_select_grams_single_query(self):
+        from .models import SearchIndexEntry
+        from .search import query_grams, select_grams
+
+        grams = query_grams('管理注册界面开发')
+        with self.assertNumQueries(1):
+            selected = select_grams(SearchIndexEntry.DOC_TYPE_TASK, grams)
+        self.assertEqual(len(selected), 2)
+        self.assertLessEqual(set(selected), grams)
+
+    def test_index_follows_changes(self):
+        from .models import Task, SearchIndexEntry
+        from .search import filter_queryset
+
+        task = self.mock_data['tasks'][0]
+        task.name = '搜索功能'
+        task.save()
+        self.assertEqual(list(filter_queryset(Task.objects.all(), '搜索').values_list('id', flat=True)), [task.id])
+        self.assertFalse(filter_queryset(Task.objects.all(), '管理登录').exists())
+
+        task.delete()
+        self.assertFalse(SearchIndexEntry.objects.filter(doc_type=SearchIndexEntry.DOC_TYPE_TASK, doc_id=task.id).exists())
+
+    def test_backfill_migration(self):
+        from importlib import import_module
+        from .models import Task, SearchIndexEntry
+        from .search import filter_queryset
+
+        # 0008 之前已有的数据没有索引
+        SearchIndexEntry.objects.all().delete()
+        self.assertFalse(filter_queryset(Task.objects.all(), '开发', name_only=True).exists())
+
+        # 迁移使用的是迁移时的历史模型
+        from django.db import connection
+        from django.db.migrations.loader import MigrationLoader
+        state = MigrationLoader(connection).project_state(('jira', '0013_backfill_search_index'))
+        import_module('jira.migrations.0013_backfill_search_index').backfill_search_index(state.apps, None)
+        resp = self.client.get(reverse('task-list'), {'name': '开发'})
+        self.assertEqual(
+            sorted(task['id'] for task in resp.data),
+            sorted(Task.objects.filter(name__icontains='开发').values_list('id', flat=True)),
+        )
+        self.assertGreater(len(resp.data), 0)
+
+    def test_search_endpoint(self):
+        from django.core.management import call_command
+        from .models import SearchIndexEntry
+
+        SearchIndexEntry.objects.all().delete()
+        call_command('rebuild_search_index', stdout=open(os.devnull, 'w'))
+
+        resp = self.client.get(reverse('search-list'), {'q': '开发', 'limit': 3})
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(len(resp.data['results']), 3)
+        # 名称包含查询串且最短的排在最前
+        self.assertEqual(resp.data['results'][0]['name'], '开发中')
+
+        resp = self.client.get(reverse('search-list'), {'q': '快递', 'type': 'project'})
+        self.assertEqual([(item['type'], item['id']) for item in resp.data['results']], [('project', self.project.id)])
+        self.assertIn('projectId', resp.json()['results'][0])
+
+        resp = self.client.get(reverse('search-list'), {'q': '快递', 'type': 'unknown'})
+        self.assertEqual(resp.status_code, 400)
+
+
+def plan_problems(queryset):
+    """
+    EXPLAIN queryset, 返回 (全表/全索引扫描, 额外排序) 两个列表, 支持 SQLite 与 MySQL。
+    """
+    import re
+    from django.db import connection
+
+    sql, params = queryset.query.sql_with_params()
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+            details = [row[-1] for row in cursor.fetchall()]
+            scans = [detail for detail in details if re.match(r'SCAN ', detail)]
+            sorts = [detail for detail in details if 'TEMP B-TREE' in detail]
+        elif connection.vendor == 'mysql':
+            cursor.execute('EXPLAIN ' + sql, params)
+            columns = [column[0] for column in cursor.description]
+            rows = [dict(zip(columns, row)) for row in cursor.fetchall()]
+            scans = [f'{row["table"]}: type={row["type"]}' for row in rows if row['type'] in ('ALL', 'index')]
+            sorts = [f'{row["table"]}: {row["Extra"]}' for row in rows if 'filesort' in (row['Extra'] or '')]
+        else:
+            raise NotImplementedError(connection.vendor)
+    return scans, sorts
+
+
+class TestQueryPlans(TestCase):
+    """
+    各 FilterSet 实际产生的查询形状都要走索引。
+
+    已知例外: 任务列表按 Meta.ordering (kanban__rank, rank) 排序, 排序列来自关联的看板表,
+    任何单表索引都无法提供这个顺序, 除按 kanbanId 过滤外总会对过滤后的行做一次排序 (只排序过滤结果, 不是全表)。
+    游标分页改按任务表自己的 (kanban_id, rank, id) 排序, 不过滤或按 kanbanId 过滤时直接沿 (kanban, rank) 索引定位;
+    按其他条件 (如 projectId) 过滤时仍要对过滤结果排序。
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        from django.db import connection
+        from .generate_mock_data import generate_scaled_data
+        from .models import Project, Task
+
+        generate_scaled_data(users=20, projects=30, tasks_per_project=100, seed=1)
+        with connection.cursor() as cursor:
+            if connection.vendor == 'sqlite':
+                cursor.execute('ANALYZE')
+            elif connection.vendor == 'mysql':
+                cursor.execute('ANALYZE TABLE jira_project, jira_kanban, jira_epic, jira_task')
+
+        cls.task = Task.objects.exclude(processor=None).exclude(epic=None).exclude(kanban=None).first()
+        cls.project = Project.objects.get(pk=cls.task.project_id)
+
+    def assert_plan(self, queryset, allow_sort=False):
+        scans, sorts = plan_problems(queryset)
+        self.assertEqual(scans, [], str(queryset.query))
+        if not allow_sort:
+            self.assertEqual(sorts, [], str(queryset.query))
+
+    def test_task_filters(self):
+        from .models import Task
+        from .views import TaskFilter, TaskViewSet
+
+        task = self.task
+        values = {
+            'projectId': task.project_id, 'processorId': task.processor_id, 'epicId': task.epic_id,
+            'kanbanId': task.kanban_id, 'typeId': task.type_id,
+        }
+        combinations = (
+            ('projectId',),
+            ('projectId', 'processorId'),
+            ('projectId', 'epicId'),
+            ('projectId', 'kanbanId'),
+            ('projectId', 'typeId'),
+            ('projectId', 'processorId', 'typeId'),
+            ('projectId', 'epicId', 'typeId'),
+            ('projectId', 'processorId', 'epicId'),
+            ('processorId',),
+            ('epicId',),
+            ('kanbanId',),
+        )
+        for combination in combinations:
+            queryset = TaskFilter({name: values[name] for name in combination}, TaskViewSet.queryset).qs
+            with self.subTest(combination=combination):
+                self.assert_plan(queryset, allow_sort='kanbanId' not in combination)
+
+    def test_task_cursor_seek(self):
+        from .pagination import keyset_queryset
+        from .views import TaskFilter, TaskViewSet
+
+        task = self.task
+        position = [task.kanban_id, task.rank, task.id]
+        for params in ({}, {'kanbanId': task.kanban_id}):
+            queryset = TaskFilter(params, TaskViewSet.queryset).qs
+            with self.subTest(params=params):
+                # 第一页沿索引顺序读取, LIMIT 读够即停; 之后的页从 position 处定位, 都不需要排序
+                first_page, _ = keyset_queryset(queryset, TaskViewSet.cursor_ordering)
+                self.assertEqual(plan_problems(first_page[:50])[1], [])
+                next_page, _ = keyset_queryset(queryset, TaskViewSet.cursor_ordering, position)
+                self.assert_plan(next_page[:50])
+
+    def test_project_filters(self):
+        from .views import ProjectFilter, ProjectViewSet
+
+        values = {
+            'personId': self.project.person_id,
+            'createAtMin': '2000-01-01T00:00:00Z',
+            'createAtMax': '2100-01-01T00:00:00Z',
+        }
+        combinations = (
+            ('personId',),
+            ('createAtMin',),
+            ('createAtMin', 'createAtMax'),
+            ('personId', 'createAtMin'),
+            ('personId', 'createAtMin', 'createAtMax'),
+        )
+        for combination in combinations:
+            queryset = ProjectFilter({name: values[name] for name in combination}, ProjectViewSet.queryset).qs
+            with self.subTest(combination=combination):
+                self.assert_plan(queryset)
+
+    def test_kanban_and_epic_filters(self):
+        from .views import EpicFilter, EpicViewSet, KanbanFilter, KanbanViewSet
+
+        self.assert_plan(KanbanFilter({'projectId': self.project.id}, KanbanViewSet.queryset).qs)
+        self.assert_plan(EpicFilter({'projectId': self.project.id}, EpicViewSet.queryset).qs)
+
+
+class TestConditionalGet(APITestCase):
+    def setUp(self) -> None:
+        super().setUp()
+
+        from .generate_mock_data import generate_mock_data, MOCK_USER_PASS
+
+        self.mock_data = generate_mock_data()
+        self.project = self.mock_data['tasks'][0].project
+        self.client.login(username='aweffr', password=MOCK_USER_PASS)
+
+    def assert_revalidates(self, url, params, change, expect_changed=True):
+        resp = self.client.get(url, params)
+        self.assertEqual(resp.status_code, 200)
+        etag = resp['ETag']
+        self.assertIn('Last-Modified', resp)
+        self.assertEqual(self.client.get(url, params, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        change()
+        resp = self.client.get(url, params, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(resp.status_code, 200 if expect_changed else 304)
+        return resp
+
+    def test_list_changes(self):
+        from .models import Task, Epic
+
+        url, params = reverse('task-list'), {'projectId': self.project.id}
+        task = self.mock_data['tasks'][0]
+
+        def rename():
+            task.name = 'renamed'
+            task.save()
+        self.assert_revalidates(url, params, rename)
+        self.assert_revalidates(url, params, lambda: Task.objects.filter(pk=task.pk).delete())
+        # 删除任务组时任务的 epic_id 被直接置空, 不会更新任务的 update_at
+        epic = Epic.objects.filter(tasks__isnull=False).first()
+        epic_id = epic.id
+        resp = self.assert_revalidates(url, params, epic.delete)
+        self.assertTrue(all(item['epic_id'] != epic_id for item in resp.data))
+
+        # 嵌套输出的用户没有 update_at
+        user = self.mock_data['users'][1]
+        user.first_name = 'renamed'
+        self.assert_revalidates(url, params, user.save)
+
+        # 与输出无关的请求参数不同, 缓存互不影响
+        self.assert_revalidates(reverse('kanban-list'), {'projectId': self.project.id}, lambda: None, expect_changed=False)
+        resp = self.client.get(url, {'projectId': self.project.id, 'fields': 'id'})
+        self.assertEqual(self.client.get(url, params, HTTP_IF_NONE_MATCH=resp['ETag']).status_code, 200)
+
+    def test_detail_and_pin(self):
+        from .models import Epic
+
+        project_url = reverse('project-detail', args=(self.project.id,))
+        self.assert_revalidates(
+            project_url, None,
+            lambda: self.client.post(reverse('project-toggle-pin', args=(self.project.id,)), {'newVal': True}, format='json'),
+        )
+        epic = Epic.objects.filter(project=self.project).first()
+        self.assert_revalidates(reverse('epic-detail', args=(epic.id,)), None, lambda: self.project.save())
+        self.assertEqual(self.client.get(reverse('task-detail', args=(0,))).status_code, 404)
+        self.assertEqual(self.client.get(reverse('task-detail', args=('x',))).status_code, 404)
+
+    def test_if_modified_since(self):
+        from datetime import timedelta
+        from django.utils import timezone
+        from .models import Kanban
+
+        url, params = reverse('kanban-list'), {'projectId': self.project.id}
+        resp = self.client.get(url, params)
+        last_modified = resp['Last-Modified']
+        self.assertEqual(self.client.get(url, params, HTTP_IF_MODIFIED_SINCE=last_modified).status_code, 304)
+
+        Kanban.objects.filter(project=self.project).update(update_at=timezone.now() + timedelta(seconds=2))
+        resp = self.client.get(url, params, HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(resp.status_code, 200)
+        self.assertNotEqual(resp['Last-Modified'], last_modified)
+
+
+class TestResponseCache(APITestCase):
+    def setUp(self) -> None:
+        super().setUp()
+
+        from .generate_mock_data import generate_mock_data, MOCK_USER_PASS
+
+        from django.test import override_settings
+
+        settings_override = override_settings(RESPONSE_CACHE=True)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.mock_data = generate_mock_data()
+        self.project = self.mock_data['tasks'][0].project
+        self.password = MOCK_USER_PASS
+        self.client.login(username='aweffr', password=MOCK_USER_PASS)
+
+    def get(self, url, params=None, **extra):
+        from .middleware import capture_queries
+
+        with capture_queries() as stats:
+            resp = self.client.get(url, params, **extra)
+        self.assertEqual(resp.status_code, 200)
+        return resp.data, sum(n for sql, n in stats.fingerprints.items() if 'FROM "jira_task"' in sql)
+
+    def test_hit_and_invalidation(self):
+        from .models import Project, Task
+        from .response_cache import get_versions
+
+        url, params = reverse('task-list'), {'projectId': self.project.id}
+        data, miss_queries = self.get(url, params)
+        cached, hit_queries = self.get(url, params)
+        self.assertEqual(cached, data)
+        # 命中时只剩条件 GET 的聚合查询
+        self.assertEqual((miss_queries, hit_queries), (2, 1))
+
+        # 其他项目的写入 (包括删除) 不影响本项目的版本号, 只更换全局版本号
+        versions, all_versions = get_versions(self.project.id), get_versions()
+        other = Project.objects.create(name='other', organization='other', person=self.mock_data['users'][0])
+        Task.objects.create(name='other task', type_id=1, project=other).delete()
+        self.assertEqual(get_versions(self.project.id), versions)
+        self.assertNotEqual(get_versions()[0], all_versions[0])
+        _, hit_queries = self.get(url, params)
+        self.assertEqual(hit_queries, 1)
+
+        # 嵌套输出的用户信息变化时失效
+        user = self.mock_data['users'][0]
+        user.first_name = 'renamed user'
+        user.save()
+        self.assertNotEqual(get_versions(self.project.id)[1], versions[1])
+
+        task = Task.objects.filter(project=self.project).first()
+        task.name = 'renamed'
+        task.save()
+        data, _ = self.get(url, params)
+        self.assertIn('renamed', [item['name'] for item in data])
+
+        # 批量排序走 bulk_update, 由 bulk_changed 信号更换版本号
+        first, second = Task.objects.filter(project=self.project).order_by('id')[:2]
+        resp = self.client.post(reverse('task-reorder'), [
+            {'from_id': first.id, 'reference_id': second.id, 'type': 'after',
+             'from_kanban_id': first.kanban_id, 'to_kanban_id': second.kanban_id},
+        ], format='json')
+        self.assertEqual(resp.status_code, 200)
+        data, _ = self.get(url, params)
+        ranks = {item['id']: (item['kanban_id'], item['rank']) for item in data}
+        self.assertEqual(ranks[first.id][0], second.kanban_id)
+        self.assertGreater(ranks[first.id][1], ranks[second.id][1])
+
+    def test_key_includes_host(self):
+        from .models import AppImage
+
+        user = self.mock_data['users'][0]
+        user.avatar = AppImage.objects.create(img='avatar.png', variants={'64': {'jpeg': 'blobs/avatar.jpg'}})
+        user.save()
+
+        # 头像地址按请求的 host 生成, 不同域名各自缓存
+        url, params = reverse('task-list'), {'projectId': self.project.id}
+        for host in ('a.example.com', 'b.example.com'):
+            data, miss_queries = self.get(url, params, HTTP_HOST=host)
+            self.assertEqual(miss_queries, 2)
+            self.assertIn(f'http://{host}/', json.dumps(data))
+        data, hit_queries = self.get(url, params, HTTP_HOST='a.example.com')
+        self.assertEqual(hit_queries, 1)
+        self.assertNotIn('b.example.com', json.dumps(data))
+
+    def test_task_moved_between_projects(self):
+        from .models import Project, Task
+
+        other = Project.objects.create(name='other', organization='other', person=self.mock_data['users'][0])
+        url = reverse('task-list')
+        tasks = list(Task.objects.filter(project=self.project).order_by('id')[:2])
+        self.get(url, {'projectId': self.project.id})
+        self.get(url, {'projectId': other.id})
+
+        resp = self.client.patch(reverse('task-detail', args=(tasks[0].id,)), {'projectId': other.id, 'kanbanId': None, 'epicId': None}, format='json')
+        self.assertEqual(resp.status_code, 200, resp.content)
+        resp = self.client.post(reverse('task-bulk'), {
+            'update': [{'id': tasks[1].id, 'projectId': other.id, 'kanbanId': None, 'epicId': None}],
+        }, format='json')
+        self.assertEqual(resp.status_code, 200, resp.content)
+
+        # 原项目与新项目的缓存都已失效
+        data, _ = self.get(url, {'projectId': self.project.id})
+        self.assertFalse({tasks[0].id, tasks[1].id} & {item['id'] for item in data})
+        data, _ = self.get(url, {'projectId': other.id})
+        self.assertEqual({item['id'] for item in data}, {tasks[0].id, tasks[1].id})
+
+    def test_pin_is_per_user(self):
+        url = reverse('project-list')
+        data, _ = self.get(url)
+        self.assertTrue(all(item['pin'] is None for item in data))
+
+        self.client.post(reverse('project-toggle-pin', args=(self.project.id,)), {'newVal': True}, format='json')
+        data, _ = self.get(url)
+        self.assertEqual({item['id']: item['pin'] for item in data}[self.project.id], True)
+
+        # 其他用户读到同一份缓存, pin 为自己的收藏状态
+        self.client.logout()
+        self.client.login(username=self.mock_data['users'][1].username, password=self.password)
+        data, _ = self.get(url)
+        self.assertEqual({item['id']: item['pin'] for item in data}[self.project.id], None)
+        data, _ = self.get(reverse('epic-list'), {'projectId': self.project.id})
+        self.assertTrue(all(item['project']['pin'] is None for item in data))
+
+    def test_single_builder(self):
+        import threading
+        from django.core.cache import cache
+        from .response_cache import get_or_build
+
+        key = 'jira:rc:test:single_builder'
+        cache.delete(key)
+        calls = []
+
+        def build():
+            calls.append(1)
+            return [1, 2, 3], True
+
+        # 另一个 worker 持有锁并在稍后写入结果
+        cache.add(f'{key}:lock', 1, 10)
+        timer = threading.Timer(0.1, lambda: cache.set(key, {'data': [1, 2, 3]}))
+        timer.start()
+        self.assertEqual(get_or_build(key, build), [1, 2, 3])
+        timer.join()
+        self.assertEqual(calls, [])
+
+        cache.delete(f'{key}:lock')
+        cache.delete(key)
+        self.assertEqual(get_or_build(key, build), [1, 2, 3])
+        self.assertEqual(get_or_build(key, build), [1, 2, 3])
+        self.assertEqual(len(calls), 1)
+        cache.delete(key)
+
+
+class TestEventStream(TransactionTestCase):
+    """事件流的连接在另一个线程中查询数据库, 需要已提交的数据"""
+
+    def setUp(self) -> None:
+        super().setUp()
+
+        from .generate_mock_data import generate_mock_data
+
+        self.mock_data = generate_mock_data()
+        self.project = self.mock_data['tasks'][0].project
+
+    @staticmethod
+    def scope(path, method='GET'):
+        return {'type': 'http', 'method': method, 'path': path, 'query_string': b'', 'headers': []}
+
+    def run_stream(self, scenario):
+        from asgiref.sync import async_to_sync
+        from asgiref.testing import ApplicationCommunicator
+        from jira_backend.asgi import application
+
+        async def run():
+            communicator = ApplicationCommunicator(application, self.scope(f'/api/v1/projects/{self.project.id}/events'))
+            await communicator.send_input({'type': 'http.request'})
+            start = await communicator.receive_output(5)
+            self.assertEqual(start['status'], 200)
+            self.assertIn((b'content-type', b'text/event-stream; charset=utf-8'), start['headers'])
+            ready = await communicator.receive_output(5)
+            self.assertIn(b'event: ready', ready['body'])
+            try:
+                await scenario(communicator)
+            finally:
+                await communicator.send_input({'type': 'http.disconnect'})
+                await communicator.wait(5)
+
+        async_to_sync(run)()
+
+    def test_events(self):
+        from asgiref.sync import sync_to_async
+        from .events import get_broker
+        from .models import Project, Task
+
+        task = self.mock_data['tasks'][0]
+
+        def change():
+            # 其他项目的事件不会发到本项目的频道
+            Project.objects.create(name='other', organization='other', person=self.project.person)
+            task.name = 'renamed'
+            task.save()
+            Task.objects.filter(pk=task.pk).delete()
+
+        async def scenario(communicator):
+            self.assertEqual(get_broker().subscriber_count(), 1)
+            await sync_to_async(change)()
+            body = (await communicator.receive_output(5))['body'].decode()
+            self.assertIn('event: task.saved', body)
+            data = json.loads(body.split('data: ', 1)[1])
+            self.assertEqual((data['id'], data['name'], data['projectId']), (task.id, 'renamed', self.project.id))
+            body = (await communicator.receive_output(5))['body'].decode()
+            self.assertIn('event: task.deleted', body)
+
+        self.run_stream(scenario)
+        self.assertEqual(get_broker().subscriber_count(), 0)
+
+    def test_moved_task_deleted_from_old_project(self):
+        from asgiref.sync import sync_to_async
+        from .models import Project
+
+        task = self.mock_data['tasks'][0]
+
+        def move():
+            other = Project.objects.create(name='other', organization='other', person=self.project.person)
+            task.project, task.kanban, task.epic = other, None, None
+            task.save()
+
+        async def scenario(communicator):
+            await sync_to_async(move)()
+            body = (await communicator.receive_output(5))['body'].decode()
+            self.assertIn('event: task.deleted', body)
+            self.assertEqual(json.loads(body.split('data: ', 1)[1]), {'id': task.id, 'projectId': self.project.id})
+
+        self.run_stream(scenario)
+
+    def test_heartbeat_and_not_found(self):
+        from asgiref.sync import async_to_sync
+        from asgiref.testing import ApplicationCommunicator
+        from django.test import override_settings
+        from jira_backend.asgi import application
+
+        async def scenario(communicator):
+            self.assertEqual((await communicator.receive_output(5))['body'], b': ping\n\n')
+
+        with override_settings(EVENTS_HEARTBEAT=0.05):
+            self.run_stream(scenario)
+
+        async def not_found():
+            communicator = ApplicationCommunicator(application, self.scope('/api/v1/projects/0/events'))
+            await communicator.send_input({'type': 'http.request'})
+            return await communicator.receive_output(5)
+
+        self.assertEqual(async_to_sync(not_found)()['status'], 404)
+
+
+class TestQueryFanout(TransactionTestCase):
+    """线程池中的连接只能读到已提交的数据"""
+
+    def setUp(self) -> None:
+        super().setUp()
+
+        from .generate_mock_data import generate_mock_data
+
+        self.mock_data = generate_mock_data()
+        self.project = self.mock_data['tasks'][0].project
+
+    def test_board_matches_serial(self):
+        import threading
+        from django.test import override_settings
+        from .middleware import capture_queries
+
+        url = reverse('project-board', args=(self.project.id,))
+        with override_settings(QUERY_FANOUT_WORKERS=0):
+            with capture_queries() as serial:
+                expected = self.client.get(url).content
+
+        threads = set()
+
+        def record_thread(execute, sql, params, many, context):
+            threads.add(threading.current_thread().name)
+            return execute(sql, params, many, context)
+
+        from django.db import connection
+        with override_settings(QUERY_FANOUT_WORKERS=2), connection.execute_wrapper(record_thread):
+            with capture_queries() as parallel:
+                self.assertEqual(self.client.get(url).content, expected)
+        # 线程池中执行的查询同样被统计
+        self.assertEqual(parallel.count, serial.count)
+        self.assertTrue(any(name.startswith('query-fanout') for name in threads))
+
+    def test_reserves_pool_connections(self):
+        import threading
+        from django.test import override_settings
+        from . import fanout
+        from .db import pool as db_pool
+
+        pool = db_pool.ConnectionPool(max_size=2, timeout=1)
+        db_pool._pools['default'] = pool
+        self.addCleanup(db_pool._pools.pop, 'default', None)
+
+        def thread_name():
+            return threading.current_thread().name
+
+        with override_settings(QUERY_FANOUT_WORKERS=2):
+            names = fanout.run(thread_name, thread_name, thread_name)
+            self.assertTrue(all(name.startswith('query-fanout') for name in names[1:]))
+            # 没有用到的预留已归还
+            self.assertEqual(pool.stats()['size'], 0)
+
+            # 池中只剩一个连接, 两个 worker 预留失败, 在当前线程中依次执行
+            held = pool.try_reserve(1)
+            self.assertEqual(fanout.run(thread_name, thread_name, thread_name), [thread_name()] * 3)
+            self.assertEqual(pool.stats()['reserve_failures'], 1)
+            pool.release(held[0])
+
+    def test_serial_inside_transaction(self):
+        from django.db import transaction
+        from . import fanout
+
+        with transaction.atomic():
+            self.assertFalse(fanout.can_fanout(2))
+        self.assertTrue(fanout.can_fanout(2))
+        self.assertEqual(fanout.run(lambda: 1, lambda: 2, lambda: 3), [1, 2, 3])
+        with self.assertRaises(ZeroDivisionError):
+            fanout.run(lambda: 1, lambda: 1 / 0)
+
+
+class TestImagePipeline(APITestCase):
+    def setUp(self) -> None:
+        super().setUp()
+
+        import tempfile
+        from django.test import override_settings
+        from .generate_mock_data import generate_mock_data, MOCK_USER_PASS
+
+        self.mock_data = generate_mock_data()
+        self.client.login(username='aweffr', password=MOCK_USER_PASS)
+
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        settings_override = override_settings(MEDIA_ROOT=media_root.name, IMAGE_WORKERS=0)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    @staticmethod
+    def make_upload(size, orientation=None, name='photo.jpg'):
+        import io
+        from django.core.files.uploadedfile import SimpleUploadedFile
+        from PIL import Image
+
+        buf = io.BytesIO()
+        exif = Image.Exif()
+        if orientation is not None:
+            exif[0x0112] = orientation
+        Image.new('RGB', size, (200, 30, 30)).save(buf, format='JPEG', exif=exif.tobytes())
+        return SimpleUploadedFile(name, buf.getvalue(), content_type='image/jpeg')
+
+    def test_upload_then_process(self):
+        from django.core.files.storage import default_storage
+        from PIL import Image
+        from .models import AppImage
+
+        # 方向 6: 需要顺时针旋转 90 度显示
+        with self.captureOnCommitCallbacks() as callbacks:
+            resp = self.client.post(reverse('appimage-list'), {'img': self.make_upload((1200, 600), orientation=6), 'desc': 'x'})
+        self.assertEqual(resp.status_code, 201, resp.data)
+        self.assertEqual((resp.data['status'], resp.data['width'], resp.data['height']), (AppImage.STATUS_PENDING, 1200, 600))
+        self.assertEqual(resp.data['variants'], {})
+
+        for callback in callbacks:
+            callback()
+        image = AppImage.objects.get(pk=resp.data['id'])
+        self.assertEqual((image.status, image.width, image.height), (AppImage.STATUS_READY, 600, 1200))
+        self.assertEqual(sorted(image.variants, key=int), ['64', '256', '1024'])
+        with default_storage.open(image.variants['64']['jpeg']) as f, Image.open(f) as thumbnail:
+            self.assertEqual(thumbnail.size, (32, 64))
+
+        resp = self.client.get(reverse('appimage-detail', args=(image.id,)))
+        self.assertTrue(resp.data['variants']['256']['jpeg'].startswith('http://testserver/api/media/blobs/'))
+
+        # 头像的缩略图地址同样出现在快速只读序列化的输出中
+        from django.test import override_settings
+        user = self.mock_data['users'][0]
+        user.avatar = image
+        user.save()
+        url = reverse('user-list')
+        with override_settings(FAST_READ_PATH=True):
+            fast = self.client.get(url).content
+        with override_settings(FAST_READ_PATH=False):
+            slow = self.client.get(url).content
+        self.assertEqual(fast, slow)
+        self.assertIn(b'blobs/', fast)
+
+    def test_invalid_and_failed(self):
+        from django.core.files.uploadedfile import SimpleUploadedFile
+        from .images import process_image
+        from .models import AppImage
+
+        resp = self.client.post(reverse('appimage-list'), {'img': SimpleUploadedFile('a.jpg', b'not an image')})
+        self.assertEqual(resp.status_code, 400)
+
+        # 小图不生成缩略图; 原图文件丢失时标记为失败
+        with self.captureOnCommitCallbacks(execute=True):
+            resp = self.client.post(reverse('appimage-list'), {'img': self.make_upload((40, 40))})
+        image = AppImage.objects.get(pk=resp.data['id'])
+        self.assertEqual((image.status, image.variants), (AppImage.STATUS_READY, {}))
+
+        image.img.storage.delete(image.img.name)
+        self.assertEqual(process_image(image.pk).status, AppImage.STATUS_FAILED)
+
+    def test_dedupe(self):
+        import hashlib
+        from django.core.files.storage import default_storage
+        from .models import AppImage
+
+        upload = self.make_upload((300, 300))
+        content = upload.read()
+        upload.seek(0)
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            first = self.client.post(reverse('appimage-list'), {'img': upload, 'desc': 'a'}).data
+        self.assertEqual(len(callbacks), 1)
+        first = AppImage.objects.get(pk=first['id'])
+        self.assertEqual(first.sha256, hashlib.sha256(content).hexdigest())
+        self.assertEqual(first.img.name, f'blobs/{first.sha256[:2]}/{first.sha256[2:4]}/{first.sha256}.jpg')
+
+        # 相同内容: 新的一行, 共用文件与缩略图, 不再后台处理
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            resp = self.client.post(reverse('appimage-list'), {'img': self.make_upload((300, 300), name='b.jpg'), 'desc': 'b'})
+        self.assertEqual(callbacks, [])
+        self.assertEqual(resp.data['status'], AppImage.STATUS_READY)
+        second = AppImage.objects.get(pk=resp.data['id'])
+        self.assertNotEqual(second.pk, first.pk)
+        self.assertEqual((second.img.name, second.variants), (first.img.name, first.variants))
+        self.assertEqual(len(default_storage.listdir(f'blobs/{first.sha256[:2]}/{first.sha256[2:4]}')[1]), 1)
+
+    def test_serve_blob(self):
+        from django.test import override_settings
+        from .models import AppImage
+
+        with self.captureOnCommitCallbacks(execute=True):
+            resp = self.client.post(reverse('appimage-list'), {'img': self.make_upload((300, 300))})
+        image = AppImage.objects.get(pk=resp.data['id'])
+        url = f'/api/media/{image.variants["64"]["jpeg"]}'
+
+        resp = self.client.get(url)
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp['Content-Type'], 'image/jpeg')
+        self.assertIn('immutable', resp['Cache-Control'])
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=resp['ETag']).status_code, 304)
+
+        with override_settings(BLOB_SENDFILE='x-accel-redirect'):
+            resp = self.client.get(f'/api/media/{image.img.name}')
+        self.assertEqual(resp['X-Accel-Redirect'], f'/protected-media/{image.img.name}')
+        self.assertEqual(resp.content, b'')
+
+        self.assertEqual(self.client.get('/api/media/blobs/../settings.py').status_code, 404)
+        self.assertEqual(self.client.get(f'/api/media/blobs/00/00/{"0" * 64}.jpg').status_code, 404)
+
+
+class TestConnectionPool(TestCase):
+    """jira.db.pool: 连接数不超过上限, 池满时等待或超时, 失效的连接被替换"""
+
+    def make_pool(self, max_size, timeout=5):
+        import itertools
+        from .db.pool import ConnectionPool
+
+        counter = itertools.count()
+
+        class FakeConnection:
+            def __init__(self):
+                self.id = next(counter)
+                self.closed = False
+
+            def close(self):
+                self.closed = True
+
+        return ConnectionPool(max_size=max_size, timeout=timeout), FakeConnection
+
+    def test_bounded_under_concurrency(self):
+        import threading
+        import time
+
+        pool, FakeConnection = self.make_pool(max_size=3)
+        lock = threading.Lock()
+        in_use, peak = set(), [0]
+
+        def worker():
+            for _ in range(5):
+                entry = pool.checkout(FakeConnection, lambda connection: True)
+                with lock:
+                    self.assertNotIn(entry.connection.id, in_use)
+                    in_use.add(entry.connection.id)
+                    peak[0] = max(peak[0], len(in_use))
+                time.sleep(0.002)
+                with lock:
+                    in_use.discard(entry.connection.id)
+                pool.checkin(entry)
+
+        threads = [threading.Thread(target=worker) for _ in range(16)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        stats = pool.stats()
+        self.assertEqual(peak[0], 3)
+        self.assertEqual(stats['created'], 3)
+        self.assertEqual(stats['checkouts'], 16 * 5)
+        self.assertEqual((stats['size'], stats['idle'], stats['in_use']), (3, 3, 0))
+        self.assertGreater(stats['waits'], 0)
+
+    def test_timeout_and_health_check(self):
+        from .db.pool import PoolTimeout
+
+        pool, FakeConnection = self.make_pool(max_size=1, timeout=0.05)
+        entry = pool.checkout(FakeConnection, lambda connection: True)
+        with self.assertRaises(PoolTimeout):
+            pool.checkout(FakeConnection, lambda connection: True)
+        self.assertEqual(pool.stats()['timeouts'], 1)
+
+        pool.checkin(entry)
+        # 健康检查失败的连接被关闭, 换一个新连接
+        replacement = pool.checkout(FakeConnection, lambda connection: False)
+        self.assertTrue(entry.connection.closed)
+        self.assertNotEqual(replacement.connection.id, entry.connection.id)
+        self.assertTrue(replacement.fresh)
+        stats = pool.stats()
+        self.assertEqual((stats['health_check_failures'], stats['created'], stats['size']), (1, 2, 1))
+
+    def test_try_reserve(self):
+        pool, FakeConnection = self.make_pool(max_size=3)
+        idle = pool.checkout(FakeConnection, lambda connection: True)
+        pool.checkin(idle)
+
+        reserved = pool.try_reserve(2)
+        self.assertEqual(reserved, [idle, None])
+        # 不够时不等待, 也不占用
+        self.assertIsNone(pool.try_reserve(2))
+        self.assertEqual((pool.stats()['reserve_failures'], pool.available()), (1, 1))
+
+        # 预留的空闲连接直接借出, 预留的名额新建连接
+        self.assertIs(pool.checkout(FakeConnection, lambda connection: True, reserved[0]), idle)
+        created = pool.checkout(FakeConnection, lambda connection: True, reserved[1])
+        self.assertTrue(created.fresh)
+        self.assertEqual(pool.stats()['size'], 2)
+
+        unused = pool.try_reserve(1)
+        pool.release(unused[0])
+        stats = pool.stats()
+        self.assertEqual((stats['size'], stats['in_use'], pool.available()), (2, 2, 1))
+
+    def test_pooled_backend(self):
+        import tempfile
+        import threading
+        import time
+        from django.db.utils import ConnectionHandler
+        from .db import pool as db_pool
+
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        alias = 'pool_test'
+        handler = ConnectionHandler({'default': {}, alias: {
+            'ENGINE': 'jira.db.backends.sqlite3',
+            'NAME': os.path.join(tmpdir.name, 'pool.sqlite3'),
+            'POOL': {'MAX_SIZE': 2, 'TIMEOUT': 5},
+        }})
+        self.addCleanup(db_pool._pools.pop, alias, None)
+
+        errors = []
+
+        def worker():
+            try:
+                for _ in range(3):
+                    connection = handler[alias]
+                    with connection.cursor() as cursor:
+                        cursor.execute('SELECT 1')
+                        self.assertEqual(cursor.fetchone(), (1,))
+                    self.assertLessEqual(db_pool.pool_stats()[alias]['in_use'], 2)
+                    time.sleep(0.002)
+                    # 请求结束时 close_old_connections 关闭连接, 即归还到池中
+                    connection.close()
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=worker) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        stats = db_pool.pool_stats()[alias]
+        self.assertEqual(stats['checkouts'], 8 * 3)
+        self.assertLessEqual(stats['created'], 2)
+        self.assertEqual(stats['in_use'], 0)
+        db_pool._pools[alias].close_idle()
+
+
+class TestStartup(TestCase):
+    def test_migrate_skipped_when_up_to_date(self):
+        from .startup import migrate_if_needed, pending_migrations
+
+        fingerprint, pending = pending_migrations()
+        self.assertEqual(pending, [])
+        self.assertEqual(migrate_if_needed(), (False, fingerprint, 0))
+
+    def test_collectstatic_only_when_changed(self):
+        import tempfile
+        from django.test import override_settings
+        from .startup import collectstatic_if_needed
+
+        static_root = tempfile.TemporaryDirectory()
+        source_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(static_root.cleanup)
+        self.addCleanup(source_dir.cleanup)
+        source = os.path.join(source_dir.name, 'app.css')
+        with open(source, 'w') as file:
+            file.write('body {}')
+
+        with override_settings(STATIC_ROOT=static_root.name, STATICFILES_DIRS=[source_dir.name]):
+            collected, first = collectstatic_if_needed(verbosity=0)
+            self.assertTrue(collected)
+            self.assertTrue(os.path.exists(os.path.join(static_root.name, 'app.css')))
+            self.assertEqual(collectstatic_if_needed(verbosity=0), (False, first))
+
+            with open(source, 'w') as file:
+                file.write('body { margin: 0 }')
+            collected, second = collectstatic_if_needed(verbosity=0)
+            self.assertTrue(collected)
+            self.assertNotEqual(first, second)
+
+
+class TestChangeFeed(TransactionTestCase):
+    """变更记录与修改在同一个事务中提交, 需要真实提交的事务"""
+
+    def setUp(self) -> None:
+        super().setUp()
+
+        from rest_framework.test import APIClient
+        from .generate_mock_data import generate_mock_data, MOCK_USER_PASS
+
+        self.mock_data = generate_mock_data()
+        self.task = self.mock_data['tasks'][0]
+        self.project = self.task.project
+        self.client = APIClient()
+        self.client.login(username='aweffr', password=MOCK_USER_PASS)
+        self.other = APIClient()
+        self.other.login(username='guying', password=MOCK_USER_PASS)
+
+    def changes(self, client, since, **params):
+        resp = client.get(reverse('changes-list'), {'since': since, **params})
+        self.assertEqual(resp.status_code, 200)
+        return resp.json()
+
+    def test_feed(self):
+        from .middleware import capture_queries
+
+        cursor = self.client.get(reverse('changes-list')).json()['cursor']
+
+        resp = self.client.post(reverse('kanban-list'), {'name': 'k', 'projectId': self.project.id})
+        self.assertEqual(resp.status_code, 201)
+        kanban_id = resp.data['id']
+        with capture_queries() as stats:
+            resp = self.client.patch(reverse('task-detail', args=(self.task.id,)), {'name': 'renamed'}, format='json')
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(sum(n for sql, n in stats.fingerprints.items() if 'INSERT INTO "jira_changelogentry"' in sql), 1)
+        self.assertEqual(self.client.delete(reverse('task-detail', args=(self.task.id,))).status_code, 204)
+        resp = self.client.post(reverse('project-toggle-pin', args=(self.project.id,)), {'new_val': True}, format='json')
+        self.assertEqual(resp.status_code, 200)
+
+        data = self.changes(self.client, cursor, projectId=self.project.id)
+        self.assertEqual(
+            [(item['type'], item['action'], item['objectId']) for item in data['results']],
+            [
+                ('kanban', 'create', kanban_id),
+                ('task', 'update', self.task.id),
+                ('task', 'delete', self.task.id),
+                ('projectUserSetting', 'update', self.project.id),
+            ],
+        )
+        self.assertEqual(data['results'][1]['data']['name'], 'renamed')
+        self.assertEqual(data['results'][3]['data'], {'projectId': self.project.id, 'isPinned': True})
+        self.assertEqual(data['cursor'], data['results'][-1]['id'])
+        self.assertFalse(data['hasMore'])
+        self.assertEqual(self.changes(self.client, data['cursor'])['results'], [])
+
+        # 收藏设置只对本人可见
+        other = self.changes(self.other, cursor)
+        self.assertEqual([item['type'] for item in other['results']], ['kanban', 'task', 'task'])
+        paged = self.changes(self.other, cursor, limit=2)
+        self.assertTrue(paged['hasMore'])
+        self.assertEqual(paged['cursor'], other['results'][1]['id'])
+
+    def test_rollback_and_compaction(self):
+        from django.core.management import call_command
+        from django.db import transaction
+        from .models import ChangeLogEntry, Task
+
+        cursor = self.client.get(reverse('changes-list')).json()['cursor']
+        with self.assertRaises(ZeroDivisionError), transaction.atomic():
+            Task.objects.filter(pk=self.task.pk).first().save()
+            1 / 0
+        self.assertEqual(self.changes(self.client, cursor)['results'], [])
+
+        for name in ('a', 'b', 'c'):
+            self.client.patch(reverse('task-detail', args=(self.task.id,)), {'name': name}, format='json')
+        before = self.changes(self.client, cursor)['results']
+        self.assertEqual(len(before), 3)
+
+        call_command('compact_changes', hours=0, stdout=open(os.devnull, 'w'))
+        after = self.changes(self.client, cursor)['results']
+        self.assertEqual(after, before[-1:])
+        self.assertEqual(after[0]['data']['name'], 'c')
+        self.assertFalse(ChangeLogEntry.objects.filter(seq__in=[item['id'] for item in before[:-1]]).exists())
+
+
+    def test_entries_written_in_transaction(self):
+        from django.db import transaction
+        from . import changelog
+        from .models import ChangeLogEntry, Task
+
+        cursor = changelog.head()
+        with transaction.atomic():
+            Task.objects.get(pk=self.task.pk).save()
+            with self.assertRaises(ZeroDivisionError), transaction.atomic():
+                Task.objects.get(pk=self.task.pk).delete()
+                1 / 0
+            # 提交之前已经写入, 回滚到保存点的删除不记录
+            self.assertEqual(
+                list(ChangeLogEntry.objects.filter(seq__gt=cursor).values_list('seq', 'action')),
+                [(cursor + 1, ChangeLogEntry.ACTION_UPDATE)],
+            )
+
+        # 事务回滚时修改、记录与分配的序号一并回滚, 序号没有空洞
+        with self.assertRaises(ZeroDivisionError), transaction.atomic():
+            Task.objects.get(pk=self.task.pk).save()
+            1 / 0
+        self.assertEqual(changelog.head(), cursor + 1)
+
+        # 不在事务中时 save 自带事务
+        Task.objects.get(pk=self.task.pk).save()
+        self.assertEqual(list(ChangeLogEntry.objects.filter(seq__gt=cursor).values_list('seq', flat=True)), [cursor + 1, cursor + 2])
+        self.assertEqual(len(self.changes(self.client, cursor)['results']), 2)
+
+    def test_moved_to_other_project(self):
+        from .models import Project
+
+        other = Project.objects.create(name='other', organization='other', person=self.mock_data['users'][0])
+        cursor = self.client.get(reverse('changes-list')).json()['cursor']
+        resp = self.client.patch(
+            reverse('task-detail', args=(self.task.id,)), {'projectId': other.id, 'kanbanId': None, 'epicId': None},
+            format='json',
+        )
+        self.assertEqual(resp.status_code, 200, resp.content)
+        moved = self.mock_data['tasks'][1]
+        resp = self.client.post(reverse('task-bulk'), {
+            'update': [{'id': moved.id, 'projectId': other.id, 'kanbanId': None, 'epicId': None}],
+        }, format='json')
+        self.assertEqual(resp.status_code, 200, resp.content)
+
+        # 按原项目过滤的客户端收到 delete
+        old = self.changes(self.client, cursor, projectId=self.project.id)['results']
+        self.assertEqual(
+            [(item['action'], item['objectId']) for item in old if item['type'] == 'task'],
+            [('delete', self.task.id), ('delete', moved.id)],
+        )
+        new = self.changes(self.client, cursor, projectId=other.id)['results']
+        self.assertEqual([(item['action'], item['objectId']) for item in new], [('update', self.task.id), ('update', moved.id)])
+
+
+class TestTaskBulk(APITestCase):
+    def setUp(self) -> None:
+        super().setUp()
+
+        from .generate_mock_data import generate_mock_data, MOCK_USER_PASS
+
+        self.mock_data = generate_mock_data()
+        self.project = self.mock_data['tasks'][0].project
+        self.kanban = self.mock_data['tasks'][0].kanban
+        self.client.login(username='aweffr', password=MOCK_USER_PASS)
+
+    def post(self, payload):
+        from .middleware import capture_queries
+
+        with capture_queries() as stats:
+            resp = self.client.post(reverse('task-bulk'), payload, format='json')
+        return resp, stats
+
+    def test_bulk_write(self):
+        from .models import Task, User, RANK_STEP
+        from .search import search
+
+        tasks = list(Task.objects.filter(project=self.project).order_by('id')[:2])
+        last_rank = Task.objects.filter(kanban=self.kanban).order_by('-rank').first().rank
+        creates = [
+            {'name': f'导入任务{i}', 'projectId': self.project.id, 'kanbanId': self.kanban.id, 'typeId': 1, 'note': ''}
+            for i in range(30)
+        ]
+        creates.append({'name': '无看板任务', 'projectId': self.project.id, 'typeId': 2})
+        resp, stats = self.post({
+            'create': creates,
+            'update': [{'id': tasks[0].id, 'name': '改名后的任务'}],
+            'delete': [tasks[1].id],
+        })
+        self.assertEqual(resp.status_code, 200, resp.content)
+        data = resp.json()
+        # 查询次数与条数无关 (含读取会话)
+        self.assertLess(stats.count, 41)
+
+        created = data['create']
+        self.assertEqual(len(created), 31)
+        self.assertEqual([item['rank'] for item in created[:3]], [last_rank + RANK_STEP * i for i in (1, 2, 3)])
+        me = User.objects.get(username='aweffr')
+        for item in created:
+            task = Task.objects.get(pk=item['id'])
+            self.assertEqual((task.name, task.rank, task.reporter_id), (item['name'], item['rank'], me.id))
+        self.assertIsNone(created[-1]['kanbanId'])
+        self.assertEqual(data['update'][0]['name'], '改名后的任务')
+        self.assertEqual(data['delete'], [tasks[1].id])
+        self.assertFalse(Task.objects.filter(pk=tasks[1].id).exists())
+        self.assertEqual([item['id'] for item in search('导入任务29', doc_types=[4])], [created[29]['id']])
+
+    def test_recover_ids_ignores_rank_collisions(self):
+        from django.db.models import Max
+        from .models import Task
+        from .serializers import TaskBulkSerializer
+
+        # 并发修改移入看板的任务可能与新任务的 rank 相同
+        existing = Task.objects.filter(kanban=self.kanban).first()
+        id_floor = Task.objects.aggregate(Max('id'))['id__max']
+        tasks = [
+            Task(name=name, project_id=self.project.id, kanban_id=self.kanban.id, type_id=1, rank=existing.rank)
+            for name in ('a', 'b')
+        ]
+        Task.objects.bulk_create(tasks)
+        expected = list(Task.objects.filter(id__gt=id_floor).order_by('id').values_list('id', flat=True))
+        for task in tasks:
+            task.pk = None
+        TaskBulkSerializer()._recover_ids(tasks, id_floor)
+        self.assertEqual([task.pk for task in tasks], expected)
+        self.assertNotIn(existing.pk, expected)
+
+    def test_validation_is_all_or_nothing(self):
+        from .models import Task
+
+        count = Task.objects.count()
+        resp, _ = self.post({'create': [
+            {'name': 'ok', 'projectId': self.project.id},
+            {'projectId': self.project.id},
+        ]})
+        self.assertEqual(resp.status_code, 400)
+        self.assertEqual(resp.json()['create'][0], {})
+        self.assertIn('name', resp.json()['create'][1])
+
+        resp, _ = self.post({'create': [{'name': 'ok', 'projectId': self.project.id, 'kanbanId': 10 ** 9}]})
+        self.assertEqual(resp.status_code, 400)
+        self.assertIn('create[0].kanbanId is invalid', resp.json()['msg'][0])
+
+        resp, _ = self.post({'update': [{'name': 'x'}], 'delete': [10 ** 9]})
+        self.assertEqual(resp.status_code, 400)
+        self.assertEqual(Task.objects.count(), count)
+
+        # 批量接口只在任务上提供
+        from django.urls import NoReverseMatch
+        with self.assertRaises(NoReverseMatch):
+            reverse('kanban-bulk')
@@ -1,4 +1,3 @@
-from pprint import pprint
 from django.urls import include, path
 from django.views.decorators.csrf import csrf_exempt
 
@@ -12,8 +11,8 @@ router.register(r'projects', views.ProjectViewSet)
 router.register(r'epics', views.EpicViewSet)
 router.register(r'kanbans', views.KanbanViewSet)
 router.register(r'tasks', views.TaskViewSet)
-
-pprint(router.get_urls())
+router.register(r'search', views.SearchViewSet, basename='search')
+router.register(r'changes', views.ChangeFeedViewSet, basename='changes')
 
 urlpatterns = [
     path('', include(router.urls)),
@@ -1,4 +1,7 @@
-from rest_framework import authentication
+from functools import partial
+
+from django.db import IntegrityError, transaction
+from django.utils import timezone
 from rest_framework import exceptions
 from rest_framework import mixins
 from rest_framework import permissions
@@ -9,14 +12,25 @@ from rest_framework.request import Request
 from rest_framework.response import Response
 from rest_framework.viewsets import ModelViewSet, GenericViewSet
 from django_filters import rest_framework as filters
-
-from .authentication import MySessionAuthentication
+from django_filters.widgets import BooleanWidget
+
+from .authentication import MySessionAuthentication, CachedTokenAuthentication, token_cache
+from . import changelog, fanout, images, search
+from .compiled import CompiledReadMixin
+from .db.pool import pool_stats
+from .pagination import CursorOrPageNumberPagination
+from .response_cache import ResponseCacheMixin
+from .conditional import (
+    ConditionalGetMixin, change_stamp, make_etag, not_modified_response, pin_validator, queryset_validator,
+    set_validators,
+)
 
 from .models import (
     User,
     AppImage,
     Project,
     ProjectUserSetting, Epic, Kanban, Task,
+    annotate_pin, annotate_pinned_rank, pinned_project_ids,
 )
 from .serializers import (
     UserSerializer,
@@ -24,8 +38,55 @@ from .serializers import (
     ProjectSerializer,
     EpicSerializer,
     KanbanSerializer,
-    TaskSerializer, ProjectTogglePinSerializer, SortParamsSerializer
+    TaskSerializer, ProjectTogglePinSerializer, SortParamsSerializer, SortParamsListSerializer,
+    BoardTaskSerializer,
+    FieldSpec,
+    SearchParamsSerializer,
+    ChangeFeedParamsSerializer,
+    TaskBulkSerializer,
 )
+from .renderers import underscoreize
+
+
+class DynamicFieldsViewMixin:
+    """
+    为 GET 请求解析 ?fields= / ?expand= (见 serializers.FieldSpec), 传给序列化器裁剪字段,
+    并只 select_related 实际会输出的关联。
+    expand_select_related: {字段路径: 输出该字段需要的 select_related 参数}
+    """
+    expand_select_related = {}
+    field_spec_actions = ('list', 'retrieve')
+
+    def get_field_spec(self):
+        if not hasattr(self, '_field_spec'):
+            if self.request is not None and self.action in self.field_spec_actions:
+                self._field_spec = FieldSpec.from_request(self.request)
+            else:
+                self._field_spec = None
+        return self._field_spec
+
+    def field_requested(self, path, nested=True):
+        spec = self.get_field_spec()
+        return spec is None or spec.includes(path, nested)
+
+    def get_serializer_context(self):
+        ctx = super().get_serializer_context()
+        ctx['field_spec'] = self.get_field_spec()
+        return ctx
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.get_field_spec() is None:
+            return queryset
+        related = [
+            item
+            for path, items in self.expand_select_related.items() if self.field_requested(path)
+            for item in items
+        ]
+        queryset = queryset.select_related(None)
+        if related:
+            queryset = queryset.select_related(*related)
+        return queryset
 
 
 class AllowPostByAnyOne(permissions.BasePermission):
@@ -36,10 +97,10 @@ class AllowPostByAnyOne(permissions.BasePermission):
             return bool(request.user and request.user.is_authenticated)
 
 
-class UserViewSet(mixins.ListModelMixin, mixins.RetrieveModelMixin, mixins.CreateModelMixin, mixins.UpdateModelMixin, GenericViewSet):
+class UserViewSet(CompiledReadMixin, DynamicFieldsViewMixin, mixins.ListModelMixin, mixins.RetrieveModelMixin, mixins.CreateModelMixin, mixins.UpdateModelMixin, GenericViewSet):
     authentication_classes = (
         MySessionAuthentication,
-        authentication.TokenAuthentication,
+        CachedTokenAuthentication,
     )
     permission_classes = (
         AllowPostByAnyOne,
@@ -47,8 +108,12 @@ class UserViewSet(mixins.ListModelMixin, mixins.RetrieveModelMixin, mixins.Creat
 
     lookup_field = 'username'
 
-    queryset = User.objects.all()
+    queryset = User.objects.select_related('avatar').all()
     serializer_class = UserSerializer
+    expand_select_related = {
+        'avatar': ('avatar',),
+    }
+    field_spec_actions = ('list', 'retrieve', 'about_me')
 
     def retrieve(self, request: Request, *args, **kwargs):
         if request.user.is_anonymous:
@@ -64,13 +129,27 @@ class UserViewSet(mixins.ListModelMixin, mixins.RetrieveModelMixin, mixins.Creat
     def about_me(self, request: Request, **kwargs):
         if request.user.is_anonymous:
             raise exceptions.PermissionDenied
-        return Response(UserSerializer(instance=request.user, context={'request': request}).data)
+        return Response(UserSerializer(instance=request.user, context=self.get_serializer_context()).data)
+
+    @action(methods=['GET', ], detail=False, url_path="auth-cache-stats")
+    def auth_cache_stats(self, request: Request, **kwargs):
+        """当前进程的 token 认证缓存命中情况, 仅管理员可见"""
+        if not request.user.is_staff:
+            raise exceptions.PermissionDenied
+        return Response(token_cache.stats())
+
+    @action(methods=['GET', ], detail=False, url_path="db-pool-stats")
+    def db_pool_stats(self, request: Request, **kwargs):
+        """当前进程的数据库连接池使用情况, 仅管理员可见"""
+        if not request.user.is_staff:
+            raise exceptions.PermissionDenied
+        return Response(pool_stats())
 
 
-class AppImageViewSet(mixins.RetrieveModelMixin, mixins.CreateModelMixin, GenericViewSet):
+class AppImageViewSet(DynamicFieldsViewMixin, mixins.RetrieveModelMixin, mixins.CreateModelMixin, GenericViewSet):
     authentication_classes = (
         MySessionAuthentication,
-        authentication.TokenAuthentication,
+        CachedTokenAuthentication,
     )
     permission_classes = (
         permissions.IsAuthenticatedOrReadOnly,
@@ -79,6 +158,11 @@ class AppImageViewSet(mixins.RetrieveModelMixin, mixins.CreateModelMixin, Generi
     queryset = AppImage.objects.all()
     serializer_class = AppImageSerializer
 
+    def perform_create(self, serializer):
+        image = serializer.save()
+        if image.status == AppImage.STATUS_PENDING:
+            images.schedule(image.pk)
+
 
 class MyObtainAuthTokenAPI(ObtainAuthToken):
 
@@ -93,13 +177,35 @@ class MyObtainAuthTokenAPI(ObtainAuthToken):
         })
 
 
-class ProjectFilter(filters.FilterSet):
-    name = filters.CharFilter(label='按名称搜索', field_name='name', lookup_expr='icontains')
+class SearchFilterSet(filters.FilterSet):
+    """name 与 q 的结果等同于 icontains, 但先经 jira.search 的倒排索引缩小范围"""
+    name = filters.CharFilter(label='按名称搜索', method='filter_name')
+    q = filters.CharFilter(label='按名称与说明搜索', method='filter_q')
+
+    # noinspection PyUnusedLocal
+    def filter_name(self, queryset, name, value):
+        return search.filter_queryset(queryset, value, name_only=True)
+
+    # noinspection PyUnusedLocal
+    def filter_q(self, queryset, name, value):
+        return search.filter_queryset(queryset, value)
+
+
+class ProjectFilter(SearchFilterSet, filters.FilterSet):
     personId = filters.NumberFilter(field_name='person_id', lookup_expr='exact')
 
     createAtMin = filters.DateTimeFilter(field_name='create_at', lookup_expr='gte')
     createAtMax = filters.DateTimeFilter(field_name='create_at', lookup_expr='lte')
 
+    pinnedFirst = filters.BooleanFilter(label='收藏的项目排在前面', method='filter_pinned_first')
+
+    # noinspection PyUnusedLocal
+    def filter_pinned_first(self, queryset, name, value):
+        if not value:
+            return queryset
+        # pinned_rank 由 ProjectViewSet.get_queryset 标注; 游标分页时 get_cursor_ordering 同样先按它排序
+        return queryset.order_by('pinned_rank', 'id')
+
     class Meta:
         model = Project
         fields = (
@@ -107,18 +213,73 @@ class ProjectFilter(filters.FilterSet):
         )
 
 
-class ProjectViewSet(ModelViewSet):
+def upsert_project_pin(project: Project, user: User, new_val: bool):
+    """
+    依赖 (user, project) 唯一约束实现的 upsert: 绝大多数情况下只有一条 UPDATE,
+    首次收藏时才会 INSERT, 并发插入冲突时退回 UPDATE。
+    """
+    with transaction.atomic():
+        updated = ProjectUserSetting.objects.filter(project=project, user=user).update(is_pinned=new_val, update_at=timezone.now())
+        if updated:
+            # queryset.update 不触发 post_save, 变更记录与 UPDATE 在同一事务中写入
+            changelog.record_pin(project.id, user.id, new_val)
+            return
+        try:
+            with transaction.atomic():
+                ProjectUserSetting.objects.create(project=project, user=user, is_pinned=new_val)
+        except IntegrityError:
+            ProjectUserSetting.objects.filter(project=project, user=user).update(is_pinned=new_val, update_at=timezone.now())
+            changelog.record_pin(project.id, user.id, new_val)
+
+
+class ProjectViewSet(ConditionalGetMixin, ResponseCacheMixin, CompiledReadMixin, DynamicFieldsViewMixin, ModelViewSet):
     authentication_classes = (
         MySessionAuthentication,
-        authentication.TokenAuthentication,
+        CachedTokenAuthentication,
     )
     permission_classes = (
         permissions.IsAuthenticatedOrReadOnly,
     )
+    pagination_class = CursorOrPageNumberPagination
+    cursor_ordering = ('id',)
     filterset_class = ProjectFilter
+    response_cache_project_param = None
+    response_cache_pin_path = ('pin',)
+    # 按当前用户的收藏排序, 顺序因人而异
+    response_cache_bypass_params = ('pinnedFirst',)
 
-    queryset = Project.objects.all()
+    queryset = Project.objects.select_related('person', 'person__avatar').all()
     serializer_class = ProjectSerializer
+    expand_select_related = {
+        'person': ('person',),
+        'person.avatar': ('person__avatar',),
+    }
+
+    def get_conditional_extra(self):
+        return pin_validator(self.request.user) if self.field_requested('pin', nested=False) else ()
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.field_requested('pin', nested=False):
+            queryset = annotate_pin(queryset, self.request.user)
+        if self.pinned_first():
+            queryset = annotate_pinned_rank(queryset, self.get_pinned_project_ids())
+        return queryset
+
+    def pinned_first(self):
+        # 与 ProjectFilter.pinnedFirst 的解析方式一致
+        return bool(BooleanWidget().value_from_datadict(self.request.query_params, None, 'pinnedFirst'))
+
+    def get_pinned_project_ids(self):
+        # 条件请求的校验与列表各过滤一次 queryset, 收藏的项目只查一次
+        if not hasattr(self, '_pinned_project_ids'):
+            self._pinned_project_ids = pinned_project_ids(self.request.user)
+        return self._pinned_project_ids
+
+    def get_cursor_ordering(self):
+        if self.pinned_first():
+            return ('pinned_rank',) + self.cursor_ordering
+        return self.cursor_ordering
 
     def get_serializer_class(self):
         if self.action == 'toggle_pin':
@@ -133,25 +294,67 @@ class ProjectViewSet(ModelViewSet):
         req_serializer: ProjectTogglePinSerializer = self.get_serializer(data=request.data)
         if req_serializer.is_valid(raise_exception=True):
             new_val = req_serializer.validated_data['new_val']
-            project_user = ProjectUserSetting.objects.filter(project=project, user=user).first()
-            if project_user is None:
-                project_user = ProjectUserSetting(
-                    project=project,
-                    user=user,
-                    is_pinned=new_val
-                )
-            else:
-                project_user.is_pinned = new_val
-            project_user.save()
+            upsert_project_pin(project, user, new_val)
+            project.pin = new_val
 
             serializer = ProjectSerializer(instance=project, context=self.get_serializer_context())
 
             return Response(serializer.data)
 
+    @action(methods=['GET', ], detail=True)
+    def board(self, request: Request, **kwargs):
+        """
+        看板快照: 项目、按 rank 排序的看板 (各自带按 rank 排序的任务)、任务组以及涉及到的用户。
+        查询次数固定, 与看板大小无关; ETag 由各表的 (行数, 最大 update_at) 计算, 未变化时返回 304。
+        各表互不依赖的查询经 jira.fanout 并发执行。
+        """
+        project: Project = self.get_object()
+
+        kanbans_qs = Kanban.objects.filter(project=project)
+        tasks_qs = Task.objects.filter(project=project)
+        epics_qs = Epic.objects.filter(project=project)
+
+        validators = fanout.run(*[partial(queryset_validator, qs) for qs in (kanbans_qs, tasks_qs, epics_qs)])
+        last_modified = max([project.update_at] + [v[1] for v in validators if v[1] is not None])
+        etag = make_etag('board', project.id, project.update_at, project.pin, validators, change_stamp()[0])
+
+        response = not_modified_response(request, etag, last_modified)
+        if response is not None:
+            return response
+
+        context = self.get_serializer_context()
+        context['epic_no_project'] = True
+
+        tasks, kanbans, epics = fanout.run(
+            lambda: BoardTaskSerializer(tasks_qs.order_by('rank', 'id'), many=True, context=context).data,
+            lambda: KanbanSerializer(kanbans_qs, many=True, context=context).data,
+            lambda: EpicSerializer(epics_qs, many=True, context=context).data,
+        )
+
+        tasks_by_kanban = {kanban['id']: [] for kanban in kanbans}
+        unassigned_tasks = []
+        user_ids = {project.person_id}
+        for task in tasks:
+            tasks_by_kanban.get(task['kanban_id'], unassigned_tasks).append(task)
+            user_ids.update((task['reporter_id'], task['processor_id']))
+        user_ids.discard(None)
+        for kanban in kanbans:
+            kanban['tasks'] = tasks_by_kanban[kanban['id']]
+
+        users = User.objects.filter(pk__in=user_ids).select_related('avatar').order_by('id')
+
+        response = Response({
+            'project': ProjectSerializer(project, context=context).data,
+            'kanbans': kanbans,
+            'unassigned_tasks': unassigned_tasks,
+            'epics': epics,
+            'users': UserSerializer(users, many=True, context=context).data,
+        })
+        return set_validators(response, etag, last_modified)
+
 
 # noinspection DuplicatedCode
-class EpicFilter(filters.FilterSet):
-    name = filters.CharFilter(field_name='name', lookup_expr='icontains')
+class EpicFilter(SearchFilterSet, filters.FilterSet):
     projectId = filters.NumberFilter(label='项目ID', field_name='project_id', lookup_expr='exact')
 
     class Meta:
@@ -159,23 +362,40 @@ class EpicFilter(filters.FilterSet):
         fields = ()
 
 
-class EpicViewSet(ModelViewSet):
+class EpicViewSet(ConditionalGetMixin, ResponseCacheMixin, CompiledReadMixin, DynamicFieldsViewMixin, ModelViewSet):
     authentication_classes = (
         MySessionAuthentication,
-        authentication.TokenAuthentication,
+        CachedTokenAuthentication,
     )
     permission_classes = (
         permissions.IsAuthenticatedOrReadOnly,
     )
+    pagination_class = CursorOrPageNumberPagination
+    cursor_ordering = ('id',)
 
-    queryset = Epic.objects.all()
+    queryset = Epic.objects.select_related('project', 'project__person', 'project__person__avatar').all()
     serializer_class = EpicSerializer
     filterset_class = EpicFilter
+    conditional_related = ('project',)
+    response_cache_pin_path = ('project', 'pin')
+    expand_select_related = {
+        'project': ('project',),
+        'project.person': ('project__person',),
+        'project.person.avatar': ('project__person__avatar',),
+    }
+
+    def get_conditional_extra(self):
+        return pin_validator(self.request.user) if self.field_requested('project.pin', nested=False) else ()
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.field_requested('project.pin', nested=False):
+            queryset = annotate_pin(queryset, self.request.user, field_name='project_pin', project_field='project')
+        return queryset
 
 
 # noinspection DuplicatedCode
-class KanbanFilter(filters.FilterSet):
-    name = filters.CharFilter(field_name='name', lookup_expr='icontains')
+class KanbanFilter(SearchFilterSet, filters.FilterSet):
     projectId = filters.NumberFilter(label='项目ID', field_name='project_id', lookup_expr='exact')
 
     class Meta:
@@ -183,14 +403,16 @@ class KanbanFilter(filters.FilterSet):
         fields = ()
 
 
-class KanbanViewSet(ModelViewSet):
+class KanbanViewSet(ConditionalGetMixin, ResponseCacheMixin, CompiledReadMixin, DynamicFieldsViewMixin, ModelViewSet):
     authentication_classes = (
         MySessionAuthentication,
-        authentication.TokenAuthentication,
+        CachedTokenAuthentication,
     )
     permission_classes = (
         permissions.IsAuthenticatedOrReadOnly,
     )
+    pagination_class = CursorOrPageNumberPagination
+    cursor_ordering = ('rank', 'id')
 
     queryset = Kanban.objects.all()
     serializer_class = KanbanSerializer
@@ -203,14 +425,22 @@ class KanbanViewSet(ModelViewSet):
 
     @action(methods=['POST', ], detail=False)
     def reorder(self, request: Request):
+        if isinstance(request.data, list):
+            serializer: SortParamsListSerializer = self.get_serializer(data=request.data, many=True)
+            serializer.is_valid(raise_exception=True)
+            kanbans = serializer.sort_kanbans(serializer.validated_data)
+            return Response({
+                'msg': 'sort kanbans finish!',
+                'ranks': [{'id': kanban.id, 'project_id': kanban.project_id, 'rank': kanban.rank} for kanban in kanbans],
+            })
+
         serializer: SortParamsSerializer = self.get_serializer(data=request.data)
         if serializer.is_valid(raise_exception=True):
             serializer.sort_kanban(serializer.validated_data)
             return Response({'msg': 'sort kanbans finish!', 'sortParams': serializer.validated_data})
 
 
-class TaskFilter(filters.FilterSet):
-    name = filters.CharFilter(field_name='name', lookup_expr='icontains')
+class TaskFilter(SearchFilterSet, filters.FilterSet):
     typeId = filters.NumberFilter(field_name='type_id', lookup_expr='exact')
     projectId = filters.NumberFilter(label='项目ID', field_name='project_id', lookup_expr='exact')
     processorId = filters.NumberFilter(label='经办人ID', field_name='processor_id', lookup_expr='exact')
@@ -222,18 +452,45 @@ class TaskFilter(filters.FilterSet):
         fields = ()
 
 
-class TaskViewSet(ModelViewSet):
+class TaskViewSet(ConditionalGetMixin, ResponseCacheMixin, CompiledReadMixin, DynamicFieldsViewMixin, ModelViewSet):
     authentication_classes = (
         MySessionAuthentication,
-        authentication.TokenAuthentication,
+        CachedTokenAuthentication,
     )
     permission_classes = (
         permissions.IsAuthenticatedOrReadOnly,
     )
-
-    queryset = Task.objects.select_related('project', 'project__person', 'epic', 'epic__project', 'kanban').all()
+    pagination_class = CursorOrPageNumberPagination
+    # 游标分页只用任务表自己的列, 由 (kanban, rank) 索引提供顺序并按位置直接定位;
+    # 与页码分页的看板顺序 (kanban__rank) 不同, 同一看板内的任务仍按 rank 排列
+    cursor_ordering = ('kanban_id', 'rank', 'id')
+
+    # epic.project 与 project.person 由 get_serializer_context 中的开关去掉, 不需要 join
+    queryset = Task.objects.select_related(
+        'reporter', 'reporter__avatar', 'processor', 'processor__avatar', 'project', 'epic', 'kanban',
+    ).all()
+    conditional_related = ('project', 'epic', 'kanban')
+    response_cache_pin_path = ('project', 'pin')
     serializer_class = TaskSerializer
     filterset_class = TaskFilter
+    expand_select_related = {
+        'reporter': ('reporter',),
+        'reporter.avatar': ('reporter__avatar',),
+        'processor': ('processor',),
+        'processor.avatar': ('processor__avatar',),
+        'project': ('project',),
+        'epic': ('epic',),
+        'kanban': ('kanban',),
+    }
+
+    def get_conditional_extra(self):
+        return pin_validator(self.request.user) if self.field_requested('project.pin', nested=False) else ()
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.field_requested('project.pin', nested=False):
+            queryset = annotate_pin(queryset, self.request.user, field_name='project_pin', project_field='project')
+        return queryset
 
     def get_serializer_context(self):
         ctx = super().get_serializer_context()
@@ -244,11 +501,80 @@ class TaskViewSet(ModelViewSet):
     def get_serializer_class(self):
         if self.action == 'reorder':
             return SortParamsSerializer
+        if self.action == 'bulk':
+            return TaskBulkSerializer
         return super().get_serializer_class()
 
+    @action(methods=['POST', ], detail=False)
+    def bulk(self, request: Request):
+        serializer: TaskBulkSerializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        return Response(serializer.write(serializer.validated_data, request.user))
+
     @action(methods=['POST', ], detail=False)
     def reorder(self, request: Request):
+        if isinstance(request.data, list):
+            serializer: SortParamsListSerializer = self.get_serializer(data=request.data, many=True)
+            serializer.is_valid(raise_exception=True)
+            tasks = serializer.sort_tasks(serializer.validated_data)
+            return Response({
+                'msg': 'sort tasks finish!',
+                'ranks': [{'id': task.id, 'kanban_id': task.kanban_id, 'rank': task.rank} for task in tasks],
+            })
+
         serializer: SortParamsSerializer = self.get_serializer(data=request.data)
         if serializer.is_valid(raise_exception=True):
             serializer.sort_task(serializer.validated_data)
             return Response({'msg': 'sort tasks finish!', 'sortParams': serializer.validated_data})
+
+
+class SearchViewSet(GenericViewSet):
+    """
+    GET /search?q=&type=task,project&projectId=&limit=
+    在项目、任务组、看板、任务的名称 (任务还有说明, 项目还有部门) 中搜索, 按相关度排序
+    """
+    authentication_classes = (
+        MySessionAuthentication,
+        CachedTokenAuthentication,
+    )
+    permission_classes = (
+        permissions.IsAuthenticated,
+    )
+    serializer_class = SearchParamsSerializer
+
+    def list(self, request: Request):
+        serializer = self.get_serializer(data=underscoreize(request.query_params.dict()))
+        serializer.is_valid(raise_exception=True)
+        params = serializer.validated_data
+        return Response({
+            'results': search.search(
+                params['q'], doc_types=params.get('type'), project_id=params.get('project_id'), limit=params['limit'],
+            ),
+        })
+
+
+class ChangeFeedViewSet(GenericViewSet):
+    """
+    GET /changes?since=&projectId=&limit=
+    since 之后的变更记录 (jira.changelog), 按 id 顺序; 返回的 cursor 作为下一次的 since, hasMore 时继续拉取。
+    首次同步不传 since, 先取得当前 cursor 再拉取列表。
+    """
+    authentication_classes = (
+        MySessionAuthentication,
+        CachedTokenAuthentication,
+    )
+    permission_classes = (
+        permissions.IsAuthenticated,
+    )
+    serializer_class = ChangeFeedParamsSerializer
+
+    def list(self, request: Request):
+        serializer = self.get_serializer(data=underscoreize(request.query_params.dict()))
+        serializer.is_valid(raise_exception=True)
+        params = serializer.validated_data
+        if 'since' not in params:
+            return Response({'results': [], 'cursor': changelog.head(), 'has_more': False})
+        results, cursor, has_more = changelog.feed(
+            params['since'], request.user.id, project_id=params.get('project_id'), limit=params['limit'],
+        )
+        return Response({'results': results, 'cursor': cursor, 'has_more': has_more})
@@ -13,4 +13,10 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'jira_backend.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+# 需要在 django.setup() 之后导入
+from jira.sse import EventStreamRouter  # noqa: E402
+
+# /api/v1/projects/{id}/events 由 jira.sse 以 SSE 推送, 其余请求交给 Django
+application = EventStreamRouter(django_application)
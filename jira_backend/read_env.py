@@ -8,6 +8,25 @@ def read_env():
         SECRET_KEY=(str, 'secret'),
         DATABASE_URL=(str, ''),
         ADMIN_URL_SUFFIX=(str, 'unsafe'),
+        FAST_READ_PATH=(bool, True),
+        TOKEN_CACHE_SIZE=(int, 10000),
+        TOKEN_CACHE_TTL=(int, 60),
+        CACHE_URL=(str, ''),
+        SESSION_MODE=(str, 'db'),
+        RESPONSE_CACHE=(bool, False),
+        RESPONSE_CACHE_TIMEOUT=(int, 3600),
+        SERVER_MODE=(str, 'wsgi'),
+        STARTUP_MODE=(str, 'fast'),
+        EVENTS_BROKER=(str, 'jira.events.LocalBroker'),
+        EVENTS_HEARTBEAT=(int, 15),
+        EVENTS_QUEUE_SIZE=(int, 100),
+        QUERY_FANOUT_WORKERS=(int, 4),
+        IMAGE_WORKERS=(int, 2),
+        BLOB_SENDFILE=(str, ''),
+        BLOB_ACCEL_PREFIX=(str, '/protected-media/'),
+        DB_POOL_SIZE=(int, 0),
+        DB_POOL_TIMEOUT=(float, 10),
+        DB_POOL_RECYCLE=(int, 3600),
     )
 
     env.read_env()
@@ -1,5 +1,8 @@
 import sys
 from pathlib import Path
+
+from django.core.exceptions import ImproperlyConfigured
+
 from .read_env import read_env
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -12,6 +15,25 @@ SECRET_KEY = env('SECRET_KEY')
 DEBUG = env('DEBUG')
 LOG_DB_SQL = env('LOG_DB_SQL')
 ADMIN_URL_SUFFIX = env('ADMIN_URL_SUFFIX')
+# list/retrieve 接口使用 jira.compiled 的快速只读序列化
+FAST_READ_PATH = env('FAST_READ_PATH')
+# 每个进程内 token 认证缓存的条数与过期秒数, 条数为 0 时关闭
+TOKEN_CACHE_SIZE = env('TOKEN_CACHE_SIZE')
+TOKEN_CACHE_TTL = env('TOKEN_CACHE_TTL')
+# 项目/任务组/看板/任务列表的服务端响应缓存 (jira.response_cache), 默认关闭, 多个 worker 时需要配置 CACHE_URL;
+# 过期秒数只用于回收不再使用的旧版本数据
+RESPONSE_CACHE = env('RESPONSE_CACHE')
+RESPONSE_CACHE_TIMEOUT = env('RESPONSE_CACHE_TIMEOUT')
+# 看板变更事件 (jira.events / jira.sse, 需要以 ASGI 方式运行):
+# broker 默认为进程内的 jira.events.LocalBroker, 多个 worker 时使用 jira.events.CacheBroker;
+# 心跳间隔 (秒) 与每个连接最多积压的事件数
+EVENTS_BROKER = env('EVENTS_BROKER')
+EVENTS_HEARTBEAT = env('EVENTS_HEARTBEAT')
+EVENTS_QUEUE_SIZE = env('EVENTS_QUEUE_SIZE')
+# 项目看板等组合接口并发查询的线程数 (jira.fanout), 即每个进程额外占用的数据库连接上限, 0 为依次查询
+QUERY_FANOUT_WORKERS = env('QUERY_FANOUT_WORKERS')
+# 每个进程处理上传图片 (jira.images) 的线程数, 0 为在上传请求中处理
+IMAGE_WORKERS = env('IMAGE_WORKERS')
 
 ALLOWED_HOSTS = ['*', ]
 
@@ -32,6 +54,7 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'jira.middleware.QueryBudgetMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     # 'django.middleware.csrf.CsrfViewMiddleware',
@@ -64,7 +87,21 @@ DATABASES = {
     'default': env.db("DATABASE_URL")
 }
 
-if not DEBUG:
+# 每个进程的数据库连接池 (jira.db.pool): 连接数上限与 gunicorn 的线程数无关。
+# 需要显式设置 DB_POOL_SIZE 开启; 默认为 0, 使用 Django 默认的每线程连接
+POOLED_ENGINES = {
+    'django.db.backends.mysql': 'jira.db.backends.mysql',
+    'django.db.backends.sqlite3': 'jira.db.backends.sqlite3',
+}
+
+if env('DB_POOL_SIZE') > 0 and DATABASES['default'].get('ENGINE') in POOLED_ENGINES:
+    DATABASES['default']['ENGINE'] = POOLED_ENGINES[DATABASES['default']['ENGINE']]
+    DATABASES['default']['POOL'] = {
+        'MAX_SIZE': env('DB_POOL_SIZE'),
+        'TIMEOUT': env('DB_POOL_TIMEOUT'),
+        'RECYCLE': env('DB_POOL_RECYCLE'),
+    }
+elif not DEBUG:
     DATABASES['default']['CONN_MAX_AGE'] = 60
 
 # Password validation
@@ -95,6 +132,30 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 SESSION_COOKIE_NAME = "gy_jira_sessionid"
 
+# 共享缓存 (如 redis://..., memcache://...); 未配置时为 Django 默认的进程内缓存, 各 worker 互不可见
+if env('CACHE_URL'):
+    CACHES = {'default': env.cache('CACHE_URL')}
+
+# 会话存储方式 (默认 db):
+# db: 每个请求读 django_session; signed_cookies: 数据签名后保存在 cookie 中, 不访问服务端存储;
+# cache: 只存缓存, 缓存清空后需要重新登录; cached_db: 读缓存, 写缓存与数据库;
+# write_behind: 读缓存, 修改先写缓存, 由后台线程合并写入数据库 (jira.sessions)
+# 读缓存的几种方式要求配置 CACHE_URL: 进程内缓存中的会话在其他 worker 上读不到或是旧数据
+SESSION_ENGINES = {
+    'db': 'django.contrib.sessions.backends.db',
+    'signed_cookies': 'django.contrib.sessions.backends.signed_cookies',
+    'cache': 'django.contrib.sessions.backends.cache',
+    'cached_db': 'django.contrib.sessions.backends.cached_db',
+    'write_behind': 'jira.sessions',
+}
+CACHED_SESSION_MODES = ('cache', 'cached_db', 'write_behind')
+SESSION_MODE = env('SESSION_MODE')
+if SESSION_MODE not in SESSION_ENGINES:
+    raise ImproperlyConfigured(f'SESSION_MODE must be one of {", ".join(SESSION_ENGINES)}, got {SESSION_MODE!r}')
+if SESSION_MODE in CACHED_SESSION_MODES and not env('CACHE_URL'):
+    raise ImproperlyConfigured(f'SESSION_MODE={SESSION_MODE} requires a shared cache, set CACHE_URL')
+SESSION_ENGINE = SESSION_ENGINES[SESSION_MODE]
+
 AUTH_USER_MODEL = "jira.User"
 
 STATIC_URL = '/api/static/'
@@ -102,6 +163,15 @@ STATIC_ROOT = BASE_DIR / "api" / "static"
 
 MEDIA_URL = '/api/media/'
 MEDIA_ROOT = BASE_DIR / "api" / "media"
+# 上传文件时同时计算 sha256 (jira.blobs)
+FILE_UPLOAD_HANDLERS = [
+    'jira.blobs.HashingMemoryFileUploadHandler',
+    'jira.blobs.HashingTemporaryFileUploadHandler',
+]
+# MEDIA_URL/blobs/ 下的文件交给前端服务器发送: '' 由 Django 发送, 'x-accel-redirect' (nginx, 需要 internal 的
+# location BLOB_ACCEL_PREFIX alias 到 MEDIA_ROOT) 或 'x-sendfile' (Apache mod_xsendfile 等)
+BLOB_SENDFILE = env('BLOB_SENDFILE')
+BLOB_ACCEL_PREFIX = env('BLOB_ACCEL_PREFIX')
 
 REST_FRAMEWORK = {
     'DEFAULT_THROTTLE_RATES': {
@@ -116,13 +186,13 @@ REST_FRAMEWORK = {
         'django_filters.rest_framework.DjangoFilterBackend',
     ),
     'DEFAULT_RENDERER_CLASSES': (
-        'djangorestframework_camel_case.render.CamelCaseJSONRenderer',
-        'djangorestframework_camel_case.render.CamelCaseBrowsableAPIRenderer',
+        'jira.renderers.CamelCaseJSONRenderer',
+        'jira.renderers.CamelCaseBrowsableAPIRenderer',
     ),
     'DEFAULT_PARSER_CLASSES': (
-        'djangorestframework_camel_case.parser.CamelCaseFormParser',
-        'djangorestframework_camel_case.parser.CamelCaseMultiPartParser',
-        'djangorestframework_camel_case.parser.CamelCaseJSONParser',
+        'jira.renderers.CamelCaseFormParser',
+        'jira.renderers.CamelCaseMultiPartParser',
+        'jira.renderers.CamelCaseJSONParser',
     ),
     'JSON_UNDERSCOREIZE': {
         'no_underscore_before_number': True,
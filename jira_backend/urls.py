@@ -14,14 +14,18 @@ Including another URLconf
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
 from django.contrib import admin
-from django.urls import path, include
+from django.urls import path, re_path, include
 from django.conf import settings
 
+from jira.blobs import serve_blob
+
 admin.site.site_header = 'GY-JIRA 后台管理'
 
 urlpatterns = [
     path(f'admin-{settings.ADMIN_URL_SUFFIX}/', admin.site.urls),
     path('api/v1/', include('jira.urls')),
+    # 按内容寻址的图片, 带长期缓存头; 需要排在 DEBUG 时的 MEDIA_URL 静态路由之前
+    re_path(r'^{}(?P<path>blobs/.+)$'.format(settings.MEDIA_URL.lstrip('/')), serve_blob),
 ]
 
 if settings.DEBUG: